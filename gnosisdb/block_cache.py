@@ -0,0 +1,128 @@
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from relationaldb.models import Market, Event, UltimateOracle
+import re
+import six
+
+ADDRESS_REGEX = re.compile(r'^[0-9a-fA-F]{40}$')
+
+LAST_BLOCK_KEY = 'last_block'
+ADDRESS_BLOCK_KEY = 'address_block:{}'
+
+
+def get_block_cache():
+    return caches[settings.BLOCK_CACHE]
+
+
+def get_touched_addresses(decoded_event):
+    """
+    Returns the contract addresses whose data may change with a decoded event: the emitting contract
+    and every address parameter (created contracts, owners...)
+    """
+    addresses = set()
+    if decoded_event.get('address'):
+        addresses.add(decoded_event['address'].lower())
+    for param in decoded_event.get('params', []):
+        value = param.get('value')
+        if isinstance(value, six.string_types) and ADDRESS_REGEX.match(value):
+            addresses.add(value.lower())
+    return addresses
+
+
+def get_nesting_addresses(addresses):
+    """
+    Returns the addresses whose API representation directly nests one of the given contracts: the markets
+    of changed events or outcome tokens, the events of changed oracles and the ultimate oracles forwarding
+    to them
+    """
+    addresses = list(addresses)
+    dependents = set(Market.objects.filter(event__in=addresses).values_list('address', flat=True))
+    dependents.update(Market.objects.filter(event__outcometoken__address__in=addresses).values_list('address', flat=True))
+    dependents.update(Event.objects.filter(oracle__in=addresses).values_list('address', flat=True))
+    dependents.update(UltimateOracle.objects.filter(forwarded_oracle__in=addresses).values_list('address', flat=True))
+    return dependents
+
+
+def get_dependent_addresses(addresses):
+    """
+    Returns the addresses whose API representation nests one of the given contracts at any depth, e.g. the
+    markets of the events whose ultimate oracle forwards to a changed centralized oracle
+    """
+    addresses = set(addresses)
+    dependents = set()
+    nested = addresses
+    while nested:
+        nested = get_nesting_addresses(nested) - dependents - addresses
+        dependents.update(nested)
+    return dependents
+
+
+def next_generation():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval('block_cache_generation')")
+        return cursor.fetchone()[0]
+
+
+def publish_changes(addresses, block_info=None):
+    """
+    Records that the given contracts changed in a block. Every call starts a new generation, so the
+    data served before the call is never considered fresh again
+    :param addresses: iterable of changed contract addresses
+    :param block_info: block information dictionary, None for changes made outside of a block (IPFS)
+    :return: the new generation
+    """
+    cache = get_block_cache()
+    addresses = set(address.lower() for address in addresses)
+    addresses.update(get_dependent_addresses(addresses))
+
+    # Taken from a database sequence, atomic for every process whatever the cache backend. Generations never
+    # repeat when the block cache is emptied while the response caches of the web processes still hold
+    # entries keyed by older generations
+    generation = next_generation()
+
+    if block_info is None:
+        last_block = get_last_block()
+        number, timestamp = (last_block[0], last_block[1]) if last_block else (None, None)
+    else:
+        number, timestamp = block_info.get('number'), block_info.get('timestamp')
+
+    block = (number, timestamp, generation)
+    cache.set_many(dict((ADDRESS_BLOCK_KEY.format(address), block) for address in addresses), timeout=None)
+    cache.set(LAST_BLOCK_KEY, block, timeout=None)
+    return generation
+
+
+def get_last_block():
+    """
+    Returns the last block which changed the data
+    :return: tuple (number, timestamp, generation) or None if nothing was published
+    """
+    return get_block_cache().get(LAST_BLOCK_KEY)
+
+
+def get_address_block(address):
+    """
+    Returns the last block which changed the contract
+    :return: tuple (number, timestamp, generation) or None if the contract change is not known
+    """
+    return get_block_cache().get(ADDRESS_BLOCK_KEY.format(address.lower()))
+
+
+def get_blocks(addresses):
+    """
+    Returns the last block which changed the data and the last block which changed each contract,
+    read with a single cache round trip
+    :return: tuple (last block or None, dictionary address -> block or None)
+    """
+    keys = dict((address, ADDRESS_BLOCK_KEY.format(address.lower())) for address in addresses)
+    blocks = get_block_cache().get_many([LAST_BLOCK_KEY] + list(keys.values()))
+    return blocks.get(LAST_BLOCK_KEY), dict((address, blocks.get(key)) for address, key in keys.items())
+
+
+def get_block_datetime(block):
+    """Returns the datetime of a (number, timestamp, generation) block tuple, None if unknown"""
+    if block is None or block[1] is None:
+        return None
+    return datetime.utcfromtimestamp(float(block[1]))
@@ -1,21 +1,133 @@
 from relationaldb.models import Contract, Market, Event, OutcomeToken, CentralizedOracle, UltimateOracle
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django_eth_events.chainevents import AbstractAddressesGetter
+import threading
+
+
+class AddressCache(object):
+    """
+    In-memory set of the addresses of a model. Loaded once, then extended incrementally with the rows
+    created since the last refresh, using the creation block as high-water mark.
+    Addresses saved inside a transaction stay pending until it commits, so a rollback can't leave them cached.
+    """
+
+    def __init__(self, model, creation_block_field):
+        self.model = model
+        self.creation_block_field = creation_block_field
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.addresses = []
+            self.address_set = set()
+            self.pending = set()
+            self.high_water_mark = None
+            self.loaded = False
+
+    def add(self, address):
+        with self.lock:
+            if address not in self.address_set:
+                self.address_set.add(address)
+                self.addresses.append(address)
+
+    def add_on_commit(self, address):
+        """Adds the address once the current transaction commits, right away in autocommit mode"""
+        with self.lock:
+            self.pending.add(address)
+        transaction.on_commit(lambda: self.commit_pending(address))
+
+    def commit_pending(self, address):
+        with self.lock:
+            if address in self.pending:
+                self.pending.discard(address)
+                self.add(address)
+
+    def is_pending(self, address):
+        """
+        Pending addresses are confirmed against the database, which only shows the rows of rolled back
+        savepoints or transactions as missing
+        """
+        with self.lock:
+            if address not in self.pending:
+                return False
+        if self.model.objects.filter(address=address).exists():
+            return True
+        with self.lock:
+            self.pending.discard(address)
+        return False
+
+    def refresh(self):
+        """Loads the addresses created in or after the high-water mark block, everything on first call"""
+        with self.lock:
+            queryset = self.model.objects.all()
+            if self.high_water_mark is not None:
+                # rows of the high-water mark block could have been added after the previous refresh
+                queryset = queryset.filter(**{self.creation_block_field + '__gte': self.high_water_mark})
+
+            for address, creation_block in queryset.order_by(self.creation_block_field).values_list(
+                    'address', self.creation_block_field):
+                self.add(address)
+                if self.high_water_mark is None or creation_block > self.high_water_mark:
+                    self.high_water_mark = creation_block
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.refresh()
+
+    def __contains__(self, address):
+        self.ensure_loaded()
+        if address in self.address_set:
+            return True
+        return self.is_pending(address)
 
 
 class ContractAddressGetter(AbstractAddressesGetter):
     """
-    Returns the addresses used by event listener in order to filter logs triggered by Contract Instances
+    Returns the addresses used by event listener in order to filter logs triggered by Contract Instances.
+    Addresses are kept in memory per model, new contracts are added when saved, on every get_addresses call
+    and when an ingestion run starts
     """
     class Meta:
         model = Contract
+        creation_block_field = 'creation_block'
+
+    _caches = {}
+
+    @classmethod
+    def get_cache(cls):
+        model = cls.Meta.model
+        if model not in ContractAddressGetter._caches:
+            ContractAddressGetter._caches[model] = AddressCache(model, cls.Meta.creation_block_field)
+        return ContractAddressGetter._caches[model]
+
+    @classmethod
+    def reset_cache(cls):
+        """Empties the address caches of every getter, they get reloaded on next use"""
+        for cache in ContractAddressGetter._caches.values():
+            cache.clear()
+
+    @classmethod
+    def refresh_caches(cls):
+        """
+        Loads the addresses created by other processes into the caches already loaded. Each process only adds
+        the contracts it saves itself, so an ingestion run calls it once it holds the ingestion lock
+        """
+        for cache in ContractAddressGetter._caches.values():
+            if cache.loaded:
+                cache.refresh()
 
     def get_addresses(self):
         """
         Returns list of ethereum addresses
         :return: [address]
         """
-        return list(self.Meta.model.objects.values_list('address', flat=True))
+        cache = self.get_cache()
+        cache.refresh()
+        return list(cache.addresses)
 
     def __contains__(self, address):
         """
@@ -23,33 +135,50 @@ class ContractAddressGetter(AbstractAddressesGetter):
         :param address: ethereum address string
         :return: Boolean
         """
-        try:
-            self.Meta.model.objects.get(address=address)
-            return True
-        except ObjectDoesNotExist:
-            return False
+        return address in self.get_cache()
+
+
+@receiver(post_save, dispatch_uid='address_getters_contract_created')
+def contract_created(sender, instance, created, **kwargs):
+    if created:
+        for model, cache in ContractAddressGetter._caches.items():
+            if cache.loaded and issubclass(sender, model):
+                cache.add_on_commit(instance.address)
+
+
+@receiver(post_delete, dispatch_uid='address_getters_contract_deleted')
+def contract_deleted(sender, instance, **kwargs):
+    for model, cache in ContractAddressGetter._caches.items():
+        if issubclass(sender, model):
+            cache.clear()
 
 
 class MarketAddressGetter(ContractAddressGetter):
     class Meta:
         model = Market
+        creation_block_field = 'creation_block'
 
 
 class EventAddressGetter(ContractAddressGetter):
     class Meta:
         model = Event
+        creation_block_field = 'creation_block'
 
 
 class OutcomeTokenGetter(ContractAddressGetter):
     class Meta:
         model = OutcomeToken
+        # outcome tokens are created by their event's constructor
+        creation_block_field = 'event__creation_block'
 
 
 class CentralizedOracleGetter(ContractAddressGetter):
     class Meta:
         model = CentralizedOracle
+        creation_block_field = 'creation_block'
 
 
 class UltimateOracleGetter(ContractAddressGetter):
     class Meta:
         model = UltimateOracle
+        creation_block_field = 'creation_block'
@@ -1,4 +1,9 @@
+from collections import defaultdict, OrderedDict
+from django.db import transaction
 from django_eth_events.chainevents import AbstractEventReceiver
+from rest_framework.serializers import ValidationError
+from relationaldb.models import Market, MarketStats, OutcomeToken, OutcomeTokenBalance
+from relationaldb.identity_map import block_scope, prefetch_contracts, prefetch_outcome_tokens
 from relationaldb.serializers import (
     CentralizedOracleSerializer, ScalarEventSerializer, CategoricalEventSerializer,
     UltimateOracleSerializer, MarketSerializer, OutcomeTokenInstanceSerializer,
@@ -7,70 +12,205 @@ from relationaldb.serializers import (
     OutcomeAssignmentOracleSerializer, ForwardedOracleOutcomeAssignmentSerializer,
     OutcomeChallengeSerializer, OutcomeVoteSerializer, WithdrawalSerializer, OutcomeTokenTransferSerializer,
     OutcomeTokenPurchaseSerializer, OutcomeTokenSaleSerializer, OutcomeTokenShortSaleOrderSerializer,
-    MarketFundingSerializer, MarketClosingSerializer, FeeWithdrawalSerializer
+    MarketFundingSerializer, MarketClosingSerializer, FeeWithdrawalSerializer, prefetch_event_descriptions
 )
 
+from gnosisdb.block_cache import get_touched_addresses, publish_changes
+from chainevents.address_getters import MarketAddressGetter
 from celery.utils.log import get_task_logger
 from json import dumps
 
 logger = get_task_logger(__name__)
 
 
-class CentralizedOracleFactoryReceiver(AbstractEventReceiver):
+def publish_block_changes(addresses, block_info):
+    try:
+        publish_changes(addresses, block_info)
+    except Exception as e:
+        # The block cache only drives HTTP caching, ingestion goes on without it
+        logger.warning('Block changes not published: {}'.format(e))
+
+
+class BaseEventReceiver(AbstractEventReceiver):
+    """
+    Maps decoded events to their serializers, either by event name (events) or with a single
+    serializer_class for the factory receivers, and provides the block-batched ingestion path.
+    """
+    events = {}
+    serializer_class = None
+    description = 'Event'
+
+    def get_serializer_class(self, decoded_event):
+        if self.serializer_class:
+            return self.serializer_class
+        return self.events.get(decoded_event.get('name'))
+
+    def get_serializer(self, decoded_event, block_info=None):
+        serializer_class = self.get_serializer_class(decoded_event)
+        if serializer_class is None:
+            return None
+        elif block_info:
+            return serializer_class(data=decoded_event, block=block_info)
+        else:
+            return serializer_class(data=decoded_event)
+
+    def save(self, decoded_event, block_info=None):
+        serializer = self.get_serializer(decoded_event, block_info)
+        if serializer is None:
+            return
 
-    def save(self, decoded_event, block_info):
-        serializer = CentralizedOracleSerializer(data=decoded_event, block=block_info)
         if serializer.is_valid():
-            serializer.save()
-            logger.info('Centralized Oracle Factory Result Added: {}'.format(dumps(decoded_event)))
+            try:
+                # in its own savepoint, a failing event doesn't abort the transaction of its block
+                with transaction.atomic():
+                    serializer.save()
+                logger.info('{} Added: {}'.format(self.description, dumps(decoded_event)))
+                self.publish([decoded_event], block_info)
+            except ValidationError as e:
+                # Raised by the serializers when the referenced rows don't exist
+                logger.warning('INVALID {}: {}'.format(self.description, dumps(decoded_event)))
+                logger.warning(e.detail)
+            except Exception as e:
+                logger.error('FAILED {}: {}'.format(self.description, dumps(decoded_event)))
+                logger.error(e)
         else:
-            logger.warning('INVALID Centralized Oracle Factory Result: {}'.format(dumps(decoded_event)))
+            logger.warning('INVALID {}: {}'.format(self.description, dumps(decoded_event)))
             logger.warning(serializer.errors)
 
-
-class EventFactoryReceiver(AbstractEventReceiver):
+    def save_batch(self, decoded_events, block_info=None):
+        """
+        Applies all the decoded events of a block inside one transaction. The events which cannot be
+        applied by the batch are processed one by one with save() once the transaction is committed.
+        A block range can be applied atomically by wrapping consecutive calls in transaction.atomic()
+        Contract rows are fetched once for the whole batch through the identity map and the changed ones
+        are saved once, right before the transaction is committed.
+        :param decoded_events: list of decoded events
+        :param block_info: block information dictionary
+        :return: list of the events handed to the per-event fallback
+        """
+        with transaction.atomic():
+            with block_scope():
+                self.prefetch(decoded_events)
+                failed_events = self.apply_batch(decoded_events, block_info)
+
+        failed_ids = set(id(decoded_event) for decoded_event in failed_events)
+        self.publish([decoded_event for decoded_event in decoded_events if id(decoded_event) not in failed_ids],
+                     block_info)
+        for decoded_event in failed_events:
+            self.save(decoded_event, block_info)
+
+        if decoded_events:
+            logger.info('{} batch applied: {} events, {} processed one by one'.format(
+                self.description, len(decoded_events), len(failed_events)))
+        return failed_events
+
+    def publish(self, decoded_events, block_info=None):
+        """Publishes the contracts changed by the events to the block cache once they are committed"""
+        addresses = set()
+        for decoded_event in decoded_events:
+            addresses.update(get_touched_addresses(decoded_event))
+        if addresses:
+            transaction.on_commit(lambda: publish_block_changes(addresses, block_info))
+
+    def prefetch(self, decoded_events):
+        """Hook loading the rows used by the batch into the identity map with grouped queries"""
+        pass
+
+    def apply_batch(self, decoded_events, block_info=None):
+        """
+        Applies the events of the batch in one savepoint. If one of them raises, the savepoint is rolled back,
+        both in the database and in the identity map, and the events are applied again one savepoint each
+        :return: list of the events which could not be applied
+        """
+        with block_scope() as identity_map:
+            snapshot = identity_map.snapshot()
+            try:
+                with transaction.atomic():
+                    failed_events = self.apply_events(decoded_events, block_info)
+                identity_map.release(snapshot)
+                return failed_events
+            except Exception as e:
+                identity_map.restore(snapshot)
+                logger.warning('{} batch rolled back, applying its events one by one: {}'.format(
+                    self.description, e))
+        return self.apply_events_isolated(decoded_events, block_info)
+
+    def apply_events(self, decoded_events, block_info=None):
+        """
+        Applies the events in the current transaction, raising the error of the first one which fails
+        :return: list of the events which are not valid
+        """
+        failed_events = []
+        for decoded_event in decoded_events:
+            serializer = self.get_serializer(decoded_event, block_info)
+            if serializer is None:
+                continue
+            if serializer.is_valid():
+                serializer.save()
+            else:
+                failed_events.append(decoded_event)
+        return failed_events
+
+    def apply_events_isolated(self, decoded_events, block_info=None):
+        """
+        Applies every event in its own savepoint, so that a failing event only rolls back its own changes,
+        both in the database and in the identity map
+        :return: list of the events which could not be applied
+        """
+        failed_events = []
+        with block_scope() as identity_map:
+            for decoded_event in decoded_events:
+                serializer = self.get_serializer(decoded_event, block_info)
+                if serializer is None:
+                    continue
+                snapshot = identity_map.snapshot()
+                try:
+                    with transaction.atomic():
+                        if serializer.is_valid():
+                            serializer.save()
+                        else:
+                            failed_events.append(decoded_event)
+                    identity_map.release(snapshot)
+                except Exception:
+                    identity_map.restore(snapshot)
+                    failed_events.append(decoded_event)
+        return failed_events
+
+
+class CentralizedOracleFactoryReceiver(BaseEventReceiver):
+    serializer_class = CentralizedOracleSerializer
+    description = 'Centralized Oracle Factory Result'
+
+    def prefetch(self, decoded_events):
+        # Event descriptions are fetched concurrently instead of one IPFS round trip per oracle
+        prefetch_event_descriptions(
+            param.get('value')
+            for decoded_event in decoded_events
+            for param in decoded_event.get('params', [])
+            if param.get('name') == 'ipfsHash'
+        )
+
+
+class EventFactoryReceiver(BaseEventReceiver):
 
     events = {
         'ScalarEventCreation': ScalarEventSerializer,
         'CategoricalEventCreation': CategoricalEventSerializer
     }
+    description = 'Event Factory Result'
 
-    def save(self, decoded_event, block_info):
-        if self.events.get(decoded_event.get('name')):
-            serializer = self.events.get(decoded_event.get('name'))(data=decoded_event, block=block_info)
-            if serializer.is_valid():
-                serializer.save()
-                logger.info('Event Factory Result Added: {}'.format(dumps(decoded_event)))
-            else:
-                logger.warning('INVALID Event Factory Result: {}'.format(dumps(decoded_event)))
-                logger.warning(serializer.errors)
-
-
-class UltimateOracleFactoryReceiver(AbstractEventReceiver):
-
-    def save(self, decoded_event, block_info):
-        serializer = UltimateOracleSerializer(data=decoded_event, block=block_info)
-        if serializer.is_valid():
-            serializer.save()
-            logger.info('Ultimate Oracle Factory Result Added: {}'.format(dumps(decoded_event)))
-        else:
-            logger.warning('INVALID Ultimate Oracle Factory Result: {}'.format(dumps(decoded_event)))
-            logger.warning(serializer.errors)
 
+class UltimateOracleFactoryReceiver(BaseEventReceiver):
+    serializer_class = UltimateOracleSerializer
+    description = 'Ultimate Oracle Factory Result'
 
-class MarketFactoryReceiver(AbstractEventReceiver):
 
-    def save(self, decoded_event, block_info):
-        serializer = MarketSerializer(data=decoded_event, block=block_info)
-        if serializer.is_valid():
-            serializer.save()
-            logger.info('Market Factory Result Added: {}'.format(dumps(decoded_event)))
-        else:
-            logger.warning('INVALID Market Factory Result: {}'.format(dumps(decoded_event)))
-            logger.warning(serializer.errors)
+class MarketFactoryReceiver(BaseEventReceiver):
+    serializer_class = MarketSerializer
+    description = 'Market Factory Result'
 
 
-class MarketInstanceReceiver(AbstractEventReceiver):
+class MarketInstanceReceiver(BaseEventReceiver):
 
     events = {
         'OutcomeTokenPurchase': OutcomeTokenPurchaseSerializer,
@@ -80,45 +220,24 @@ class MarketInstanceReceiver(AbstractEventReceiver):
         'MarketClosing': MarketClosingSerializer,
         'FeeWithdrawal': FeeWithdrawalSerializer
     }
+    description = 'Market Instance'
 
-    def save(self, decoded_event, block_info=None):
-        if block_info:
-            serializer = self.events.get(decoded_event.get('name'))(data=decoded_event, block=block_info)
-        else:
-            serializer = self.events.get(decoded_event.get('name'))(data=decoded_event)
-
-        if serializer.is_valid():
-            serializer.save()
-            logger.info('Market Instance Added: {}'.format(dumps(decoded_event)))
-        else:
-            logger.warning('INVALID Market Instance: {}'.format(dumps(decoded_event)))
-            logger.warning(serializer.errors)
+    def prefetch(self, decoded_events):
+        markets = prefetch_contracts(Market, set(decoded_event.get('address') for decoded_event in decoded_events))
+        prefetch_outcome_tokens(OutcomeToken, set(market.event_id for market in markets.values()))
 
 
 # contract instances
-class CentralizedOracleInstanceReceiver(AbstractEventReceiver):
+class CentralizedOracleInstanceReceiver(BaseEventReceiver):
 
     events = {
         'OwnerReplacement': OwnerReplacementSerializer,
         'OutcomeAssignment': OutcomeAssignmentOracleSerializer
     }
-
-    def save(self, decoded_event, block_info=None):
-        if self.events.get(decoded_event.get('name')):
-            if block_info:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event, block=block_info)
-            else:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event)
-
-            if serializer.is_valid():
-                serializer.save()
-                logger.info('Centralized Oracle Instance Added: {}'.format(dumps(decoded_event)))
-            else:
-                logger.warning('INVALID Centralized Oracle Instance: {}'.format(dumps(decoded_event)))
-                logger.warning(serializer.errors)
+    description = 'Centralized Oracle Instance'
 
 
-class UltimateOracleInstanceReceiver(AbstractEventReceiver):
+class UltimateOracleInstanceReceiver(BaseEventReceiver):
 
     events = {
         'ForwardedOracleOutcomeAssignment': ForwardedOracleOutcomeAssignmentSerializer,
@@ -126,56 +245,128 @@ class UltimateOracleInstanceReceiver(AbstractEventReceiver):
         'OutcomeVote': OutcomeVoteSerializer,
         'Withdrawal': WithdrawalSerializer
     }
-
-    def save(self, decoded_event, block_info=None):
-        if self.events.get(decoded_event.get('name')):
-            if block_info:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event, block=block_info)
-            else:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event)
-
-            if serializer.is_valid():
-                serializer.save()
-                logger.info('Ultimate Oracle Factory Result Added: {}'.format(dumps(decoded_event)))
-            else:
-                logger.warning('INVALID Ultimate Oracle Factory Result: {}'.format(dumps(decoded_event)))
-                logger.warning(serializer.errors)
+    description = 'Ultimate Oracle Instance'
 
 
-class EventInstanceReceiver(AbstractEventReceiver):
+class EventInstanceReceiver(BaseEventReceiver):
 
     events = {
         'OutcomeTokenCreation': OutcomeTokenInstanceSerializer,
         'OutcomeAssignment': OutcomeAssignmentEventSerializer,
         'WinningsRedemption': WinningsRedemptionSerializer
     }
-
-    def save(self, decoded_event, block_info=None):
-        if self.events.get(decoded_event.get('name')):
-            if block_info:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event, block=block_info)
-            else:
-                serializer = self.events.get(decoded_event.get('name'))(data=decoded_event)
-
-            if serializer.is_valid():
-                serializer.save()
-                logger.info('Event Instance Added: {}'.format(dumps(decoded_event)))
-            else:
-                logger.warning('INVALID Event Instance: {}'.format(dumps(decoded_event)))
-                logger.warning(serializer.errors)
+    description = 'Event Instance'
 
 
-class OutcomeTokenInstanceReceiver(AbstractEventReceiver):
+class OutcomeTokenInstanceReceiver(BaseEventReceiver):
     events = {
         'Issuance': OutcomeTokenIssuanceSerializer,  # sum to totalSupply, update data
         'Revocation': OutcomeTokenRevocationSerializer,  # subtract from total Supply, update data,
         'Transfer': OutcomeTokenTransferSerializer # moves balance between owners
     }
-
-    def save(self, decoded_event, block_info=None):
-        if self.events.get(decoded_event.get('name')):
-            serializer = self.events.get(decoded_event.get('name'))(data=decoded_event)
-            if serializer.is_valid():
-                serializer.save()
-            else:
-                logger.warning(serializer.errors)
+    description = 'Outcome Token Instance'
+
+    def get_serializer(self, decoded_event, block_info=None):
+        # Outcome token serializers don't store block information
+        return super(OutcomeTokenInstanceReceiver, self).get_serializer(decoded_event)
+
+    def parse_event(self, decoded_event):
+        """
+        Translates an outcome token event into its supply change and its balance changes
+        :return: tuple (supply_delta, [(owner, balance_delta, must_exist)])
+        """
+        params = dict((param[u'name'], param[u'value']) for param in decoded_event.get('params'))
+        name = decoded_event.get('name')
+        if name == 'Issuance':
+            amount = int(params['amount'])
+            return amount, [(params['owner'], amount, False)]
+        elif name == 'Revocation':
+            amount = int(params['amount'])
+            return -amount, [(params['owner'], -amount, True)]
+        else:
+            value = int(params['value'])
+            if value < 0:
+                raise ValueError('Transfer value must be positive')
+            return 0, [(params['from'], -value, True), (params['to'], value, False)]
+
+    def apply_batch(self, decoded_events, block_info=None):
+        """
+        Folds the Issuance, Revocation and Transfer events of the batch into one supply delta per outcome
+        token, one balance delta per (owner, outcome token) and one open interest delta per market, loads the
+        touched rows with two queries and writes them with one in-database statement per table.
+        """
+        failed_events = []
+        parsed_events = []
+        for decoded_event in decoded_events:
+            if decoded_event.get('name') not in self.events:
+                continue
+            try:
+                supply_delta, balance_changes = self.parse_event(decoded_event)
+                parsed_events.append((decoded_event, decoded_event['address'], supply_delta, balance_changes))
+            except (KeyError, TypeError, ValueError):
+                failed_events.append(decoded_event)
+
+        if not parsed_events:
+            return failed_events
+
+        # Grouped lookups
+        token_addresses = set(address for _, address, _, _ in parsed_events)
+        owners = set(owner for _, _, _, changes in parsed_events for owner, _, _ in changes)
+        outcome_tokens = OutcomeToken.objects.in_bulk(list(token_addresses))
+        balances = dict(
+            ((balance.owner, balance.outcome_token_id), balance)
+            for balance in OutcomeTokenBalance.objects.filter(outcome_token_id__in=list(token_addresses),
+                                                              owner__in=list(owners))
+        )
+
+        supply_deltas = defaultdict(int)
+        balance_deltas = OrderedDict()
+        transfers = []
+        applied_events = []
+        for decoded_event, address, supply_delta, balance_changes in parsed_events:
+            if address not in outcome_tokens:
+                failed_events.append(decoded_event)
+                continue
+            # A balance which must exist may have been created earlier in the same batch
+            if any(must_exist and (owner, address) not in balances and (owner, address) not in balance_deltas
+                   for owner, _, must_exist in balance_changes):
+                failed_events.append(decoded_event)
+                continue
+
+            applied_events.append(decoded_event)
+            supply_deltas[address] += supply_delta
+            for owner, balance_delta, _ in balance_changes:
+                balance_deltas[(owner, address)] = balance_deltas.get((owner, address), 0) + balance_delta
+            if decoded_event.get('name') == 'Transfer':
+                (from_address, _, _), (to_address, value, _) = balance_changes
+                transfers.append((from_address, to_address, value))
+
+        # Grouped writes, one statement for the balances and one for the supplies. A failing statement
+        # rolls back the savepoint and the events are applied one by one, so only the faulty ones are lost
+        try:
+            with transaction.atomic():
+                OutcomeTokenBalance.objects.add_balances(balance_deltas)
+                OutcomeToken.objects.add_supplies(supply_deltas)
+                MarketStats.objects.add_open_interest(self.get_open_interest_deltas(transfers))
+        except Exception as e:
+            logger.warning('{} batch rolled back, applying its events one by one: {}'.format(self.description, e))
+            return failed_events + self.apply_events_isolated(applied_events, block_info)
+        return failed_events
+
+    def get_open_interest_deltas(self, transfers):
+        """
+        Folds the transfers out of a market (+) and back into it (-) into one open interest delta per market,
+        transfers between other addresses change nothing
+        :param transfers: list of (from, to, value) tuples
+        :return: dictionary market address -> delta
+        """
+        markets = MarketAddressGetter()
+        open_interest_deltas = defaultdict(int)
+        for from_address, to_address, value in transfers:
+            if from_address == to_address:
+                continue
+            if from_address in markets:
+                open_interest_deltas[from_address] += value
+            if to_address in markets:
+                open_interest_deltas[to_address] -= value
+        return open_interest_deltas
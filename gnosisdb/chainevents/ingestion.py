@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from celery.utils.log import get_task_logger
+from chainevents.address_getters import ContractAddressGetter
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from django_eth_events.decoder import Decoder
+from django_eth_events.models import Daemon
+from multiprocessing.pool import ThreadPool
+from six.moves import queue
+import contextlib
+import threading
+import time
+
+logger = get_task_logger(__name__)
+
+# pg_try_advisory_lock key, a single ingestion daemon or task may write to the database
+INGESTION_LOCK_ID = 0x676e6f73
+
+
+@contextlib.contextmanager
+def ingestion_lock():
+    """
+    Holds the session advisory lock of the ingestion while blocks are ingested
+    :return: True if the lock was acquired, False if another ingestion holds it
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [INGESTION_LOCK_ID])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [INGESTION_LOCK_ID])
+
+
+class StageError(object):
+    """Carries an exception raised by a pipeline thread to the stage consuming its queue"""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def normalize_address(address):
+    address = address.lower()
+    return address[2:] if address.startswith('0x') else address
+
+
+class ContractRoute(object):
+    """
+    One ETH_EVENTS entry: selects the decoded events of its contracts and hands them to its receiver
+    """
+
+    def __init__(self, contract):
+        self.name = contract.get('NAME')
+        self.abi = contract['EVENT_ABI']
+        self.event_names = set(item['name'] for item in self.abi if item.get('type') == 'event')
+        self.receiver = import_string(contract['EVENT_DATA_RECEIVER'])()
+        if contract.get('ADDRESSES_GETTER'):
+            self.addresses = import_string(contract['ADDRESSES_GETTER'])()
+        else:
+            self.addresses = set(normalize_address(address) for address in contract.get('ADDRESSES', []))
+
+    def select(self, decoded_events):
+        return [
+            decoded_event for decoded_event in decoded_events
+            if decoded_event.get('name') in self.event_names
+            and normalize_address(decoded_event['address']) in self.addresses
+        ]
+
+
+class BlockPipeline(object):
+    """
+    Follows the chain head and ingests every block in three stages connected by bounded queues:
+    fetching blocks and their logs with a pool of threads, decoding the logs, and applying them to the
+    database. A full queue blocks the stage feeding it, so fetching never runs more than queue_size
+    blocks ahead of the database. Blocks are applied in order, each one in its own transaction together
+    with the checkpoint of the last processed block.
+    """
+
+    def __init__(self, web3, contracts, fetch_workers=4, queue_size=32, poll_interval=1, confirmations=0):
+        self.web3 = web3
+        self.routes = [ContractRoute(contract) for contract in contracts]
+        self.fetch_workers = fetch_workers
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self.fetched = queue.Queue(queue_size)
+        self.decoded = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+
+    def get_head(self):
+        return self.web3.eth.blockNumber - self.confirmations
+
+    def get_decoder(self):
+        decoder = Decoder()
+        for route in self.routes:
+            decoder.add_abi(route.abi)
+        return decoder
+
+    def fetch_block(self, block_number):
+        """
+        :return: tuple (block information dictionary, list of logs of the block)
+        """
+        block = self.web3.eth.getBlock(block_number)
+        logs = []
+        for tx_hash in block['transactions']:
+            logs.extend(self.web3.eth.getTransactionReceipt(tx_hash)['logs'])
+        block_info = {
+            'number': block['number'],
+            'hash': block['hash'],
+            'timestamp': block['timestamp'],
+        }
+        return block_info, logs
+
+    def put(self, stage_queue, item):
+        """Waits for room in the queue, gives up once the pipeline is stopped"""
+        while not self.stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, stage_queue):
+        """
+        Waits for the next item of the queue, re-raising the errors of the stage feeding it
+        :return: the item, None once the pipeline is stopped
+        """
+        while not self.stopped.is_set():
+            try:
+                item = stage_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if isinstance(item, StageError):
+                raise item.exception
+            return item
+        return None
+
+    def fetch(self, from_block, to_block=None):
+        pool = ThreadPool(self.fetch_workers)
+        try:
+            block_number = from_block
+            while not self.stopped.is_set():
+                head = self.get_head()
+                if to_block is not None:
+                    head = min(head, to_block)
+                if head < block_number:
+                    time.sleep(self.poll_interval)
+                    continue
+                # blocks are fetched concurrently but queued in order, one window at a time
+                window = range(block_number, min(head, block_number + self.queue_size - 1) + 1)
+                for fetched_block in pool.imap(self.fetch_block, window):
+                    if not self.put(self.fetched, fetched_block):
+                        return
+                block_number = window[-1] + 1
+        except Exception as e:
+            self.put(self.fetched, StageError(e))
+        finally:
+            pool.terminate()
+
+    def decode(self):
+        try:
+            decoder = self.get_decoder()
+            while True:
+                fetched_block = self.get(self.fetched)
+                if fetched_block is None:
+                    return
+                block_info, logs = fetched_block
+                if not self.put(self.decoded, (block_info, decoder.decode_logs(logs))):
+                    return
+        except Exception as e:
+            self.put(self.decoded, StageError(e))
+
+    def apply(self, block_info, decoded_events):
+        """
+        Applies the events of a block and checkpoints it in one transaction. Contracts are filtered here,
+        not while decoding, so the ones created by the previous blocks are already known.
+        """
+        with transaction.atomic():
+            for route in self.routes:
+                events = route.select(decoded_events)
+                if events:
+                    route.receiver.save_batch(events, block_info)
+            daemon = Daemon.get_solo()
+            daemon.block_number = block_info['number']
+            daemon.save()
+
+    def start(self, from_block, to_block=None):
+        self.stopped.clear()
+        threads = [
+            threading.Thread(target=self.fetch, args=(from_block, to_block), name='ingestion-fetch'),
+            threading.Thread(target=self.decode, name='ingestion-decode'),
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        return threads
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, from_block=None, to_block=None):
+        """
+        Ingests blocks until stop() is called or to_block is applied
+        :param from_block: first block to ingest, defaults to the one after the checkpoint
+        :param to_block: last block to ingest, None follows the chain head forever
+        """
+        if from_block is None:
+            from_block = Daemon.get_solo().block_number + 1
+        if to_block is not None and from_block > to_block:
+            return
+        # the blocks applied since the last run may have been ingested by another process
+        ContractAddressGetter.refresh_caches()
+
+        threads = self.start(from_block, to_block)
+        try:
+            while True:
+                decoded_block = self.get(self.decoded)
+                if decoded_block is None:
+                    return
+                block_info, decoded_events = decoded_block
+                started = time.time()
+                self.apply(block_info, decoded_events)
+                logger.info('Block {} applied: {} events in {:.3f}s, {} blocks queued'.format(
+                    block_info['number'], len(decoded_events), time.time() - started,
+                    self.fetched.qsize() + self.decoded.qsize()))
+                if to_block is not None and block_info['number'] >= to_block:
+                    return
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
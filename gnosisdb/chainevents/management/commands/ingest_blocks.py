@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django_eth_events.web3_service import Web3Service
+from chainevents.ingestion import BlockPipeline, ingestion_lock
+import signal
+
+
+class Command(BaseCommand):
+    help = 'Follows the chain head and ingests the events of every new block, resuming from the last processed one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-block', type=int, default=None,
+                            help='First block to ingest, defaults to the one after the last processed block')
+        parser.add_argument('--to-block', type=int, default=None,
+                            help='Last block to ingest, the chain head is followed forever by default')
+        parser.add_argument('--fetch-workers', type=int, default=settings.INGEST_FETCH_WORKERS)
+        parser.add_argument('--queue-size', type=int, default=settings.INGEST_QUEUE_SIZE)
+        parser.add_argument('--confirmations', type=int, default=settings.INGEST_CONFIRMATIONS)
+
+    def handle(self, *args, **options):
+        with ingestion_lock() as acquired:
+            if not acquired:
+                raise CommandError('Another ingestion daemon or task is running')
+            self.ingest(options)
+
+    def ingest(self, options):
+        pipeline = BlockPipeline(
+            Web3Service().web3,
+            settings.ETH_EVENTS,
+            fetch_workers=options['fetch_workers'],
+            queue_size=options['queue_size'],
+            poll_interval=settings.INGEST_POLL_INTERVAL,
+            confirmations=options['confirmations'],
+        )
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the block being applied')
+            pipeline.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        pipeline.run(options['from_block'], options['to_block'])
@@ -0,0 +1,32 @@
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django_eth_events.web3_service import Web3Service
+from chainevents.ingestion import BlockPipeline, ingestion_lock
+
+logger = get_task_logger(__name__)
+
+
+@shared_task
+def event_listener():
+    """
+    Periodic ingestion of the blocks mined since the last processed one. Every block is applied through
+    the receivers' save_batch, in one transaction together with its checkpoint. Skipped while the ingestion
+    daemon or a previous run holds the ingestion lock.
+    """
+    with ingestion_lock() as acquired:
+        if not acquired:
+            logger.info('Ingestion already running, skipping')
+            return
+
+        pipeline = BlockPipeline(
+            Web3Service().web3,
+            settings.ETH_EVENTS,
+            fetch_workers=settings.INGEST_FETCH_WORKERS,
+            queue_size=settings.INGEST_QUEUE_SIZE,
+            poll_interval=settings.INGEST_POLL_INTERVAL,
+            confirmations=settings.INGEST_CONFIRMATIONS,
+        )
+        to_block = pipeline.get_head()
+        logger.info('Ingesting blocks up to {}'.format(to_block))
+        pipeline.run(to_block=to_block)
@@ -1,9 +1,13 @@
+from django.db import transaction
 from django.test import TestCase
-from chainevents.address_getters import MarketAddressGetter, EventAddressGetter
-from relationaldb.tests.factories import MarketFactory, EventFactory
+from chainevents.address_getters import MarketAddressGetter, EventAddressGetter, OutcomeTokenGetter
+from relationaldb.tests.factories import MarketFactory, EventFactory, OutcomeTokenFactory
 
 
 class TestAddressGetters(TestCase):
+    def setUp(self):
+        MarketAddressGetter.reset_cache()
+
     def test_market_address_getter(self):
         getter = MarketAddressGetter()
         self.assertListEqual([], getter.get_addresses())
@@ -22,4 +26,55 @@ class TestAddressGetters(TestCase):
         self.assertTrue(getter.__contains__(event.address))
         self.assertListEqual([event.address], getter.get_addresses())
         event2 = EventFactory.create()
-        self.assertListEqual([event.address, event2.address], getter.get_addresses())
\ No newline at end of file
+        self.assertListEqual([event.address, event2.address], getter.get_addresses())
+
+    def test_contains_answered_from_memory(self):
+        market = MarketFactory.create()
+        getter = MarketAddressGetter()
+        self.assertListEqual([market.address], getter.get_addresses())
+        with self.assertNumQueries(0):
+            self.assertTrue(market.address in getter)
+            self.assertFalse(market.creator in getter)
+
+    def test_rolled_back_contract_not_cached(self):
+        getter = MarketAddressGetter()
+        self.assertListEqual([], getter.get_addresses())
+        try:
+            with transaction.atomic():
+                market = MarketFactory.create()
+                # visible inside the transaction which created it
+                self.assertTrue(market.address in getter)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(market.address in getter)
+        self.assertListEqual([], getter.get_addresses())
+
+    def test_incremental_refresh(self):
+        getter = MarketAddressGetter()
+        market = MarketFactory.create(creation_block=10)
+        self.assertListEqual([market.address], getter.get_addresses())
+        # rows written without the post_save signal are found by the incremental refresh
+        MarketAddressGetter.get_cache().address_set.discard(market.address)
+        MarketAddressGetter.get_cache().addresses.remove(market.address)
+        market2 = MarketFactory.create(creation_block=11)
+        self.assertListEqual([market2.address, market.address], getter.get_addresses())
+        self.assertEqual(MarketAddressGetter.get_cache().high_water_mark, 11)
+
+    def test_refresh_caches(self):
+        getter = MarketAddressGetter()
+        market = MarketFactory.create(creation_block=10)
+        self.assertTrue(market.address in getter)
+        # contracts saved by another process are only found once the caches are refreshed
+        MarketAddressGetter.get_cache().address_set.discard(market.address)
+        MarketAddressGetter.get_cache().addresses.remove(market.address)
+        self.assertFalse(market.address in getter)
+        MarketAddressGetter.refresh_caches()
+        self.assertTrue(market.address in getter)
+
+    def test_outcome_token_getter(self):
+        getter = OutcomeTokenGetter()
+        self.assertListEqual([], getter.get_addresses())
+        outcome_token = OutcomeTokenFactory.create()
+        self.assertTrue(outcome_token.address in getter)
+        self.assertListEqual([outcome_token.address], getter.get_addresses())
@@ -10,7 +10,7 @@ from chainevents.event_receivers import (
 
 from relationaldb.models import (
     CentralizedOracle, UltimateOracle, ScalarEvent, CategoricalEvent, Market, OutcomeToken,
-    Event, OutcomeVoteBalance
+    Event, OutcomeVoteBalance, OutcomeTokenBalance, Candle, MarketStats
 )
 
 from relationaldb.tests.factories import (
@@ -21,6 +21,7 @@ from relationaldb.tests.factories import (
 from datetime import datetime
 from time import mktime
 from ipfs.ipfs import Ipfs
+from gnosisdb.utils import calc_lmsr_marginal_prices
 
 
 class TestEventReceiver(TestCase):
@@ -72,6 +73,44 @@ class TestEventReceiver(TestCase):
         created_oracle = CentralizedOracle.objects.get(address=oracle_address)
         self.assertIsNotNone(created_oracle.pk)
 
+    def test_centralized_oracle_receiver_save_batch(self):
+        oracle = CentralizedOracleFactory()
+        event_description_json = {
+            'title': 'Test title',
+            'description': 'test long description',
+            'resolutionDate': datetime.now().isoformat(),
+            'outcomes': ['YES', 'NO']
+        }
+        ipfs_hash = self.ipfs_api.post(event_description_json)
+        block = {
+            'number': oracle.creation_block,
+            'timestamp': self.to_timestamp(oracle.creation_date_time)
+        }
+        oracle_address = oracle.address[1:-7] + 'PREFTCH'
+        oracle_event = {
+            'address': oracle.factory[1:-7] + 'GIACOMO',
+            'params': [
+                {
+                    'name': 'creator',
+                    'value': oracle.creator
+                },
+                {
+                    'name': 'centralizedOracle',
+                    'value': oracle_address,
+                },
+                {
+                    'name': 'ipfsHash',
+                    'value': ipfs_hash
+                }
+            ]
+        }
+
+        self.assertEquals(CentralizedOracleFactoryReceiver().save_batch([oracle_event], block), [])
+        # the description was prefetched, so the oracle is not left pending
+        created_oracle = CentralizedOracle.objects.get(address=oracle_address)
+        self.assertEquals(created_oracle.event_description.ipfs_hash, ipfs_hash)
+        self.assertIsNone(created_oracle.pending_ipfs_hash)
+
     def test_ultimate_oracle_receiver(self):
         forwarded_oracle = CentralizedOracleFactory()
         ultimate_oracle = UltimateOracleFactory()
@@ -219,7 +258,7 @@ class TestEventReceiver(TestCase):
         oracle = CentralizedOracleFactory()
         oracle.event_description.outcomes = ['1', '2', '3']
         oracle.event_description.save()
-        event = CategoricalEventFactory(oracle=oracle)
+        event = CategoricalEventFactory(oracle=oracle, outcome_count=3)
         market = MarketFactory()
         event_address = event.address
 
@@ -272,6 +311,7 @@ class TestEventReceiver(TestCase):
         market = Market.objects.get(event=event_address)
         self.assertIsNotNone(market.pk)
         self.assertEquals(len(market.net_outcome_tokens_sold), 3)
+        self.assertEquals(market.stats.trades, 0)
 
     #
     # contract instances
@@ -608,4 +648,275 @@ class TestEventReceiver(TestCase):
         MarketInstanceReceiver().save(withdraw_event)
         market = Market.objects.get(address=market_factory.address)
         # self.assertEquals(market.stage, 3)
-        self.assertEquals(market.withdrawn_fees, market_factory.withdrawn_fees+10)
\ No newline at end of file
+        self.assertEquals(market.withdrawn_fees, market_factory.withdrawn_fees+10)
+
+    def test_market_instance_save_batch(self):
+        market_factory = MarketFactory()
+        events = [
+            {
+                'name': 'MarketFunding',
+                'address': market_factory.address,
+                'params': [{'name': 'funding', 'value': 100}]
+            },
+            {
+                'name': 'FeeWithdrawal',
+                'address': market_factory.address,
+                'params': [{'name': 'fees', 'value': 10}]
+            },
+            {
+                'name': 'MarketFunding',
+                'address': market_factory.address,
+                'params': [{'name': 'funding', 'value': 'invalid'}]
+            }
+        ]
+
+        failed_events = MarketInstanceReceiver().save_batch(events)
+        # invalid events are handed to the per-event fallback
+        self.assertListEqual(failed_events, [events[2]])
+        market = Market.objects.get(address=market_factory.address)
+        self.assertEquals(market.stage, 1)
+        self.assertEquals(market.funding, 100)
+        self.assertEquals(market.withdrawn_fees, market_factory.withdrawn_fees + 10)
+
+    def test_outcome_token_instance_save_batch(self):
+        outcome_token_factory = OutcomeTokenFactory()
+        owner = outcome_token_factory.address[0:-7] + 'GIACOMO'
+        receiver = owner[0:-7] + 'RECEIVE'
+        events = [
+            {
+                'name': 'Issuance',
+                'address': outcome_token_factory.address,
+                'params': [{'name': 'owner', 'value': owner}, {'name': 'amount', 'value': 1000}]
+            },
+            {
+                'name': 'Transfer',
+                'address': outcome_token_factory.address,
+                'params': [{'name': 'from', 'value': owner}, {'name': 'to', 'value': receiver},
+                           {'name': 'value', 'value': 300}]
+            },
+            {
+                'name': 'Revocation',
+                'address': outcome_token_factory.address,
+                'params': [{'name': 'owner', 'value': owner}, {'name': 'amount', 'value': 200}]
+            },
+            {
+                'name': 'Revocation',
+                'address': outcome_token_factory.address,
+                'params': [{'name': 'owner', 'value': receiver[0:-7] + 'UNKNOWN'}, {'name': 'amount', 'value': 1}]
+            }
+        ]
+
+        failed_events = OutcomeTokenInstanceReceiver().save_batch(events)
+        self.assertListEqual(failed_events, [events[3]])
+        outcome_token = OutcomeToken.objects.get(address=outcome_token_factory.address)
+        self.assertEquals(outcome_token.total_supply, outcome_token_factory.total_supply + 800)
+        self.assertEquals(OutcomeTokenBalance.objects.get(owner=owner).balance, 500)
+        self.assertEquals(OutcomeTokenBalance.objects.get(owner=receiver).balance, 300)
+
+    def test_outcome_token_instance_save_batch_isolates_failures(self):
+        outcome_token_factory = OutcomeTokenFactory()
+        owner = outcome_token_factory.address[0:-7] + 'GIACOMO'
+        receiver = owner[0:-7] + 'RECEIVE'
+        events = [
+            {
+                'name': 'Issuance',
+                'address': outcome_token_factory.address,
+                'params': [{'name': 'owner', 'value': owner}, {'name': 'amount', 'value': 1000}]
+            },
+            {
+                'name': 'Issuance',
+                'address': outcome_token_factory.address,
+                # overflows the balance column, the grouped write fails
+                'params': [{'name': 'owner', 'value': receiver}, {'name': 'amount', 'value': 10 ** 81}]
+            }
+        ]
+
+        failed_events = OutcomeTokenInstanceReceiver().save_batch(events)
+        # only the failing event is lost, the block goes on
+        self.assertListEqual(failed_events, [events[1]])
+        outcome_token = OutcomeToken.objects.get(address=outcome_token_factory.address)
+        self.assertEquals(outcome_token.total_supply, outcome_token_factory.total_supply + 1000)
+        self.assertEquals(OutcomeTokenBalance.objects.get(owner=owner).balance, 1000)
+        self.assertFalse(OutcomeTokenBalance.objects.filter(owner=receiver).exists())
+
+    def test_market_instance_save_batch_orders(self):
+        outcome_token = OutcomeTokenFactory(index=0)
+        market_factory = MarketFactory(event=outcome_token.event)
+        block = {
+            'number': 1,
+            'timestamp': self.to_timestamp(datetime.now())
+        }
+        purchase_event = {
+            'name': 'OutcomeTokenPurchase',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'buyer', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 10},
+                {'name': 'cost', 'value': 5}
+            ]
+        }
+        sale_event = {
+            'name': 'OutcomeTokenSale',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'seller', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 4},
+                {'name': 'profit', 'value': 2}
+            ]
+        }
+
+        failed_events = MarketInstanceReceiver().save_batch([purchase_event, purchase_event, sale_event], block)
+        self.assertListEqual(failed_events, [])
+        market = Market.objects.get(address=market_factory.address)
+        self.assertEquals(market.net_outcome_tokens_sold[0], 16)
+        self.assertEquals(market.order_set.count(), 3)
+        self.assertListEqual(
+            [order.net_outcome_tokens_sold[0] for order in market.order_set.order_by('id')],
+            [10, 20, 16]
+        )
+
+    def test_market_instance_order_marginal_prices(self):
+        outcome_token = OutcomeTokenFactory(index=0)
+        market_factory = MarketFactory(event=outcome_token.event, funding=100, net_outcome_tokens_sold=[0, 0])
+        block = {
+            'number': 1,
+            'timestamp': self.to_timestamp(datetime.now())
+        }
+        purchase_event = {
+            'name': 'OutcomeTokenPurchase',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'buyer', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 10},
+                {'name': 'cost', 'value': 5}
+            ]
+        }
+
+        MarketInstanceReceiver().save(purchase_event, block)
+        order = Market.objects.get(address=market_factory.address).order_set.get()
+        self.assertListEqual(order.marginal_prices, calc_lmsr_marginal_prices([10, 0], 100))
+        self.assertGreater(order.marginal_prices[0], order.marginal_prices[1])
+
+    def test_market_instance_order_candles(self):
+        outcome_token = OutcomeTokenFactory(index=0)
+        market_factory = MarketFactory(event=outcome_token.event, funding=100, net_outcome_tokens_sold=[0, 0])
+        block = {
+            'number': 1,
+            'timestamp': self.to_timestamp(datetime(2017, 1, 1, 10, 30))
+        }
+        purchase_event = {
+            'name': 'OutcomeTokenPurchase',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'buyer', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 10},
+                {'name': 'cost', 'value': 5}
+            ]
+        }
+        sale_event = {
+            'name': 'OutcomeTokenSale',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'seller', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 4},
+                {'name': 'profit', 'value': 2}
+            ]
+        }
+
+        MarketInstanceReceiver().save(purchase_event, block)
+        MarketInstanceReceiver().save(sale_event, block)
+        prices = [calc_lmsr_marginal_prices([10, 0], 100), calc_lmsr_marginal_prices([6, 0], 100)]
+
+        # every outcome gets a candle per interval
+        self.assertEquals(Candle.objects.filter(market=market_factory.address).count(), 6)
+        candle = Candle.objects.get(market=market_factory.address, interval='1h', outcome_index=0)
+        self.assertEquals(candle.start, datetime(2017, 1, 1, 10))
+        self.assertEquals(candle.open, prices[0][0])
+        self.assertEquals(candle.high, prices[0][0])
+        self.assertEquals(candle.low, prices[1][0])
+        self.assertEquals(candle.close, prices[1][0])
+        self.assertEquals(candle.volume, 14)
+        candle = Candle.objects.get(market=market_factory.address, interval='1d', outcome_index=1)
+        self.assertEquals(candle.start, datetime(2017, 1, 1))
+        self.assertEquals(candle.low, prices[0][1])
+        self.assertEquals(candle.close, prices[1][1])
+        self.assertEquals(candle.volume, 0)
+
+    def test_market_instance_order_stats(self):
+        outcome_token = OutcomeTokenFactory(index=0)
+        market_factory = MarketFactory(event=outcome_token.event)
+        seller = market_factory.creator[0:-6] + 'SELLER'
+        block = {
+            'number': 1,
+            'timestamp': self.to_timestamp(datetime.now())
+        }
+        purchase_event = {
+            'name': 'OutcomeTokenPurchase',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'buyer', 'value': market_factory.creator},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 10},
+                {'name': 'cost', 'value': 5}
+            ]
+        }
+        sale_event = {
+            'name': 'OutcomeTokenSale',
+            'address': market_factory.address,
+            'params': [
+                {'name': 'seller', 'value': seller},
+                {'name': 'outcomeTokenIndex', 'value': 0},
+                {'name': 'outcomeTokenCount', 'value': 4},
+                {'name': 'profit', 'value': 2}
+            ]
+        }
+
+        MarketInstanceReceiver().save_batch([purchase_event, purchase_event, sale_event], block)
+        stats = MarketStats.objects.get(market=market_factory.address)
+        self.assertEquals(stats.trades, 3)
+        self.assertEquals(stats.traders, 2)
+        self.assertEquals(stats.volume, 12)
+
+        # tokens leaving the market are held by traders
+        events = [
+            {
+                'name': 'Issuance',
+                'address': outcome_token.address,
+                'params': [{'name': 'owner', 'value': market_factory.address}, {'name': 'amount', 'value': 10}]
+            },
+            {
+                'name': 'Transfer',
+                'address': outcome_token.address,
+                'params': [{'name': 'from', 'value': market_factory.address}, {'name': 'to', 'value': seller},
+                           {'name': 'value', 'value': 10}]
+            },
+            {
+                'name': 'Transfer',
+                'address': outcome_token.address,
+                'params': [{'name': 'from', 'value': seller}, {'name': 'to', 'value': market_factory.address},
+                           {'name': 'value', 'value': 4}]
+            }
+        ]
+        OutcomeTokenInstanceReceiver().save_batch(events)
+        self.assertEquals(MarketStats.objects.get(market=market_factory.address).open_interest, 6)
+
+        # the per event path agrees, transfers between traders change nothing
+        def transfer(from_address, to_address, value):
+            return {
+                'name': 'Transfer',
+                'address': outcome_token.address,
+                'params': [{'name': 'from', 'value': from_address}, {'name': 'to', 'value': to_address},
+                           {'name': 'value', 'value': value}]
+            }
+        OutcomeTokenInstanceReceiver().save(transfer(seller, market_factory.creator, 2))
+        self.assertEquals(MarketStats.objects.get(market=market_factory.address).open_interest, 6)
+        OutcomeTokenInstanceReceiver().save(transfer(seller, market_factory.address, 1))
+        self.assertEquals(MarketStats.objects.get(market=market_factory.address).open_interest, 5)
+        # a negative value is passed as a parameter of its own, not appended to a minus sign
+        MarketStats.objects.add_transfer(market_factory.creator, market_factory.address, -3)
+        self.assertEquals(MarketStats.objects.get(market=market_factory.address).open_interest, 8)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from django.test import TestCase
+from django_eth_events.models import Daemon
+from chainevents.ingestion import BlockPipeline
+
+
+class FakeEth(object):
+    """Chain of blocks with one transaction each, the receipt of a transaction holds one log"""
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.blockNumber = len(addresses)
+
+    def getBlock(self, block_number):
+        return {
+            'number': block_number,
+            'hash': '0x{:064x}'.format(block_number),
+            'timestamp': 1500000000 + block_number,
+            'transactions': ['tx{}'.format(block_number)] if block_number < len(self.addresses) else [],
+        }
+
+    def getTransactionReceipt(self, tx_hash):
+        block_number = int(tx_hash[2:])
+        return {'logs': [{'address': self.addresses[block_number], 'block': block_number}]}
+
+
+class FakeWeb3(object):
+
+    def __init__(self, addresses):
+        self.eth = FakeEth(addresses)
+
+
+class FakeDecoder(object):
+
+    def decode_logs(self, logs):
+        return [{'name': 'Ping', 'address': log['address'], 'params': [{'name': 'block', 'value': log['block']}]}
+                for log in logs]
+
+
+class RecordingReceiver(object):
+    applied = []
+
+    def save_batch(self, decoded_events, block_info):
+        RecordingReceiver.applied.append((block_info['number'], [event['address'] for event in decoded_events]))
+
+
+class FakePipeline(BlockPipeline):
+
+    def get_decoder(self):
+        return FakeDecoder()
+
+
+class TestBlockPipeline(TestCase):
+
+    def setUp(self):
+        RecordingReceiver.applied = []
+        self.contracts = [{
+            'NAME': 'Ping',
+            'ADDRESSES': ['0x' + 'a' * 40],
+            'EVENT_ABI': [{'type': 'event', 'name': 'Ping', 'inputs': []}],
+            'EVENT_DATA_RECEIVER': 'chainevents.tests.test_ingestion.RecordingReceiver',
+        }]
+
+    def test_blocks_applied_in_order_and_checkpointed(self):
+        addresses = ['a' * 40, 'b' * 40] * 10
+        pipeline = FakePipeline(FakeWeb3(addresses), self.contracts, fetch_workers=3, queue_size=4,
+                                poll_interval=0.01)
+        pipeline.run(to_block=len(addresses))
+
+        # resumes after the initial checkpoint, block 0, and hands only the events of the watched address
+        self.assertEqual(RecordingReceiver.applied, [(n, ['a' * 40]) for n in range(2, len(addresses), 2)])
+        self.assertEqual(Daemon.get_solo().block_number, len(addresses))
+
+    def test_resumes_after_checkpoint(self):
+        daemon = Daemon.get_solo()
+        daemon.block_number = 9
+        daemon.save()
+
+        addresses = ['a' * 40] * 12
+        pipeline = FakePipeline(FakeWeb3(addresses), self.contracts, poll_interval=0.01)
+        pipeline.run(to_block=11)
+
+        self.assertEqual([block_number for block_number, _ in RecordingReceiver.applied], [10, 11])
+        self.assertEqual(Daemon.get_solo().block_number, 11)
+
+    def test_nothing_to_ingest(self):
+        daemon = Daemon.get_solo()
+        daemon.block_number = 5
+        daemon.save()
+
+        pipeline = FakePipeline(FakeWeb3(['a' * 40] * 5), self.contracts, poll_interval=0.01)
+        pipeline.run(to_block=5)
+
+        self.assertEqual(RecordingReceiver.applied, [])
+        self.assertEqual(Daemon.get_solo().block_number, 5)
+
+    def test_stage_errors_are_raised(self):
+        web3 = FakeWeb3(['a' * 40] * 3)
+
+        def broken_receipt(tx_hash):
+            raise IOError('node unreachable')
+        web3.eth.getTransactionReceipt = broken_receipt
+
+        pipeline = FakePipeline(web3, self.contracts, poll_interval=0.01)
+        with self.assertRaises(IOError):
+            pipeline.run(from_block=0)
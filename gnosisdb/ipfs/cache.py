@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from collections import OrderedDict
+from copy import deepcopy
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+# base58 multihashes, anything else is never written to disk
+IPFS_HASH_REGEX = re.compile(r'^[1-9A-HJ-NP-Za-km-z]{46}$')
+
+
+class IpfsCache(object):
+    """
+    Content addressed cache of IPFS json objects. IPFS objects are immutable, so a hash is fetched
+    from the daemon at most once: objects are kept in an in-process LRU backed by a directory of files
+    named after their hash. Hashes the daemon reported as missing are remembered for negative_ttl seconds.
+    """
+
+    def __init__(self, directory=None, max_size=1000, negative_ttl=60):
+        """
+        :param directory: cache directory, None disables the disk cache
+        :param max_size: number of objects kept in memory
+        :param negative_ttl: seconds a missing hash is remembered, 0 disables negative caching
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Empties the in-memory caches, files on disk are kept"""
+        with self.lock:
+            self.objects = OrderedDict()
+            self.missing = {}
+
+    def get_path(self, ipfs_hash):
+        if self.directory is None or not IPFS_HASH_REGEX.match(ipfs_hash):
+            return None
+        # one subdirectory per hash suffix keeps directories small
+        return os.path.join(self.directory, ipfs_hash[-2:], ipfs_hash)
+
+    def remember(self, ipfs_hash, python_object):
+        with self.lock:
+            self.objects.pop(ipfs_hash, None)
+            self.objects[ipfs_hash] = python_object
+            while len(self.objects) > self.max_size:
+                self.objects.popitem(last=False)
+
+    def get(self, ipfs_hash):
+        """
+        Returns the cached object of ipfs_hash
+        :return: json object, None when the hash is not cached
+        :raise the exception of the daemon when the hash is cached as missing
+        """
+        with self.lock:
+            if ipfs_hash in self.objects:
+                python_object = self.objects.pop(ipfs_hash)
+                self.objects[ipfs_hash] = python_object
+                return deepcopy(python_object)
+
+            if ipfs_hash in self.missing:
+                expires_at, exception = self.missing[ipfs_hash]
+                if expires_at > time.time():
+                    raise exception
+                del self.missing[ipfs_hash]
+
+        path = self.get_path(ipfs_hash)
+        if path is None or not os.path.isfile(path):
+            return None
+
+        try:
+            with open(path, 'rb') as cache_file:
+                python_object = json.loads(cache_file.read().decode('utf-8'))
+        except (IOError, ValueError):
+            # truncated or unreadable file, fetch it again
+            return None
+
+        self.remember(ipfs_hash, python_object)
+        return deepcopy(python_object)
+
+    def set(self, ipfs_hash, python_object):
+        """Caches the object of ipfs_hash in memory and on disk"""
+        self.remember(ipfs_hash, deepcopy(python_object))
+        with self.lock:
+            self.missing.pop(ipfs_hash, None)
+
+        path = self.get_path(ipfs_hash)
+        if path is None or os.path.isfile(path):
+            return
+
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # write to a temporary file and rename it, readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(json.dumps(python_object).encode('utf-8'))
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            # the disk cache is an optimization only
+            pass
+
+    def set_missing(self, ipfs_hash, exception):
+        """Remembers that the daemon failed to resolve ipfs_hash with exception"""
+        if self.negative_ttl:
+            with self.lock:
+                self.missing[ipfs_hash] = (time.time() + self.negative_ttl, exception)
@@ -2,21 +2,103 @@
 from __future__ import unicode_literals
 from django.conf import settings
 from utils import singleton
+from ipfs.cache import IpfsCache
+from ipfsapi.exceptions import ErrorResponse
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 import ipfsapi
+import threading
+import time
 
 @singleton
 class Ipfs(object):
 
     def __init__(self):
         self.api = ipfsapi.connect(settings.IPFS_HOST, settings.IPFS_PORT)
+        self.cache = IpfsCache(settings.IPFS_CACHE_DIR, settings.IPFS_CACHE_SIZE, settings.IPFS_NEGATIVE_CACHE_TTL)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.local = threading.local()
 
     def get(self, ipfs_hash):
-        """Returns ipfs_hash's json related object
+        """Returns ipfs_hash's json related object, the daemon is queried once per hash
         :param ipfs_hash:
         :return: json object
         :raise AttributeError
         """
-        return self.api.get_json(ipfs_hash)
+        python_object = self.cache.get(ipfs_hash)
+        if python_object is not None:
+            return python_object
+
+        try:
+            python_object = self.api.get_json(ipfs_hash)
+        except ErrorResponse as e:
+            # the daemon doesn't know the hash, connection errors are not cached
+            self.cache.set_missing(ipfs_hash, e)
+            raise
+
+        self.cache.set(ipfs_hash, python_object)
+        return python_object
+
+    def get_pool(self):
+        """Returns the thread pool of the bulk fetches, created on first use and reused afterwards"""
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadPool(settings.IPFS_FETCH_WORKERS)
+            return self.pool
+
+    def fetch(self, ipfs_hash):
+        """Fetches ipfs_hash from a pool thread, every thread keeps its own client
+        :return: tuple (ipfs_hash, json object or None if it couldn't be fetched)
+        """
+        api = getattr(self.local, 'api', None)
+        if api is None:
+            api = self.local.api = ipfsapi.connect(settings.IPFS_HOST, settings.IPFS_PORT)
+
+        try:
+            python_object = api.get_json(ipfs_hash)
+        except ErrorResponse as e:
+            self.cache.set_missing(ipfs_hash, e)
+            return ipfs_hash, None
+        except Exception:
+            # bulk fetches are best-effort, an error must not reach the block transaction
+            return ipfs_hash, None
+
+        self.cache.set(ipfs_hash, python_object)
+        return ipfs_hash, python_object
+
+    def get_many(self, ipfs_hashes, timeout=None):
+        """Returns the json objects of ipfs_hashes, the ones not cached yet are fetched concurrently
+        :param ipfs_hashes: iterable of ipfs hashes
+        :param timeout: seconds to wait for the fetches, None waits for all of them
+        :return: dictionary ipfs_hash -> json object, without the hashes which couldn't be fetched in time
+        """
+        python_objects = {}
+        missing_hashes = []
+        for ipfs_hash in set(ipfs_hashes):
+            try:
+                python_object = self.cache.get(ipfs_hash)
+            except ErrorResponse:
+                continue
+            if python_object is None:
+                missing_hashes.append(ipfs_hash)
+            else:
+                python_objects[ipfs_hash] = python_object
+
+        if missing_hashes:
+            results = self.get_pool().imap_unordered(self.fetch, missing_hashes)
+            deadline = None if timeout is None else time.time() + timeout
+            for _ in missing_hashes:
+                try:
+                    ipfs_hash, python_object = results.next(
+                        None if deadline is None else max(deadline - time.time(), 0))
+                except TimeoutError:
+                    # late fetches still fill the cache when they complete
+                    break
+                if python_object is not None:
+                    python_objects[ipfs_hash] = python_object
+
+        return python_objects
 
     def post(self, python_object):
         """Creates an ipfs object
@@ -27,6 +109,7 @@ class Ipfs(object):
 
         if (isinstance(python_object, dict)):
             ipfs_hash = self.api.add_json(python_object)
+            self.cache.set(ipfs_hash, python_object)
 
         return ipfs_hash
 
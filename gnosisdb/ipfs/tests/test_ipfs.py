@@ -2,7 +2,11 @@
 from __future__ import unicode_literals
 from django.test import TestCase
 from ipfs.ipfs import Ipfs
+from ipfs.cache import IpfsCache
 from ipfsapi.exceptions import ErrorResponse
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
 
 
 class TestIpfs(TestCase):
@@ -18,3 +22,91 @@ class TestIpfs(TestCase):
 
         with self.assertRaises(ErrorResponse):
             ipfs.get("invalidhash")
+
+    def test_ipfs_cache(self):
+        ipfs = Ipfs()
+        ipfs_hash = ipfs.post({"name": "cached"})
+        ipfs.cache.clear()
+        ipfs.get(ipfs_hash)
+        # further lookups are served without the daemon
+        api = ipfs.api
+        ipfs.api = None
+        try:
+            self.assertEquals("cached", ipfs.get(ipfs_hash).get("name"))
+        finally:
+            ipfs.api = api
+
+
+    def test_ipfs_get_many(self):
+        ipfs = Ipfs()
+        ipfs_hashes = [ipfs.post({"name": name}) for name in ("first", "second", "third")]
+        ipfs.cache.clear()
+
+        python_objects = ipfs.get_many(ipfs_hashes + ["invalidhash"])
+        self.assertEquals(set(ipfs_hashes), set(python_objects.keys()))
+        self.assertEquals("first", python_objects[ipfs_hashes[0]].get("name"))
+        # fetched objects are cached
+        self.assertEquals("second", ipfs.cache.get(ipfs_hashes[1]).get("name"))
+
+    def test_ipfs_get_many_timeout(self):
+        ipfs = Ipfs()
+        ipfs_hash = ipfs.post({"name": "slow"})
+        ipfs.cache.clear()
+
+        def slow_fetch(ipfs_hash):
+            sleep(1)
+            return ipfs_hash, None
+        ipfs.fetch = slow_fetch
+        try:
+            started = time()
+            self.assertEquals({}, ipfs.get_many([ipfs_hash], timeout=0.1))
+            self.assertLess(time() - started, 1)
+        finally:
+            del ipfs.fetch
+
+class TestIpfsCache(TestCase):
+
+    ipfs_hash = 'QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG'
+
+    def setUp(self):
+        self.directory = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_lru(self):
+        cache = IpfsCache(max_size=2)
+        cache.set('a', {'name': 'a'})
+        cache.set('b', {'name': 'b'})
+        cache.get('a')
+        cache.set('c', {'name': 'c'})
+        # b is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEquals('a', cache.get('a').get('name'))
+        self.assertEquals('c', cache.get('c').get('name'))
+
+        # cached objects can't be changed by the callers
+        cache.get('a')['name'] = 'changed'
+        self.assertEquals('a', cache.get('a').get('name'))
+
+    def test_disk(self):
+        cache = IpfsCache(self.directory)
+        cache.set(self.ipfs_hash, {'name': 'giacomo'})
+        cache.set('../invalid', {'name': 'invalid'})
+
+        cache = IpfsCache(self.directory)
+        self.assertEquals('giacomo', cache.get(self.ipfs_hash).get('name'))
+        self.assertIsNone(cache.get('../invalid'))
+
+    def test_missing(self):
+        cache = IpfsCache(negative_ttl=60)
+        cache.set_missing(self.ipfs_hash, KeyError(self.ipfs_hash))
+        with self.assertRaises(KeyError):
+            cache.get(self.ipfs_hash)
+
+        cache.missing[self.ipfs_hash] = (time() - 1, KeyError(self.ipfs_hash))
+        self.assertIsNone(cache.get(self.ipfs_hash))
+
+        cache = IpfsCache(negative_ttl=0)
+        cache.set_missing(self.ipfs_hash, KeyError(self.ipfs_hash))
+        self.assertIsNone(cache.get(self.ipfs_hash))
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+
+_local = threading.local()
+
+
+class Journal(object):
+    """Changes made to an identity map since a snapshot, enough to undo them"""
+
+    def __init__(self):
+        self.states = OrderedDict()
+        self.previous = OrderedDict()
+        self.dirty = []
+
+
+class IdentityMap(object):
+    """
+    Block scoped cache of the contract rows used while ingesting, keyed by model and lookup key.
+    Each row is fetched once per block, changed rows are marked as dirty and saved once when the
+    block is committed.
+    """
+    missing = object()
+
+    def __init__(self):
+        self.instances = {}
+        self.dirty = OrderedDict()
+        self.journal = None
+
+    def get(self, model, key, loader):
+        """
+        Returns the cached instance for (model, key) or loads it with loader()
+        :raise model.DoesNotExist
+        """
+        if (model, key) not in self.instances:
+            self.record_key((model, key))
+            try:
+                self.instances[(model, key)] = loader()
+            except model.DoesNotExist:
+                self.instances[(model, key)] = None
+
+        instance = self.instances[(model, key)]
+        if instance is None:
+            raise model.DoesNotExist('{} {} does not exist'.format(model.__name__, key))
+        self.record_state(instance)
+        return instance
+
+    def add(self, model, key, instance):
+        self.record_key((model, key))
+        self.instances[(model, key)] = instance
+
+    def mark_dirty(self, instance):
+        if id(instance) not in self.dirty:
+            if self.journal is not None:
+                self.journal.dirty.append(id(instance))
+            self.dirty[id(instance)] = instance
+
+    def flush(self):
+        """Saves every dirty instance once"""
+        for instance in self.dirty.values():
+            instance.save()
+        self.dirty.clear()
+
+    def record_key(self, key):
+        if self.journal is not None and key not in self.journal.previous:
+            self.journal.previous[key] = self.instances.get(key, self.missing)
+
+    def record_state(self, instance):
+        """Saves the state of an instance handed out since the snapshot, lists are copied as ArrayFields
+        are changed in place"""
+        if self.journal is not None and id(instance) not in self.journal.states:
+            state = dict(
+                (name, list(value) if isinstance(value, list) else value)
+                for name, value in instance.__dict__.items()
+            )
+            self.journal.states[id(instance)] = (instance, state)
+
+    def snapshot(self):
+        """
+        Starts recording the instances handed out from now on, only those can be changed by the caller.
+        The cost of a snapshot is proportional to the rows used after it, not to the size of the map.
+        :return: opaque snapshot for restore(), only the latest one can be restored
+        """
+        self.journal = Journal()
+        return self.journal
+
+    def release(self, snapshot):
+        """Stops recording, keeping the changes made to the cached instances after the given snapshot"""
+        if self.journal is snapshot:
+            self.journal = None
+
+    def restore(self, snapshot):
+        """Discards the changes made to the cached instances after the given snapshot"""
+        for instance, state in snapshot.states.values():
+            instance.__dict__.clear()
+            instance.__dict__.update(state)
+        for key, instance in snapshot.previous.items():
+            if instance is self.missing:
+                self.instances.pop(key, None)
+            else:
+                self.instances[key] = instance
+        for instance_id in snapshot.dirty:
+            self.dirty.pop(instance_id, None)
+        self.journal = None
+
+
+def get_identity_map():
+    """Returns the active identity map, None outside of a block scope"""
+    return getattr(_local, 'identity_map', None)
+
+
+@contextmanager
+def block_scope():
+    """
+    Activates an identity map for the current thread, dirty rows are flushed when the scope exits
+    without errors. Nested scopes share the outermost map.
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        yield identity_map
+        return
+
+    identity_map = IdentityMap()
+    _local.identity_map = identity_map
+    try:
+        yield identity_map
+        identity_map.flush()
+    finally:
+        _local.identity_map = None
+
+
+def get_contract(model, address):
+    """
+    Returns the model instance with the given address, fetched once per block scope
+    :raise model.DoesNotExist
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return model.objects.get(address=address)
+    return identity_map.get(model, address, lambda: model.objects.get(address=address))
+
+
+def get_outcome_token(model, event_address, index):
+    """
+    Returns the outcome token of the event with the given index, fetched once per block scope
+    :raise model.DoesNotExist
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return model.objects.get(event=event_address, index=index)
+    return identity_map.get(model, (event_address, index),
+                            lambda: model.objects.get(event=event_address, index=index))
+
+
+def prefetch_contracts(model, addresses):
+    """Loads the given contracts into the active identity map with one query"""
+    identity_map = get_identity_map()
+    if identity_map is None or not addresses:
+        return {}
+
+    instances = model.objects.in_bulk(list(addresses))
+    for address, instance in instances.items():
+        identity_map.add(model, address, instance)
+    return instances
+
+
+def prefetch_outcome_tokens(model, event_addresses):
+    """Loads the outcome tokens of the given events into the active identity map with one query"""
+    identity_map = get_identity_map()
+    if identity_map is None or not event_addresses:
+        return
+
+    for outcome_token in model.objects.filter(event__in=list(event_addresses)):
+        identity_map.add(model, (outcome_token.event_id, outcome_token.index), outcome_token)
+
+
+def save_contract(instance):
+    """Saves the instance when the block is committed, right away outside of a block scope"""
+    identity_map = get_identity_map()
+    if identity_map is None:
+        instance.save()
+    else:
+        identity_map.mark_dirty(instance)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from django.db import migrations, models
+
+
+def create_index_concurrently(table, columns, name, method=None, unique=False):
+    """
+    Builds the index with CREATE INDEX CONCURRENTLY, so the table keeps accepting writes while the index
+    is built. Migrations using it must set atomic = False.
+    :param columns: column names, prefixed with '-' for a descending column
+    :param method: index access method, e.g. 'gin', btree by default
+    """
+    columns = [
+        '"{}" DESC'.format(column[1:]) if column.startswith('-') else '"{}"'.format(column)
+        for column in columns
+    ]
+    return migrations.RunSQL(
+        'CREATE {}INDEX CONCURRENTLY IF NOT EXISTS {} ON {}{} ({})'.format(
+            'UNIQUE ' if unique else '', name, table, ' USING {}'.format(method) if method else '', ', '.join(columns)),
+        'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name),
+    )
+
+
+def get_model_fields(columns):
+    return [column[:-3] if column.endswith('_id') else column for column in columns]
+
+
+def add_index_concurrently(model_name, table, columns, name, index_class=models.Index, method=None):
+    """
+    Adds the index to the model state, the database index is built with create_index_concurrently
+    :param columns: column names, prefixed with '-' for a descending column
+    """
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[create_index_concurrently(table, columns, name, method=method)],
+        state_operations=[
+            migrations.AddIndex(model_name=model_name, index=index_class(fields=get_model_fields(columns), name=name)),
+        ],
+    )
+
+
+def add_unique_together_concurrently(model_name, table, columns, name):
+    """
+    Adds the unique together constraint to the model state. The database builds its unique index
+    concurrently, then attaches the constraint to it, which only locks the table for an instant
+    """
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[
+            create_index_concurrently(table, columns, name, unique=True),
+            migrations.RunSQL(
+                'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}'.format(table=table, name=name),
+                # dropping the constraint drops its index too
+                'ALTER TABLE {table} DROP CONSTRAINT {name}'.format(table=table, name=name),
+            ),
+        ],
+        state_operations=[
+            migrations.AlterUniqueTogether(name=model_name, unique_together=set([tuple(get_model_fields(columns))])),
+        ],
+    )
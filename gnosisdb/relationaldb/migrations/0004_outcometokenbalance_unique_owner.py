@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from relationaldb.migration_operations import add_unique_together_concurrently
+
+
+def merge_duplicated_balances(apps, schema_editor):
+    """Merges the balances sharing the same (owner, outcome_token) into one row"""
+    OutcomeTokenBalance = apps.get_model('relationaldb', 'OutcomeTokenBalance')
+    duplicates = OutcomeTokenBalance.objects.values('owner', 'outcome_token').annotate(
+        n_balances=Count('id'), total=Sum('balance')).filter(n_balances__gt=1)
+
+    for duplicate in duplicates:
+        balances = OutcomeTokenBalance.objects.filter(owner=duplicate['owner'],
+                                                      outcome_token=duplicate['outcome_token']).order_by('id')
+        kept = balances.first()
+        balances.exclude(id=kept.id).delete()
+        kept.balance = duplicate['total']
+        kept.save()
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0003_auto_20170808_1612'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicated_balances, migrations.RunPython.noop, atomic=True),
+        add_unique_together_concurrently('outcometokenbalance', 'relationaldb_outcometokenbalance',
+                                         ['owner', 'outcome_token_id'], 'outcometokenbalance_owner_token_uniq'),
+    ]
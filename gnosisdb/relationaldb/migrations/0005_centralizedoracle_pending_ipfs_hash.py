@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 10:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0004_outcometokenbalance_unique_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centralizedoracle',
+            name='pending_ipfs_hash',
+            field=models.CharField(blank=True, max_length=46, null=True),
+        ),
+    ]
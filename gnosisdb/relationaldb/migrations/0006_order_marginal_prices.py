@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 11:20
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+from gnosisdb.utils import calc_lmsr_marginal_prices_history
+
+
+# orders updated per statement
+FILL_BATCH_SIZE = 1000
+
+
+def update_marginal_prices(schema_editor, order_prices):
+    """Stores the marginal prices of a batch of orders with one statement (UPDATE ... FROM VALUES)"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE relationaldb_order SET marginal_prices = prices.marginal_prices '
+            'FROM (VALUES {}) AS prices (id, marginal_prices) WHERE relationaldb_order.id = prices.id'.format(
+                ', '.join(['(%s, %s::double precision[])'] * len(order_prices))),
+            [param for order_price in order_prices for param in order_price]
+        )
+
+
+def fill_marginal_prices(apps, schema_editor):
+    """Computes the marginal prices of the existing orders, one batch per market"""
+    Market = apps.get_model('relationaldb', 'Market')
+    Order = apps.get_model('relationaldb', 'Order')
+
+    for market in Market.objects.filter(funding__gt=0).only('address', 'funding').iterator():
+        orders = list(Order.objects.filter(market=market).only('id', 'net_outcome_tokens_sold'))
+        orders = [order for order in orders if len(order.net_outcome_tokens_sold) > 1]
+        if not orders:
+            continue
+
+        prices_history = calc_lmsr_marginal_prices_history(
+            [order.net_outcome_tokens_sold for order in orders], market.funding)
+        order_prices = [(order.id, [float(price) for price in marginal_prices])
+                        for order, marginal_prices in zip(orders, prices_history)]
+        for start in range(0, len(order_prices), FILL_BATCH_SIZE):
+            update_marginal_prices(schema_editor, order_prices[start:start + FILL_BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0005_centralizedoracle_pending_ipfs_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='marginal_prices',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), null=True, size=None),
+        ),
+        migrations.RunPython(fill_marginal_prices, migrations.RunPython.noop),
+    ]
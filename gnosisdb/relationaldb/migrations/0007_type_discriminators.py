@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from relationaldb.migration_operations import create_index_concurrently
+
+
+# (parent model, discriminator field, [(child relation, type name)])
+TYPE_DISCRIMINATORS = (
+    ('Oracle', 'oracle_type', (('centralizedoracle', 'CENTRALIZED'), ('ultimateoracle', 'ULTIMATE'))),
+    ('Event', 'event_type', (('categoricalevent', 'CATEGORICAL'), ('scalarevent', 'SCALAR'))),
+    ('EventDescription', 'description_type', (('categoricaleventdescription', 'CATEGORICAL'),
+                                              ('scalareventdescription', 'SCALAR'))),
+    ('Order', 'order_type', (('buyorder', 'BUY'), ('sellorder', 'SELL'), ('shortsellorder', 'SHORT SELL'))),
+)
+
+
+def fill_type_discriminators(apps, schema_editor):
+    """Sets the discriminator of the existing rows from the child table they have a row in"""
+    for model_name, type_field, children in TYPE_DISCRIMINATORS:
+        model = apps.get_model('relationaldb', model_name)
+        for child_relation, type_name in children:
+            model.objects.filter(**{child_relation + '__isnull': False}).update(**{type_field: type_name})
+
+
+def add_discriminator_field(model_name, name, choices):
+    """
+    Adds the indexed discriminator field to the model state. The database column is added without index,
+    the index is built concurrently once the column is filled
+    """
+    def get_field(db_index):
+        return models.CharField(choices=choices, db_index=db_index, max_length=20, null=True)
+
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[migrations.AddField(model_name=model_name, name=name, field=get_field(False))],
+        state_operations=[migrations.AddField(model_name=model_name, name=name, field=get_field(True))],
+    )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, each fill statement commits on its own
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0006_order_marginal_prices'),
+    ]
+
+    operations = [
+        add_discriminator_field('oracle', 'oracle_type',
+                                [('CENTRALIZED', 'Centralized Oracle'), ('ULTIMATE', 'Ultimate Oracle')]),
+        add_discriminator_field('event', 'event_type',
+                                [('CATEGORICAL', 'Categorical Event'), ('SCALAR', 'Scalar Event')]),
+        add_discriminator_field('eventdescription', 'description_type',
+                                [('CATEGORICAL', 'Categorical Event Description'),
+                                 ('SCALAR', 'Scalar Event Description')]),
+        add_discriminator_field('order', 'order_type',
+                                [('BUY', 'Buy Order'), ('SELL', 'Sell Order'), ('SHORT SELL', 'Short Sell Order')]),
+        migrations.RunPython(fill_type_discriminators, migrations.RunPython.noop),
+        create_index_concurrently('relationaldb_oracle', ['oracle_type'], 'oracle_oracle_type_idx'),
+        create_index_concurrently('relationaldb_event', ['event_type'], 'event_event_type_idx'),
+        create_index_concurrently('relationaldb_eventdescription', ['description_type'],
+                                  'eventdescription_description_type_idx'),
+        create_index_concurrently('relationaldb_order', ['order_type'], 'order_order_type_idx'),
+    ]
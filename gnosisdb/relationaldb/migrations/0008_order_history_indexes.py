@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 12:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+from relationaldb.migration_operations import add_index_concurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0007_type_discriminators'),
+    ]
+
+    operations = [
+        add_index_concurrently('order', 'relationaldb_order', ['market_id', 'creation_date_time', 'id'],
+                               'order_market_history_idx'),
+        add_index_concurrently('order', 'relationaldb_order', ['market_id', 'sender', 'creation_date_time', 'id'],
+                               'order_sender_history_idx'),
+    ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 13:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+INTERVAL_TRUNCATIONS = {
+    '1m': ('second', 'microsecond'),
+    '1h': ('minute', 'second', 'microsecond'),
+    '1d': ('hour', 'minute', 'second', 'microsecond'),
+}
+
+
+def fill_candles(apps, schema_editor):
+    """Aggregates the candles of the existing orders, one batch per market"""
+    Market = apps.get_model('relationaldb', 'Market')
+    Order = apps.get_model('relationaldb', 'Order')
+    Candle = apps.get_model('relationaldb', 'Candle')
+
+    for market_address in Market.objects.values_list('address', flat=True).iterator():
+        orders = Order.objects.filter(market=market_address, marginal_prices__isnull=False).order_by(
+            'creation_date_time', 'id').values_list(
+            'creation_date_time', 'outcome_token__index', 'outcome_token_count', 'marginal_prices')
+
+        candles = {}
+        for creation_date_time, traded_index, token_count, marginal_prices in orders.iterator():
+            for interval, fields in INTERVAL_TRUNCATIONS.items():
+                start = creation_date_time.replace(**dict((field, 0) for field in fields))
+                for outcome_index, price in enumerate(marginal_prices):
+                    volume = token_count if outcome_index == traded_index else 0
+                    key = (interval, start, outcome_index)
+                    if key not in candles:
+                        candles[key] = Candle(market_id=market_address, interval=interval, start=start,
+                                              outcome_index=outcome_index, open=price, high=price, low=price,
+                                              close=price, volume=volume)
+                    else:
+                        candle = candles[key]
+                        candle.high = max(candle.high, price)
+                        candle.low = min(candle.low, price)
+                        candle.close = price
+                        candle.volume += volume
+
+        Candle.objects.bulk_create(candles.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0008_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome_index', models.PositiveIntegerField()),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('start', models.DateTimeField()),
+                ('open', models.FloatField()),
+                ('high', models.FloatField()),
+                ('low', models.FloatField()),
+                ('close', models.FloatField()),
+                ('volume', models.DecimalField(decimal_places=0, default=0, max_digits=80)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='relationaldb.Market')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='candle',
+            unique_together=set([('market', 'interval', 'start', 'outcome_index')]),
+        ),
+        migrations.RunPython(fill_candles, migrations.RunPython.noop),
+    ]
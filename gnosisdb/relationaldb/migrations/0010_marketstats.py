@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 13:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_market_stats(apps, schema_editor):
+    """
+    Computes the statistics of the existing markets from their orders. The open interest is the net amount
+    of outcome tokens transferred out of the market, as maintained by MarketStatsManager.add_transfer.
+    Transfers are not stored, so it is rebuilt by replaying the transfers each order made between the
+    market and its trader
+    """
+    Market = apps.get_model('relationaldb', 'Market')
+    Order = apps.get_model('relationaldb', 'Order')
+    MarketStats = apps.get_model('relationaldb', 'MarketStats')
+
+    stats = []
+    for market_address, net_outcome_tokens_sold in Market.objects.values_list(
+            'address', 'net_outcome_tokens_sold').iterator():
+        market_stats = MarketStats(market_id=market_address)
+        senders = set()
+        orders = Order.objects.filter(market=market_address).values_list(
+            'order_type', 'sender', 'outcome_token_count', 'buyorder__cost', 'sellorder__profit',
+            'shortsellorder__cost')
+        for order_type, sender, token_count, buy_cost, sell_profit, short_sell_cost in orders.iterator():
+            senders.add(sender)
+            market_stats.trades += 1
+            if order_type == 'BUY':
+                market_stats.volume += buy_cost
+                market_stats.open_interest += token_count
+            elif order_type == 'SELL':
+                market_stats.volume += sell_profit
+                market_stats.open_interest -= token_count
+            elif order_type == 'SHORT SELL':
+                # the trader receives every outcome but the shorted one
+                market_stats.volume += short_sell_cost
+                market_stats.open_interest += token_count * (len(net_outcome_tokens_sold) - 1)
+        market_stats.traders = len(senders)
+        stats.append(market_stats)
+
+    MarketStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0009_candle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketStats',
+            fields=[
+                ('market', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='relationaldb.Market')),
+                ('volume', models.DecimalField(db_index=True, decimal_places=0, default=0, max_digits=80)),
+                ('trades', models.PositiveIntegerField(db_index=True, default=0)),
+                ('traders', models.PositiveIntegerField(db_index=True, default=0)),
+                ('open_interest', models.DecimalField(db_index=True, decimal_places=0, default=0, max_digits=80)),
+            ],
+        ),
+        migrations.RunPython(fill_market_stats, migrations.RunPython.noop),
+    ]
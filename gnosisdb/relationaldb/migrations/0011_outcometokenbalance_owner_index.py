@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 14:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+from relationaldb.migration_operations import add_index_concurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0010_marketstats'),
+    ]
+
+    operations = [
+        add_index_concurrently('outcometokenbalance', 'relationaldb_outcometokenbalance', ['owner', 'id'],
+                               'balance_owner_idx'),
+    ]
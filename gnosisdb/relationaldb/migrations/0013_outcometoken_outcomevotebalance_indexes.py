@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+from relationaldb.migration_operations import add_index_concurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0012_outcometokenbalance_balance_index'),
+    ]
+
+    operations = [
+        add_index_concurrently('outcometoken', 'relationaldb_outcometoken', ['event_id', 'index'],
+                               'outcometoken_event_index_idx'),
+        add_index_concurrently('outcomevotebalance', 'relationaldb_outcomevotebalance',
+                               ['ultimate_oracle_id', 'address'], 'outcomevotebalance_oracle_idx'),
+    ]
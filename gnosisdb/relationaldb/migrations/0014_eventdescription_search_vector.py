@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 15:25
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from relationaldb.migration_operations import add_index_concurrently
+
+# same weights as EventDescription.update_search_vector
+FILL_SEARCH_VECTOR = """
+UPDATE relationaldb_eventdescription description SET search_vector =
+    setweight(to_tsvector('english'::regconfig, coalesce(description.title, '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, coalesce(description.description, '')), 'B') ||
+    setweight(to_tsvector('english'::regconfig, coalesce((
+        SELECT array_to_string(categorical.outcomes, ' ')
+        FROM relationaldb_categoricaleventdescription categorical
+        WHERE categorical.eventdescription_ptr_id = description.id
+    ), '')), 'C')
+"""
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, the fill then runs in autocommit
+    atomic = False
+
+    dependencies = [
+        ('relationaldb', '0013_outcometoken_outcomevotebalance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventdescription',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.RunSQL(FILL_SEARCH_VECTOR, migrations.RunSQL.noop),
+        add_index_concurrently('eventdescription', 'relationaldb_eventdescription', ['search_vector'],
+                               'eventdescription_search_idx', index_class=django.contrib.postgres.indexes.GinIndex,
+                               method='gin'),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 17:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# generations of gnosisdb.block_cache, started from the clock in milliseconds like the former cache counter
+CREATE_SEQUENCE = """
+CREATE SEQUENCE IF NOT EXISTS block_cache_generation;
+SELECT setval('block_cache_generation', (extract(epoch from now()) * 1000)::bigint);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0014_eventdescription_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEQUENCE, 'DROP SEQUENCE IF EXISTS block_cache_generation'),
+    ]
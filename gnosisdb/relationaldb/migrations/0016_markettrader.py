@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 17:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FILL_MARKET_TRADERS = """
+INSERT INTO relationaldb_markettrader (market_id, sender)
+SELECT DISTINCT market_id, sender FROM relationaldb_order
+ON CONFLICT (market_id, sender) DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0015_block_cache_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketTrader',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender', models.CharField(max_length=40)),
+                ('market', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='relationaldb.Market')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='markettrader',
+            unique_together=set([('market', 'sender')]),
+        ),
+        migrations.RunSQL(FILL_MARKET_TRADERS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 18:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# the event contract creates one outcome token per outcome
+FILL_OUTCOME_COUNT = """
+UPDATE relationaldb_categoricalevent categorical SET outcome_count = (
+    SELECT count(*) FROM relationaldb_outcometoken token WHERE token.event_id = categorical.event_ptr_id
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationaldb', '0016_markettrader'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categoricalevent',
+            name='outcome_count',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(FILL_OUTCOME_COUNT, migrations.RunSQL.noop),
+    ]
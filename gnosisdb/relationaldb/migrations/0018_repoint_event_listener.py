@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-18 18:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.utils import timezone
+
+ETH_EVENTS_LISTENER = 'django_eth_events.tasks.event_listener'
+INGESTION_LISTENER = 'chainevents.tasks.event_listener'
+
+
+def repoint_periodic_tasks(apps, from_task, to_task):
+    PeriodicTask = apps.get_model('djcelery', 'PeriodicTask')
+    PeriodicTasks = apps.get_model('djcelery', 'PeriodicTasks')
+    if PeriodicTask.objects.filter(task=from_task).update(task=to_task):
+        # the beat scheduler reloads the periodic tasks once their last change date moves
+        PeriodicTasks.objects.update_or_create(ident=1, defaults={'last_update': timezone.now()})
+
+
+def repoint_event_listener(apps, schema_editor):
+    """
+    The periodic tasks running the django_eth_events listener run chainevents.tasks.event_listener instead.
+    It takes the ingestion lock, so it never applies blocks while the ingest_blocks daemon runs
+    """
+    repoint_periodic_tasks(apps, ETH_EVENTS_LISTENER, INGESTION_LISTENER)
+
+
+def restore_event_listener(apps, schema_editor):
+    repoint_periodic_tasks(apps, INGESTION_LISTENER, ETH_EVENTS_LISTENER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcelery', '0001_initial'),
+        ('relationaldb', '0017_categoricalevent_outcome_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(repoint_event_listener, restore_event_listener),
+    ]
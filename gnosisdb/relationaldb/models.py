@@ -1,7 +1,10 @@
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import models, connection
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.utils.encoding import force_text
 
 # ==================================
 #       Abstract classes
@@ -34,20 +37,55 @@ class ContractCreatedByFactory(Contract, BlockTimeStamped):
         abstract = True
 
 
+class TypeDiscriminated(models.Model):
+    """
+    Parent of a multi-table inheritance hierarchy, storing the type of its concrete child in type_field
+    so the child table can be reached without probing every child table
+    """
+    type_field = None # name of the discriminator field
+    type_name = None # discriminator value of the child class
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self.type_name is not None:
+            setattr(self, self.type_field, self.type_name)
+        super(TypeDiscriminated, self).save(*args, **kwargs)
+
+    def get_type(self):
+        """Returns the type of the concrete child, None if unknown"""
+        return getattr(self, self.type_field)
+
+
 # ==================================
 #       Concrete classes
 # ==================================
 
 
-class Oracle(ContractCreatedByFactory):
+class Oracle(ContractCreatedByFactory, TypeDiscriminated):
     """Parent class of the Oracle contract"""
+    oracle_types = (
+        ('CENTRALIZED', 'Centralized Oracle'),
+        ('ULTIMATE', 'Ultimate Oracle'),
+    )
+    type_field = 'oracle_type'
+
+    oracle_type = models.CharField(max_length=20, choices=oracle_types, null=True, db_index=True)
     is_outcome_set = models.BooleanField(default=False)
     outcome = models.DecimalField(max_digits=80, decimal_places=0, blank=True, null=True)
 
 
 # Events
-class Event(ContractCreatedByFactory):
+class Event(ContractCreatedByFactory, TypeDiscriminated):
     """Parent class of the event's classes."""
+    event_types = (
+        ('CATEGORICAL', 'Categorical Event'),
+        ('SCALAR', 'Scalar Event'),
+    )
+    type_field = 'event_type'
+
+    event_type = models.CharField(max_length=20, choices=event_types, null=True, db_index=True)
     oracle = models.ForeignKey(Oracle, related_name='event_oracle') # Reference to the Oracle contract
     collateral_token = models.CharField(max_length=40, db_index=True) # The ERC20 token address used in the event to exchange outcome token shares
     is_winning_outcome_set = models.BooleanField(default=False)
@@ -57,16 +95,40 @@ class Event(ContractCreatedByFactory):
 
 class ScalarEvent(Event):
     """Events with continuous domain of possible outcomes between two boundaries: lower and upper bound"""
+    type_name = 'SCALAR'
+
     lower_bound = models.DecimalField(max_digits=80, decimal_places=0)
     upper_bound = models.DecimalField(max_digits=80, decimal_places=0)
 
 
 class CategoricalEvent(Event):
     """Events with discrete domain of possible outcomes"""
-    pass
+    type_name = 'CATEGORICAL'
+
+    outcome_count = models.PositiveIntegerField() # number of outcomes, and of outcome tokens, of the event
 
 
 # Tokens
+class OutcomeTokenManager(models.Manager):
+    """Single statement supply updates"""
+
+    def add_supplies(self, supply_deltas):
+        """
+        Adds the supply changes of a batch to their outcome tokens with one statement (UPDATE ... FROM VALUES)
+        :param supply_deltas: dictionary outcome token address -> delta
+        """
+        supply_deltas = [(address, delta) for address, delta in supply_deltas.items() if delta]
+        if not supply_deltas:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET total_supply = {table}.total_supply + deltas.delta '
+                'FROM (VALUES {values}) AS deltas (address, delta) WHERE {table}.address = deltas.address'.format(
+                    table=self.model._meta.db_table, values=', '.join(['(%s, %s::numeric)'] * len(supply_deltas))),
+                [param for supply_delta in supply_deltas for param in supply_delta]
+            )
+
+
 class OutcomeToken(Contract):
     """Representation of the ERC20 token related with its respective outcome in the event.
     This token is created by the Event smart contract letting the event to control supply."""
@@ -78,6 +140,68 @@ class OutcomeToken(Contract):
     # total_supply: total amount of outcome tokens generated by the event for that outcome
     total_supply = models.DecimalField(max_digits=80, decimal_places=0, default=0)
 
+    objects = OutcomeTokenManager()
+
+    class Meta:
+        # outcome token of an event by index, see identity_map.get_outcome_token
+        indexes = [
+            models.Index(fields=['event', 'index'], name='outcometoken_event_index_idx'),
+        ]
+
+
+class OutcomeTokenBalanceManager(models.Manager):
+    """Single statement balance updates, safe against concurrent writers"""
+
+    def _fetch_balance(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql.format(table=self.model._meta.db_table), params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return self.model(id=row[0], owner=row[1], outcome_token_id=row[2], balance=row[3])
+
+    def add_balance(self, owner, outcome_token_address, amount):
+        """
+        Adds amount to the owner balance, creating the balance if it doesn't exist (INSERT ... ON CONFLICT)
+        :return: the updated OutcomeTokenBalance
+        """
+        return self._fetch_balance(
+            'INSERT INTO {table} (owner, outcome_token_id, balance) VALUES (%s, %s, %s) '
+            'ON CONFLICT (owner, outcome_token_id) DO UPDATE SET balance = {table}.balance + EXCLUDED.balance '
+            'RETURNING id, owner, outcome_token_id, balance',
+            [owner, outcome_token_address, amount]
+        )
+
+    def add_balances(self, balance_deltas):
+        """
+        Adds the balance changes of a batch with one statement, creating the missing balances (INSERT ... ON CONFLICT)
+        :param balance_deltas: dictionary (owner, outcome token address) -> delta
+        """
+        if not balance_deltas:
+            return
+        values, params = [], []
+        for (owner, outcome_token_address), amount in balance_deltas.items():
+            values.append('(%s, %s, %s)')
+            params += [owner, outcome_token_address, amount]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {table} (owner, outcome_token_id, balance) VALUES {values} '
+                'ON CONFLICT (owner, outcome_token_id) DO UPDATE SET balance = {table}.balance + EXCLUDED.balance'.format(
+                    table=self.model._meta.db_table, values=', '.join(values)),
+                params
+            )
+
+    def subtract_balance(self, owner, outcome_token_address, amount):
+        """
+        Subtracts amount from an existing owner balance
+        :return: the updated OutcomeTokenBalance or None if the owner has no balance
+        """
+        return self._fetch_balance(
+            'UPDATE {table} SET balance = balance - %s WHERE owner = %s AND outcome_token_id = %s '
+            'RETURNING id, owner, outcome_token_id, balance',
+            [amount, owner, outcome_token_address]
+        )
+
 
 class OutcomeTokenBalance(models.Model):
     """Outcome token balance owned by an ethereum address owner"""
@@ -85,35 +209,82 @@ class OutcomeTokenBalance(models.Model):
     outcome_token = models.ForeignKey(OutcomeToken)
     balance = models.DecimalField(max_digits=80, decimal_places=0, default=0)
 
+    objects = OutcomeTokenBalanceManager()
+
+    class Meta:
+        unique_together = ('owner', 'outcome_token',)
+        indexes = [
+            # keyset pagination of the owner portfolio
+            models.Index(fields=['owner', 'id'], name='balance_owner_idx'),
+            # non-zero balances of an outcome token, read per outcome token of the event by the market shares
+            models.Index(fields=['outcome_token', '-balance'], name='balance_token_balance_idx'),
+        ]
+
 
 # Event Descriptions
-class EventDescription(models.Model):
+class EventDescription(TypeDiscriminated):
     """Meta information of the event taken from IPFS"""
+    description_types = (
+        ('CATEGORICAL', 'Categorical Event Description'),
+        ('SCALAR', 'Scalar Event Description'),
+    )
+    type_field = 'description_type'
+
+    description_type = models.CharField(max_length=20, choices=description_types, null=True, db_index=True)
     title = models.TextField()
     description = models.TextField()
     resolution_date = models.DateTimeField()
     ipfs_hash = models.CharField(max_length=46, unique=True)
+    # weighted title, description and categorical outcomes, maintained on save
+    search_vector = SearchVectorField(null=True)
+    search_config = 'english'
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='eventdescription_search_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        super(EventDescription, self).save(*args, **kwargs)
+        self.update_search_vector()
+
+    def update_search_vector(self):
+        """Indexes the title, the description and the outcomes of categorical descriptions, in one update"""
+        outcomes = ' '.join(force_text(outcome) for outcome in getattr(self, 'outcomes', None) or [])
+        vector = SearchVector('title', weight='A', config=self.search_config) + \
+            SearchVector('description', weight='B', config=self.search_config) + \
+            SearchVector(models.Value(outcomes, output_field=models.TextField()), weight='C', config=self.search_config)
+        EventDescription.objects.filter(pk=self.pk).update(search_vector=vector)
 
 
 class ScalarEventDescription(EventDescription):
     """Description for the Scalar Event"""
+    type_name = 'SCALAR'
+
     unit = models.TextField() # Example. USD, EUR, ETH
     decimals = models.PositiveIntegerField() # the unit precision
 
 
 class CategoricalEventDescription(EventDescription):
     """Description for the Categorical Event"""
+    type_name = 'CATEGORICAL'
+
     outcomes = ArrayField(models.TextField()) # List of outcomes
 
 
 # Oracles
 class CentralizedOracle(Oracle):
     """Centralized oracle model"""
+    type_name = 'CENTRALIZED'
+
     owner = models.CharField(max_length=40, db_index=True) # owner can be updated
     event_description = models.ForeignKey(EventDescription, unique=False, null=True)
+    pending_ipfs_hash = models.CharField(max_length=46, null=True, blank=True) # description not yet fetched from IPFS
 
 
 class UltimateOracle(Oracle):
+    type_name = 'ULTIMATE'
+
     forwarded_oracle = models.ForeignKey(Oracle, related_name='ultimate_oracle_forwarded_oracle', null=True)
     collateral_token = models.CharField(max_length=40, db_index=True)
     spread_multiplier = models.PositiveIntegerField()
@@ -133,6 +304,12 @@ class OutcomeVoteBalance(models.Model):
     address = models.CharField(max_length=40, db_index=True)  # sender
     balance = models.DecimalField(max_digits=80, decimal_places=0)
 
+    class Meta:
+        # vote balance of a sender in an ultimate oracle
+        indexes = [
+            models.Index(fields=['ultimate_oracle', 'address'], name='outcomevotebalance_oracle_idx'),
+        ]
+
 
 # Market
 class Market(ContractCreatedByFactory):
@@ -154,22 +331,180 @@ class Market(ContractCreatedByFactory):
     collected_fees = models.DecimalField(max_digits=80, decimal_places=0)
 
 
-class Order(BlockTimeStamped):
+class Order(BlockTimeStamped, TypeDiscriminated):
     """Parent class defining a market related order"""
+    order_types = (
+        ('BUY', 'Buy Order'),
+        ('SELL', 'Sell Order'),
+        ('SHORT SELL', 'Short Sell Order'),
+    )
+    type_field = 'order_type'
+
+    order_type = models.CharField(max_length=20, choices=order_types, null=True, db_index=True)
     market = models.ForeignKey(Market)
     sender = models.CharField(max_length=40, db_index=True)
     outcome_token = models.ForeignKey(OutcomeToken, to_field='address', null=True)
     outcome_token_count = models.DecimalField(max_digits=80, decimal_places=0) # the amount of outcome tokens bought or sold
     net_outcome_tokens_sold = ArrayField(models.DecimalField(max_digits=80, decimal_places=0)) # represents the outcome tokens distrubition at the buy/sell order moment
+    marginal_prices = ArrayField(models.FloatField(), null=True) # marginal price of every outcome after the order
+
+    class Meta:
+        # keyset pagination of the market and participant histories
+        indexes = [
+            models.Index(fields=['market', 'creation_date_time', 'id'], name='order_market_history_idx'),
+            models.Index(fields=['market', 'sender', 'creation_date_time', 'id'], name='order_sender_history_idx'),
+        ]
 
 
 class BuyOrder(Order):
+    type_name = 'BUY'
+
     cost = models.DecimalField(max_digits=80, decimal_places=0)
 
 
 class SellOrder(Order):
+    type_name = 'SELL'
+
     profit = models.DecimalField(max_digits=80, decimal_places=0)
 
 
 class ShortSellOrder(Order):
+    type_name = 'SHORT SELL'
+
     cost = models.DecimalField(max_digits=80, decimal_places=0)
+
+
+class MarketTrader(models.Model):
+    """Sender of at least one order in a market, counted once in the market traders"""
+    market = models.ForeignKey(Market)
+    sender = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = ('market', 'sender')
+
+
+class MarketStatsManager(models.Manager):
+    """Single statement statistics updates, in the transaction of the order or transfer"""
+
+    def add_order(self, order, volume):
+        """
+        Counts the order and its collateral volume in the stats of its market, and its sender as a new
+        trader if it wasn't a trader of the market yet. The trader and the stats are upserted by one
+        statement (INSERT ... ON CONFLICT)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'WITH new_trader AS ('
+                'INSERT INTO {trader_table} (market_id, sender) VALUES (%s, %s) '
+                'ON CONFLICT (market_id, sender) DO NOTHING RETURNING 1) '
+                'INSERT INTO {table} (market_id, volume, trades, traders, open_interest) '
+                'VALUES (%s, %s, 1, (SELECT count(*) FROM new_trader), 0) '
+                'ON CONFLICT (market_id) DO UPDATE SET volume = {table}.volume + EXCLUDED.volume, '
+                'trades = {table}.trades + 1, traders = {table}.traders + EXCLUDED.traders'.format(
+                    table=self.model._meta.db_table, trader_table=MarketTrader._meta.db_table),
+                [order.market_id, order.sender, order.market_id, volume]
+            )
+
+    def add_transfer(self, from_address, to_address, value):
+        """
+        Outcome tokens leaving a market are held by its traders, those sent back to it are not anymore.
+        Callers only pass transfers from or to a market
+        """
+        if from_address == to_address:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET open_interest = open_interest + CASE market_id WHEN %s THEN %s ELSE %s END '
+                'WHERE market_id IN (%s, %s)'.format(table=self.model._meta.db_table),
+                # negated here, "-%s" renders a negative value as "--N", which comments out the rest
+                [from_address, value, -value, from_address, to_address]
+            )
+
+    def add_open_interest(self, open_interest_deltas):
+        """
+        Applies the open interest changes of a batch of transfers, one update per market
+        :param open_interest_deltas: dictionary market address -> delta
+        """
+        for market_address, delta in open_interest_deltas.items():
+            if delta:
+                self.filter(market=market_address).update(open_interest=models.F('open_interest') + delta)
+
+
+class MarketStats(models.Model):
+    """Trading statistics of a market, maintained as orders and outcome token transfers are ingested"""
+    market = models.OneToOneField(Market, primary_key=True, related_name='stats')
+    volume = models.DecimalField(max_digits=80, decimal_places=0, default=0, db_index=True) # collateral paid and received by traders
+    trades = models.PositiveIntegerField(default=0, db_index=True)
+    traders = models.PositiveIntegerField(default=0, db_index=True) # distinct order senders
+    open_interest = models.DecimalField(max_digits=80, decimal_places=0, default=0, db_index=True) # outcome tokens transferred out of the market minus those transferred back
+
+    objects = MarketStatsManager()
+
+
+class CandleManager(models.Manager):
+    """Incremental candle maintenance, one statement per order"""
+
+    def add_order(self, order):
+        """
+        Adds the marginal prices after the order to the candles of every outcome of its market, in every
+        interval (INSERT ... ON CONFLICT). The volume of the traded outcome grows by the order token count.
+        Orders must be added in chronological order, the last one added closes the candle.
+        """
+        if not order.marginal_prices:
+            return
+
+        traded_index = order.outcome_token.index if order.outcome_token_id else None
+        values, params = [], []
+        for interval, _ in self.model.intervals:
+            start = self.model.get_start(order.creation_date_time, interval)
+            for outcome_index, price in enumerate(order.marginal_prices):
+                volume = order.outcome_token_count if outcome_index == traded_index else 0
+                values.append('(%s, %s, %s, %s, %s, %s, %s, %s, %s)')
+                params += [order.market_id, outcome_index, interval, start, price, price, price, price, volume]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {table} (market_id, outcome_index, "interval", start, open, high, low, close, volume) '
+                'VALUES {values} '
+                'ON CONFLICT (market_id, outcome_index, "interval", start) DO UPDATE SET '
+                'high = GREATEST({table}.high, EXCLUDED.high), low = LEAST({table}.low, EXCLUDED.low), '
+                'close = EXCLUDED.close, volume = {table}.volume + EXCLUDED.volume'.format(
+                    table=self.model._meta.db_table, values=', '.join(values)),
+                params
+            )
+
+
+class Candle(models.Model):
+    """Open, high, low and close marginal price of a market outcome and its traded volume over an interval"""
+    intervals = (
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    )
+    # datetime fields zeroed at the start of each interval
+    interval_truncations = {
+        '1m': ('second', 'microsecond'),
+        '1h': ('minute', 'second', 'microsecond'),
+        '1d': ('hour', 'minute', 'second', 'microsecond'),
+    }
+
+    market = models.ForeignKey(Market)
+    outcome_index = models.PositiveIntegerField()
+    interval = models.CharField(max_length=2, choices=intervals)
+    start = models.DateTimeField()
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.DecimalField(max_digits=80, decimal_places=0, default=0) # outcome tokens traded
+
+    objects = CandleManager()
+
+    class Meta:
+        # also serves the range reads of a market interval
+        unique_together = ('market', 'interval', 'start', 'outcome_index',)
+
+    @classmethod
+    def get_start(cls, date_time, interval):
+        """Returns the start of the interval containing date_time"""
+        return date_time.replace(**dict((field, 0) for field in cls.interval_truncations[interval]))
@@ -1,12 +1,18 @@
 from rest_framework import serializers
 from rest_framework.fields import CharField
 from relationaldb import models
+from relationaldb.identity_map import get_contract, get_outcome_token, save_contract
 from ipfs.ipfs import Ipfs
+from ipfs.cache import IPFS_HASH_REGEX
+from gnosisdb.utils import calc_market_marginal_prices
+from chainevents.address_getters import MarketAddressGetter
 from datetime import datetime
 from ipfsapi.exceptions import ErrorResponse
 from time import mktime
 from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 
 
 logger = get_task_logger(__name__)
@@ -123,66 +129,141 @@ class ContractNotTimestampted(ContractSerializer):
 #                 Custom Fields
 # ========================================================
 
+def create_event_description(ipfs_hash, event_description_json):
+    """
+    Creates the Scalar or Categorical event description from its IPFS json object
+    :raise ValidationError
+    """
+    if not event_description_json.get('title'):
+        raise serializers.ValidationError('Missing title field')
+
+    if not event_description_json.get('resolutionDate'):
+        raise serializers.ValidationError('Missing resolution date field')
+
+    if not event_description_json.get('description'):
+        raise serializers.ValidationError('Missing description field')
+
+    if 'outcomes' in event_description_json:
+        categorical_json = {
+            'ipfs_hash': ipfs_hash,
+            'title': event_description_json['title'],
+            'description': event_description_json['description'],
+            'resolution_date': event_description_json['resolutionDate'],
+            'outcomes': event_description_json['outcomes']
+        }
+        # categorical
+        return models.CategoricalEventDescription.objects.create(**categorical_json)
+
+    elif 'decimals' in event_description_json and 'unit' in event_description_json:
+        scalar_json = {
+            'ipfs_hash': ipfs_hash,
+            'title': event_description_json['title'],
+            'description': event_description_json['description'],
+            'resolution_date': event_description_json['resolutionDate'],
+            'decimals': event_description_json['decimals'],
+            'unit': event_description_json['unit']
+        }
+        # scalar
+        return models.ScalarEventDescription.objects.create(**scalar_json)
+    else:
+        raise serializers.ValidationError('Event must be categorical or scalar')
+
+
+class IpfsFetchError(serializers.ValidationError):
+    """The event description couldn't be fetched from IPFS, unlike a description which is not valid it may
+    be fetched later"""
+
+
+def fetch_event_description(ipfs_hash, timeout=None):
+    """
+    Returns the stored event description for ipfs_hash, creating it from IPFS if needed
+    :param timeout: seconds to wait for IPFS, None waits for the IPFS client timeout
+    :raise IpfsFetchError: the description couldn't be fetched
+    :raise ValidationError: the fetched description is not valid
+    """
+    try:
+        return models.EventDescription.objects.get(ipfs_hash=ipfs_hash)
+    except models.EventDescription.DoesNotExist:
+        if timeout is None:
+            try:
+                event_description_json = Ipfs().get(ipfs_hash)
+            except Exception:
+                raise IpfsFetchError('IPFS hash must exist')
+        else:
+            event_description_json = Ipfs().get_many([ipfs_hash], timeout=timeout).get(ipfs_hash)
+            if event_description_json is None:
+                raise IpfsFetchError('IPFS hash not fetched in {} seconds'.format(timeout))
+
+        return create_event_description(ipfs_hash, event_description_json)
+
+
+def prefetch_event_descriptions(ipfs_hashes):
+    """
+    Creates the event descriptions of ipfs_hashes which are not stored yet, fetching them concurrently.
+    Fetching is bounded by IPFS_PREFETCH_TIMEOUT as it runs inside the block transaction. The hashes which
+    can't be fetched in time or aren't valid descriptions are left to the per-event path, which stores
+    them as pending and resolves them on the IPFS queue when IPFS_DEFERRED_DESCRIPTIONS is set
+    :return: number of created event descriptions
+    """
+    ipfs_hashes = set(ipfs_hashes)
+    if not ipfs_hashes:
+        return 0
+
+    stored_hashes = set(models.EventDescription.objects.filter(
+        ipfs_hash__in=list(ipfs_hashes)).values_list('ipfs_hash', flat=True))
+    created = 0
+    event_description_jsons = Ipfs().get_many(ipfs_hashes - stored_hashes, timeout=settings.IPFS_PREFETCH_TIMEOUT)
+    for ipfs_hash, event_description_json in event_description_jsons.items():
+        try:
+            with transaction.atomic():
+                create_event_description(ipfs_hash, event_description_json)
+            created += 1
+        except Exception as e:
+            logger.warning('Event description {} not prefetched: {}'.format(ipfs_hash, e))
+    return created
+
+
+def get_event_description(centralized_oracle):
+    """
+    Returns the event description of the centralized oracle. A description still pending is fetched
+    right away, waiting no longer than IPFS_PREFETCH_TIMEOUT as it runs inside the block transaction
+    :raise IpfsFetchError: the pending description couldn't be fetched in time
+    :raise ValidationError: the oracle has no valid description
+    """
+    if centralized_oracle.event_description is None:
+        if not centralized_oracle.pending_ipfs_hash:
+            raise serializers.ValidationError(
+                'Centralized Oracle {} has no valid event description'.format(centralized_oracle.address))
+        centralized_oracle.event_description = fetch_event_description(centralized_oracle.pending_ipfs_hash,
+                                                                       timeout=settings.IPFS_PREFETCH_TIMEOUT)
+        centralized_oracle.pending_ipfs_hash = None
+        centralized_oracle.save()
+    return centralized_oracle.event_description
+
+
+class PendingEventDescription(object):
+    """Event description which will be resolved from IPFS out of the ingestion path"""
+
+    def __init__(self, ipfs_hash):
+        self.ipfs_hash = ipfs_hash
+
+
 class IpfsHashField(CharField):
 
     def __init__(self, **kwargs):
         super(IpfsHashField, self).__init__(**kwargs)
 
-    def get_event_description(self, ipfs_hash):
-        """Returns the IPFS event_description object"""
-        ipfs = Ipfs()
-        return ipfs.get(ipfs_hash)
-
     def to_internal_value(self, data):
-        event_description = None
-        event_description_json = None
         try:
-            event_description = models.EventDescription.objects.get(ipfs_hash=data)
-            if event_description.title is None:
-                return self.get_event_description(data)
-            else:
-                return event_description
+            return models.EventDescription.objects.get(ipfs_hash=data)
         except models.EventDescription.DoesNotExist:
-            try:
-                event_description_json = self.get_event_description(data)
-            except Exception as e:
-                raise serializers.ValidationError('IPFS hash must exist')
+            if not settings.IPFS_DEFERRED_DESCRIPTIONS:
+                return fetch_event_description(data)
 
-            if not event_description_json.get('title'):
-                raise serializers.ValidationError('Missing title field')
-
-            if not event_description_json.get('resolutionDate'):
-                raise serializers.ValidationError('Missing resolution date field')
-
-            if not event_description_json.get('description'):
-                raise serializers.ValidationError('Missing description field')
-
-            if 'outcomes' in event_description_json:
-                categorical_json = {
-                    'ipfs_hash': data,
-                    'title': event_description_json['title'],
-                    'description': event_description_json['description'],
-                    'resolution_date': event_description_json['resolutionDate'],
-                    'outcomes': event_description_json['outcomes']
-                }
-                # categorical
-                event_description = models.CategoricalEventDescription.objects.create(**categorical_json)
-
-            elif 'decimals' in event_description_json and 'unit' in event_description_json:
-                scalar_json = {
-                    'ipfs_hash': data,
-                    'title': event_description_json['title'],
-                    'description': event_description_json['description'],
-                    'resolution_date': event_description_json['resolutionDate'],
-                    'decimals': event_description_json['decimals'],
-                    'unit': event_description_json['unit']
-                }
-                # scalar
-                event_description = models.ScalarEventDescription.objects.create(**scalar_json)
-            else:
-                raise serializers.ValidationError('Event must be categorical or scalar')
-
-            return event_description
+            # Don't wait for IPFS, only check the hash looks like a base58 multihash
+            if not IPFS_HASH_REGEX.match(data):
+                raise serializers.ValidationError('IPFS hash must exist')
+            return PendingEventDescription(data)
 
 
 class OracleField(CharField):
@@ -198,7 +279,7 @@ class OracleField(CharField):
         else:
             # Check oracle exists or save Null
             try:
-                oracle = models.Oracle.objects.get(address=data)
+                oracle = get_contract(models.Oracle, data)
                 return oracle
             except models.Oracle.DoesNotExist:
                 return None
@@ -211,7 +292,7 @@ class EventField(CharField):
     def to_internal_value(self, data):
         event = None
         try:
-            event = models.Event.objects.get(address=data)
+            event = get_contract(models.Event, data)
             return event
         except models.Event.DoesNotExist:
             raise serializers.ValidationError('eventContract address must exist')
@@ -241,6 +322,15 @@ class CentralizedOracleSerializer(OracleSerializer, serializers.ModelSerializer)
 
     def create(self, validated_data):
         validated_data['owner'] = validated_data['creator']
+        event_description = validated_data.get('event_description')
+        if isinstance(event_description, PendingEventDescription):
+            validated_data['event_description'] = None
+            validated_data['pending_ipfs_hash'] = event_description.ipfs_hash
+            centralized_oracle = models.CentralizedOracle.objects.create(**validated_data)
+            # Resolved on the IPFS queue once the oracle is committed
+            from relationaldb.tasks import resolve_event_description
+            transaction.on_commit(lambda: resolve_event_description.delay(centralized_oracle.address))
+            return centralized_oracle
         return models.CentralizedOracle.objects.create(**validated_data)
 
 
@@ -294,11 +384,15 @@ class ScalarEventSerializer(EventSerializer, serializers.ModelSerializer):
         try:
             centralized_oracle = models.CentralizedOracle.objects.get(address=attrs['oracle'].address)
             description = models.ScalarEventDescription.objects.get(
-                ipfs_hash=centralized_oracle.event_description.ipfs_hash)
+                ipfs_hash=get_event_description(centralized_oracle).ipfs_hash)
         except models.ScalarEventDescription.DoesNotExist:
             raise serializers.ValidationError("Not existing ScalarEventDescription with oracle {}".format(attrs['oracle'].address))
         except models.CentralizedOracle.DoesNotExist:
             pass
+        except IpfsFetchError as e:
+            # checked once the description is resolved, see tasks.check_deferred_events
+            logger.warning('Scalar event {} not checked against its description: {}'.format(
+                attrs['address'], e.detail))
 
         return attrs
 
@@ -312,7 +406,7 @@ class CategoricalEventSerializer(EventSerializer, serializers.ModelSerializer):
         fields = EventSerializer.Meta.fields + ('categoricalEvent', 'outcomeCount',)
 
     categoricalEvent = serializers.CharField(source='address', max_length=40)
-    outcomeCount = serializers.IntegerField()
+    outcomeCount = serializers.IntegerField(source='outcome_count')
 
     def validate(self, attrs):
         # Verify whether attrs['oracle'] is a CentralizedOracle,
@@ -320,8 +414,9 @@ class CategoricalEventSerializer(EventSerializer, serializers.ModelSerializer):
         attrs = super(CategoricalEventSerializer, self).validate(attrs=attrs)
         try:
             centralized_oracle = models.CentralizedOracle.objects.get(address=attrs['oracle'].address)
-            description = models.CategoricalEventDescription.objects.get(ipfs_hash=centralized_oracle.event_description.ipfs_hash)
-            if len(description.outcomes) != attrs['outcomeCount']:
+            description = models.CategoricalEventDescription.objects.get(
+                ipfs_hash=get_event_description(centralized_oracle).ipfs_hash)
+            if len(description.outcomes) != attrs['outcome_count']:
                 raise serializers.ValidationError("Field outcomeCount does not match number of outcomes specified "
                                                   "in the event description.")
         except models.ScalarEventDescription.DoesNotExist:
@@ -329,13 +424,13 @@ class CategoricalEventSerializer(EventSerializer, serializers.ModelSerializer):
                 "Not existing CategoricalEventDescription with oracle {}".format(attrs['oracle'].address))
         except models.CentralizedOracle.DoesNotExist:
             pass
+        except IpfsFetchError as e:
+            # checked once the description is resolved, see tasks.check_deferred_events
+            logger.warning('Categorical event {} not checked against its description: {}'.format(
+                attrs['address'], e.detail))
 
         return attrs
 
-    def create(self, validated_data):
-        del validated_data['outcomeCount']
-        return super(CategoricalEventSerializer, self).create(validated_data)
-
 
 class MarketSerializer(ContractCreatedByFactorySerializer, serializers.ModelSerializer):
     """
@@ -362,9 +457,8 @@ class MarketSerializer(ContractCreatedByFactorySerializer, serializers.ModelSeri
         # Check event type (Categorical or Scalar)
         try:
             categorical_event = models.CategoricalEvent.objects.get(address=validated_data.get('event').address)
-            event = validated_data.get('event')
-            n_outcome_tokens = len(categorical_event.oracle.centralizedoracle.event_description.categoricaleventdescription.outcomes)
-            net_outcome_tokens_sold = [0] * n_outcome_tokens
+            # outcome count of the event creation, checked against the event description
+            net_outcome_tokens_sold = [0] * categorical_event.outcome_count
         except models.CategoricalEvent.DoesNotExist:
             scalar_event = models.ScalarEvent.objects.get(address=validated_data.get('event').address)
             # scalar, creating an array of size 2
@@ -380,6 +474,7 @@ class MarketSerializer(ContractCreatedByFactorySerializer, serializers.ModelSeri
 
         validated_data.update({'net_outcome_tokens_sold': net_outcome_tokens_sold})
         market = models.Market.objects.create(**validated_data)
+        models.MarketStats.objects.create(market=market)
         return market
 
 
@@ -483,29 +578,16 @@ class OutcomeTokenIssuanceSerializer(ContractNotTimestampted, serializers.ModelS
     address = serializers.CharField(max_length=40, source='outcome_token')
 
     def create(self, validated_data):
-        # Creates or updates an outcome token balance for the given outcome_token.
-        # Returns the outcome_token
-        outcome_token = None
-        outcome_token_balance = None
-        try:
-            outcome_token_balance = models.OutcomeTokenBalance.objects.get(owner=validated_data['owner'],
-                                                                           outcome_token__address=validated_data['outcome_token'])
-            outcome_token_balance.balance += validated_data['amount']
-            outcome_token_balance.outcome_token.total_supply += validated_data['amount']
-            outcome_token_balance.outcome_token.save()
-            outcome_token_balance.save()
-            return outcome_token_balance.outcome_token
-        except models.OutcomeTokenBalance.DoesNotExist:
-            outcome_token = models.OutcomeToken.objects.get(address=validated_data['outcome_token'])
-            outcome_token.total_supply += validated_data['amount']
-            outcome_token.save()
-
-            outcome_token_balance = models.OutcomeTokenBalance()
-            outcome_token_balance.balance = validated_data['amount']
-            outcome_token_balance.owner = validated_data['owner']
-            outcome_token_balance.outcome_token = outcome_token
-            outcome_token_balance.save()
-            return outcome_token
+        # Adds the amount to the total supply, then creates or updates the outcome token balance,
+        # both in-database: 2 statements. Returns the outcome token balance
+        updated = models.OutcomeToken.objects.filter(address=validated_data['outcome_token']).update(
+            total_supply=F('total_supply') + validated_data['amount'])
+        if not updated:
+            raise serializers.ValidationError('OutcomeToken {} does not exist'.format(validated_data['outcome_token']))
+
+        return models.OutcomeTokenBalance.objects.add_balance(validated_data['owner'],
+                                                              validated_data['outcome_token'],
+                                                              validated_data['amount'])
 
 
 class OutcomeTokenRevocationSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -520,27 +602,20 @@ class OutcomeTokenRevocationSerializer(ContractNotTimestampted, serializers.Mode
     amount = serializers.IntegerField()
     address = serializers.CharField(max_length=40, source='outcome_token')
 
-    def validate(self, attrs):
-        try:
-            outcome_token_balance = models.OutcomeTokenBalance.objects.get(owner=attrs.get('owner'),
-                                                                           outcome_token__address=attrs.get('outcome_token'))
-            return attrs
-        except models.OutcomeTokenBalance.DoesNotExist:
+    def create(self, validated_data):
+        # Subtracts the amount from the owner balance and from the total supply, 2 statements.
+        # Returns the outcome token balance
+        outcome_token_balance = models.OutcomeTokenBalance.objects.subtract_balance(validated_data.get('owner'),
+                                                                                    validated_data.get('outcome_token'),
+                                                                                    validated_data.get('amount'))
+        if outcome_token_balance is None:
             raise serializers.ValidationError('OutcomeTokenBalance {} for owner {} doesn\'t exist'.format(
-                attrs.get('outcome_token'),
-                attrs.get('owner')
+                validated_data.get('outcome_token'),
+                validated_data.get('owner')
             ))
-
-    def create(self, validated_data):
-        outcome_token_balance = models.OutcomeTokenBalance.objects.get(owner=validated_data.get('owner'),
-                                                                       outcome_token__address=validated_data.get('outcome_token'))
-        outcome_token_balance.balance -= validated_data.get('amount')
-        outcome_token_balance.outcome_token.total_supply -= validated_data.get('amount')
-        # save the outcome_token
-        outcome_token_balance.outcome_token.save()
-        # save the outcome_token_balance
-        outcome_token_balance.save()
-        return outcome_token_balance.outcome_token
+        models.OutcomeToken.objects.filter(address=validated_data.get('outcome_token')).update(
+            total_supply=F('total_supply') - validated_data.get('amount'))
+        return outcome_token_balance
 
 
 class OutcomeAssignmentEventSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -585,24 +660,25 @@ class OutcomeTokenTransferSerializer(ContractNotTimestampted, serializers.ModelS
     to = serializers.CharField(max_length=40)
 
     def create(self, validated_data):
-        # Substract balance from Outcome Token Balance
-        from_balance = models.OutcomeTokenBalance.objects.get(owner=validated_data['from_address'],
-                                                              outcome_token__address=validated_data['outcome_token'])
-        from_balance.balance -= validated_data['value']
-        from_balance.save()
-
-        # Add balance to receiver
-        to_balance = None
-        try:
-            to_balance = models.OutcomeTokenBalance.objects.get(owner=validated_data['to'],
-                                                                outcome_token__address=validated_data['outcome_token'])
-        except models.OutcomeTokenBalance.DoesNotExist:
-            to_balance = models.OutcomeTokenBalance.objects.create(owner=validated_data['to'],
-                                                                   outcome_token=from_balance.outcome_token)
-        to_balance.balance += validated_data['value']
-        to_balance.save()
+        # Subtract balance from the sender, then add it to the receiver creating its balance if needed.
+        # Tokens leaving or returning to a market change its open interest
+        from_balance = models.OutcomeTokenBalance.objects.subtract_balance(validated_data['from_address'],
+                                                                           validated_data['outcome_token'],
+                                                                           validated_data['value'])
+        if from_balance is None:
+            raise serializers.ValidationError('OutcomeTokenBalance {} for owner {} doesn\'t exist'.format(
+                validated_data['outcome_token'],
+                validated_data['from_address']
+            ))
 
-        return to_balance
+        # Known markets are kept in memory, transfers between traders cost no statistics statement
+        markets = MarketAddressGetter()
+        if validated_data['from_address'] in markets or validated_data['to'] in markets:
+            models.MarketStats.objects.add_transfer(validated_data['from_address'], validated_data['to'],
+                                                    validated_data['value'])
+        return models.OutcomeTokenBalance.objects.add_balance(validated_data['to'],
+                                                              validated_data['outcome_token'],
+                                                              validated_data['value'])
 
 
 class WinningsRedemptionSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -818,12 +894,12 @@ class OutcomeTokenPurchaseSerializer(ContractEventTimestamped, serializers.Model
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             token_index = validated_data.get('outcomeTokenIndex')
             token_count = validated_data.get('outcomeTokenCount')
             market.net_outcome_tokens_sold[token_index] += token_count
 
-            outcome_token = market.event.outcometoken_set.get(index=token_index)
+            outcome_token = get_outcome_token(models.OutcomeToken, market.event_id, token_index)
 
             # Create Order
             order = models.BuyOrder()
@@ -835,12 +911,15 @@ class OutcomeTokenPurchaseSerializer(ContractEventTimestamped, serializers.Model
             order.outcome_token_count = token_count
             order.cost = validated_data.get('cost')
             order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+            order.marginal_prices = calc_market_marginal_prices(market)
             # Save order successfully, save market changes, then save the share entry
             order.save()
-            market.save()
+            models.Candle.objects.add_order(order)
+            models.MarketStats.objects.add_order(order, order.cost)
+            save_contract(market)
             return order
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
 
 
 class OutcomeTokenSaleSerializer(ContractEventTimestamped, serializers.ModelSerializer):
@@ -859,12 +938,12 @@ class OutcomeTokenSaleSerializer(ContractEventTimestamped, serializers.ModelSeri
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             token_index = validated_data.get('outcomeTokenIndex')
             token_count = validated_data.get('outcomeTokenCount')
             market.net_outcome_tokens_sold[token_index] -= token_count
             # get outcome token
-            outcome_token = market.event.outcometoken_set.get(index=token_index)
+            outcome_token = get_outcome_token(models.OutcomeToken, market.event_id, token_index)
 
             # Create Order
             order = models.SellOrder()
@@ -876,12 +955,15 @@ class OutcomeTokenSaleSerializer(ContractEventTimestamped, serializers.ModelSeri
             order.outcome_token_count = token_count
             order.profit = validated_data.get('profit')
             order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+            order.marginal_prices = calc_market_marginal_prices(market)
             # Save order successfully, save market changes, then save the share entry
             order.save()
-            market.save()
+            models.Candle.objects.add_order(order)
+            models.MarketStats.objects.add_order(order, order.profit)
+            save_contract(market)
             return order
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
 
 
 class OutcomeTokenShortSaleOrderSerializer(ContractEventTimestamped, serializers.ModelSerializer):
@@ -900,10 +982,11 @@ class OutcomeTokenShortSaleOrderSerializer(ContractEventTimestamped, serializers
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             try:
                 # get outcome token
-                outcome_token = models.OutcomeToken.objects.get(index=validated_data.get('outcomeTokenIndex'))
+                outcome_token = get_outcome_token(models.OutcomeToken, market.event_id,
+                                                  validated_data.get('outcomeTokenIndex'))
                 # Create Order
                 order = models.ShortSellOrder()
                 order.creation_date_time = validated_data['creation_date_time']
@@ -915,13 +998,17 @@ class OutcomeTokenShortSaleOrderSerializer(ContractEventTimestamped, serializers
                 order.outcome_token_count = validated_data.get('outcomeTokenCount')
                 order.cost = validated_data.get('cost')
                 order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+                order.marginal_prices = calc_market_marginal_prices(market)
                 # save order
                 order.save()
+                models.Candle.objects.add_order(order)
+                models.MarketStats.objects.add_order(order, order.cost)
                 return order
             except models.OutcomeToken.DoesNotExist:
-                raise serializers.ValidationError('OutcomeToken with index {} does not exist.' % validated_data.get('outcomeTokenIndex'))
+                raise serializers.ValidationError('OutcomeToken with index {} does not exist.'.format(
+                    validated_data.get('outcomeTokenIndex')))
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
 
 
 class MarketFundingSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -937,13 +1024,13 @@ class MarketFundingSerializer(ContractNotTimestampted, serializers.ModelSerializ
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             market.funding = validated_data.get('funding')
             market.stage = market.stages[1][0] # MarketFunded
-            market.save()
+            save_contract(market)
             return market
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
 
 
 class MarketClosingSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -958,12 +1045,12 @@ class MarketClosingSerializer(ContractNotTimestampted, serializers.ModelSerializ
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             market.stage = market.stages[2][0] # MarketClosed
-            market.save()
+            save_contract(market)
             return market
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
 
 
 class FeeWithdrawalSerializer(ContractNotTimestampted, serializers.ModelSerializer):
@@ -979,9 +1066,9 @@ class FeeWithdrawalSerializer(ContractNotTimestampted, serializers.ModelSerializ
 
     def create(self, validated_data):
         try:
-            market = models.Market.objects.get(address=validated_data.get('address'))
+            market = get_contract(models.Market, validated_data.get('address'))
             market.withdrawn_fees += validated_data.get('fees')
-            market.save()
+            save_contract(market)
             return market
         except models.Market.DoesNotExist:
-            raise serializers.ValidationError('Market with address {} does not exist.' % validated_data.get('address'))
+            raise serializers.ValidationError('Market with address {} does not exist.'.format(validated_data.get('address')))
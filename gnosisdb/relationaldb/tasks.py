@@ -0,0 +1,94 @@
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+from relationaldb.models import CentralizedOracle, CategoricalEvent, CategoricalEventDescription, Event
+from relationaldb.serializers import IpfsFetchError, fetch_event_description
+from gnosisdb.block_cache import publish_changes
+from datetime import timedelta
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(bind=True, max_retries=settings.IPFS_MAX_RETRIES, default_retry_delay=settings.IPFS_RETRY_DELAY,
+             soft_time_limit=settings.IPFS_TIMEOUT)
+def resolve_event_description(self, centralized_oracle_address):
+    """
+    Fetches the event description of a centralized oracle stored with a pending description
+    and attaches it. Runs on the IPFS queue, so chain ingestion never waits for IPFS.
+    """
+    try:
+        centralized_oracle = CentralizedOracle.objects.get(address=centralized_oracle_address)
+    except CentralizedOracle.DoesNotExist:
+        logger.warning('Centralized Oracle {} does not exist'.format(centralized_oracle_address))
+        return
+
+    ipfs_hash = centralized_oracle.pending_ipfs_hash
+    if centralized_oracle.event_description_id or not ipfs_hash:
+        # Already resolved by the ingestion path
+        return
+
+    try:
+        event_description = fetch_event_description(ipfs_hash)
+    except (IpfsFetchError, SoftTimeLimitExceeded) as e:
+        logger.warning('Event description {} of Centralized Oracle {} not resolved: {}'.format(
+            ipfs_hash, centralized_oracle_address, e))
+        raise self.retry(exc=e)
+    except ValidationError as e:
+        # Not a valid description, fetching it again won't change it. The oracle stays without description,
+        # hidden from the API as it would have been rejected if fetched while ingesting
+        logger.warning('Event description {} of Centralized Oracle {} rejected: {}'.format(
+            ipfs_hash, centralized_oracle_address, e.detail))
+        CentralizedOracle.objects.filter(address=centralized_oracle_address, event_description__isnull=True).update(
+            pending_ipfs_hash=None)
+        return
+
+    CentralizedOracle.objects.filter(address=centralized_oracle_address, event_description__isnull=True).update(
+        event_description=event_description, pending_ipfs_hash=None)
+    check_deferred_events(centralized_oracle_address, event_description)
+    publish_changes([centralized_oracle_address])
+    logger.info('Event description {} attached to Centralized Oracle {}'.format(ipfs_hash,
+                                                                                centralized_oracle_address))
+
+
+def check_deferred_events(centralized_oracle_address, event_description):
+    """
+    Checks the events created while the description of their oracle was pending against it, the ingestion
+    couldn't as it doesn't wait for IPFS
+    :return: list of the addresses of the events which don't match the description
+    """
+    events = Event.objects.filter(oracle=centralized_oracle_address)
+    try:
+        outcomes = CategoricalEventDescription.objects.get(pk=event_description.pk).outcomes
+        invalid_events = events.exclude(
+            address__in=CategoricalEvent.objects.filter(outcome_count=len(outcomes)).values('address'))
+    except CategoricalEventDescription.DoesNotExist:
+        invalid_events = events.filter(address__in=CategoricalEvent.objects.values('address'))
+
+    invalid_addresses = list(invalid_events.values_list('address', flat=True))
+    for event_address in invalid_addresses:
+        logger.warning('Event {} does not match the event description {} of its oracle'.format(
+            event_address, event_description.ipfs_hash))
+    return invalid_addresses
+
+
+@shared_task
+def resolve_pending_event_descriptions():
+    """
+    Periodic sweep re-queueing the centralized oracles whose event description is still pending
+    IPFS_PENDING_SWEEP_AGE seconds after their creation, once the retries of their first task ran out
+    """
+    stale_date = timezone.now() - timedelta(seconds=settings.IPFS_PENDING_SWEEP_AGE)
+    addresses = CentralizedOracle.objects.filter(
+        pending_ipfs_hash__isnull=False, event_description__isnull=True, creation_date_time__lt=stale_date
+    ).values_list('address', flat=True)
+
+    count = 0
+    for centralized_oracle_address in addresses.iterator():
+        resolve_event_description.delay(centralized_oracle_address)
+        count += 1
+    if count:
+        logger.info('{} pending event descriptions re-queued'.format(count))
+    return count
@@ -64,6 +64,8 @@ class CategoricalEventFactory(EventFactory):
     class Meta:
         model = models.CategoricalEvent
 
+    outcome_count = 2
+
 
 class ScalarEventFactory(EventFactory):
     class Meta:
@@ -89,7 +91,7 @@ class OutcomeTokenBalanceFactory(factory_boy.DjangoModelFactory):
         model = models.OutcomeTokenBalance
 
     outcome_token = factory_boy.SubFactory(OutcomeTokenFactory)
-    balance = factory_boy.Sequence(lambda n: n)
+    balance = factory_boy.Sequence(lambda n: n + 1)
     owner = factory_boy.Sequence(lambda n: '{:040d}'.format(n))
 
 
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from django.test import TestCase
+from relationaldb.identity_map import block_scope, get_contract, get_outcome_token, save_contract
+from relationaldb.models import Market, OutcomeToken
+from relationaldb.tests.factories import MarketFactory, OutcomeTokenFactory
+
+
+class TestIdentityMap(TestCase):
+
+    def test_contract_fetched_once_per_block(self):
+        market = MarketFactory()
+        with block_scope():
+            with self.assertNumQueries(1):
+                first = get_contract(Market, market.address)
+                second = get_contract(Market, market.address)
+            self.assertIs(first, second)
+
+        # outside of a block scope every lookup hits the database
+        with self.assertNumQueries(2):
+            get_contract(Market, market.address)
+            get_contract(Market, market.address)
+
+    def test_missing_contract_cached(self):
+        with block_scope():
+            with self.assertNumQueries(1):
+                for _ in range(2):
+                    with self.assertRaises(Market.DoesNotExist):
+                        get_contract(Market, '{:040d}'.format(999))
+
+    def test_outcome_token_lookup(self):
+        outcome_token = OutcomeTokenFactory()
+        with block_scope():
+            with self.assertNumQueries(1):
+                self.assertEqual(get_outcome_token(OutcomeToken, outcome_token.event_id, outcome_token.index),
+                                 outcome_token)
+                get_outcome_token(OutcomeToken, outcome_token.event_id, outcome_token.index)
+
+    def test_dirty_rows_flushed_at_block_commit(self):
+        market = MarketFactory()
+        with block_scope():
+            cached_market = get_contract(Market, market.address)
+            cached_market.withdrawn_fees += 10
+            save_contract(cached_market)
+            save_contract(cached_market)
+            self.assertEqual(Market.objects.get(address=market.address).withdrawn_fees, market.withdrawn_fees)
+
+        self.assertEqual(Market.objects.get(address=market.address).withdrawn_fees, market.withdrawn_fees + 10)
+
+    def test_restore_snapshot(self):
+        market = MarketFactory()
+        outcome_token = OutcomeTokenFactory()
+        with block_scope() as identity_map:
+            get_contract(Market, market.address)
+            snapshot = identity_map.snapshot()
+            cached_market = get_contract(Market, market.address)
+            cached_market.net_outcome_tokens_sold[0] += 5
+            save_contract(cached_market)
+            get_outcome_token(OutcomeToken, outcome_token.event_id, outcome_token.index)
+            # only the rows used after the snapshot are recorded
+            self.assertEqual(len(snapshot.states), 2)
+            identity_map.restore(snapshot)
+            self.assertEqual(cached_market.net_outcome_tokens_sold, market.net_outcome_tokens_sold)
+            self.assertEqual(len(identity_map.dirty), 0)
+            # rows loaded after the snapshot are dropped, the ones loaded before are kept
+            self.assertNotIn((OutcomeToken, (outcome_token.event_id, outcome_token.index)), identity_map.instances)
+            self.assertIs(get_contract(Market, market.address), cached_market)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from django.db import connection
+from django.test import TestCase
+from relationaldb.models import Order, OutcomeToken, OutcomeTokenBalance, OutcomeVoteBalance, Candle
+from restapi.views import get_market_shares
+from datetime import datetime
+
+
+class TestQueryPlans(TestCase):
+    """The lookups of the ingestion and the API must be answered from an index"""
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            # test tables are tiny, make the planner use any usable index
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        """Asserts the query is answered from an index, the given one if index_name is set"""
+        plan = self.get_plan(queryset)
+        self.assertNotIn('Seq Scan', plan, plan)
+        self.assertIn(index_name or 'Index', plan, plan)
+
+    def test_outcome_token_balance_lookups(self):
+        owner = '{:040d}'.format(1)
+        outcome_token = '{:040d}'.format(2)
+        self.assertUsesIndex(OutcomeTokenBalance.objects.filter(owner=owner, outcome_token=outcome_token))
+        self.assertUsesIndex(OutcomeTokenBalance.objects.filter(owner=owner, balance__gt=0).order_by('id'),
+                             'balance_owner_idx')
+        self.assertUsesIndex(OutcomeTokenBalance.objects.filter(outcome_token=outcome_token).order_by('-balance'),
+                             'balance_token_balance_idx')
+
+    def test_market_shares_lookup(self):
+        self.assertUsesIndex(get_market_shares('{:040d}'.format(1)), 'balance_token_balance_idx')
+
+    def test_order_history_lookups(self):
+        market = '{:040d}'.format(1)
+        self.assertUsesIndex(Order.objects.filter(market=market).order_by('creation_date_time', 'id'),
+                             'order_market_history_idx')
+        self.assertUsesIndex(Order.objects.filter(market=market, creation_date_time__gte=datetime.now()),
+                             'order_market_history_idx')
+        self.assertUsesIndex(Order.objects.filter(market=market, sender=market).order_by('creation_date_time', 'id'),
+                             'order_sender_history_idx')
+
+    def test_outcome_token_lookup(self):
+        self.assertUsesIndex(OutcomeToken.objects.filter(event='{:040d}'.format(1), index=0),
+                             'outcometoken_event_index_idx')
+
+    def test_outcome_vote_balance_lookup(self):
+        self.assertUsesIndex(OutcomeVoteBalance.objects.filter(ultimate_oracle='{:040d}'.format(1),
+                                                               address='{:040d}'.format(2)),
+                             'outcomevotebalance_oracle_idx')
+
+    def test_candle_lookup(self):
+        self.assertUsesIndex(Candle.objects.filter(market='{:040d}'.format(1), interval='1h',
+                                                   start__gte=datetime.now()).order_by('start', 'outcome_index'))
@@ -10,11 +10,14 @@ from relationaldb.serializers import (
     CentralizedOracleInstanceSerializer, OutcomeTokenInstanceSerializer, OutcomeTokenTransferSerializer
 )
 
-from relationaldb.models import OutcomeTokenBalance, OutcomeToken
+from relationaldb.models import OutcomeTokenBalance, OutcomeToken, CentralizedOracle
+from relationaldb.tasks import resolve_event_description, resolve_pending_event_descriptions, check_deferred_events
 from rest_framework.serializers import ValidationError
 from django.conf import settings
 from ipfs.ipfs import Ipfs
 from time import mktime
+from datetime import datetime, timedelta
+import pytz
 
 
 class TestSerializers(TestCase):
@@ -69,7 +72,91 @@ class TestSerializers(TestCase):
         instance = s.save()
         self.assertIsNotNone(instance)
 
-    def test_event_description_different_outcomes(self):
+    def test_create_centralized_oracle_deferred_description(self):
+        oracle = CentralizedOracleFactory()
+        block = {
+            'number': oracle.creation_block,
+            'timestamp': mktime(oracle.creation_date_time.timetuple())
+        }
+        event_description_json = {
+            'title': oracle.event_description.title,
+            'description': oracle.event_description.description,
+            'resolutionDate': oracle.event_description.resolution_date.isoformat(),
+            'outcomes': ['Yes', 'No']
+        }
+        ipfs_hash = self.ipfs.post(event_description_json)
+        oracle_event = {
+            'address': oracle.factory[0:-7] + 'GIACOMO',
+            'params': [
+                {
+                    'name': 'creator',
+                    'value': oracle.creator
+                },
+                {
+                    'name': 'centralizedOracle',
+                    'value': oracle.address[1:-7] + 'DEFERRD',
+                },
+                {
+                    'name': 'ipfsHash',
+                    'value': ipfs_hash
+                }
+            ]
+        }
+
+        # Only the hash format is checked, the description is not fetched
+        s = CentralizedOracleSerializer(data=oracle_event, block=block)
+        self.assertTrue(s.is_valid(), s.errors)
+        instance = s.save()
+        self.assertEqual(instance.pending_ipfs_hash, ipfs_hash)
+
+        # Tasks run eagerly in tests, the task is idempotent
+        resolve_event_description(instance.address)
+        instance = CentralizedOracle.objects.get(address=instance.address)
+        self.assertIsNone(instance.pending_ipfs_hash)
+        self.assertEqual(instance.event_description.ipfs_hash, ipfs_hash)
+
+    def test_resolve_pending_event_descriptions(self):
+        oracle = CentralizedOracleFactory()
+        event_description_json = {
+            'title': oracle.event_description.title,
+            'description': oracle.event_description.description,
+            'resolutionDate': oracle.event_description.resolution_date.isoformat(),
+            'outcomes': ['Yes', 'No']
+        }
+        ipfs_hash = self.ipfs.post(event_description_json)
+        recent_oracle = CentralizedOracleFactory(event_description=None, pending_ipfs_hash=ipfs_hash,
+                                                 creation_date_time=datetime.now(pytz.utc))
+        stale_oracle = CentralizedOracleFactory(
+            event_description=None, pending_ipfs_hash=ipfs_hash,
+            creation_date_time=datetime.now(pytz.utc) - timedelta(seconds=settings.IPFS_PENDING_SWEEP_AGE + 60))
+
+        # Tasks run eagerly in tests, the recent oracle is left to its own task
+        self.assertGreaterEqual(resolve_pending_event_descriptions(), 1)
+        self.assertIsNone(CentralizedOracle.objects.get(address=stale_oracle.address).pending_ipfs_hash)
+        self.assertEqual(CentralizedOracle.objects.get(address=recent_oracle.address).pending_ipfs_hash, ipfs_hash)
+
+    def test_resolve_invalid_event_description(self):
+        oracle = CentralizedOracleFactory()
+        # not retried, a description without title can't become valid
+        ipfs_hash = self.ipfs.post({
+            'description': oracle.event_description.description,
+            'resolutionDate': oracle.event_description.resolution_date.isoformat(),
+            'outcomes': ['Yes', 'No']
+        })
+        pending_oracle = CentralizedOracleFactory(event_description=None, pending_ipfs_hash=ipfs_hash)
+        resolve_event_description(pending_oracle.address)
+        pending_oracle = CentralizedOracle.objects.get(address=pending_oracle.address)
+        self.assertIsNone(pending_oracle.pending_ipfs_hash)
+        self.assertIsNone(pending_oracle.event_description)
+
+    def test_check_deferred_events(self):
+        oracle = CentralizedOracleFactory()
+        oracle.event_description.outcomes = ['Yes', 'No']
+        oracle.event_description.save()
+        matching_event = CategoricalEventFactory(oracle=oracle, outcome_count=2)
+        other_event = CategoricalEventFactory(oracle=oracle, outcome_count=3)
+        self.assertListEqual(check_deferred_events(oracle.address, oracle.event_description), [other_event.address])
+
 
         oracle = CentralizedOracleFactory()
 
@@ -725,3 +812,58 @@ class TestSerializers(TestCase):
         self.assertIsNotNone(instance)
         self.assertEqual(instance.owner, event.address)
         self.assertEqual(instance.balance, 20)
+
+    def test_issuance_outcome_token_existing_balance(self):
+        balance = OutcomeTokenBalanceFactory()
+        balance.balance = 20
+        balance.save()
+
+        issuance_event = {
+            'name': 'Issuance',
+            'address': balance.outcome_token.address,
+            'params': [
+                {
+                    'name': 'owner',
+                    'value': balance.owner
+                },
+                {
+                    'name': 'amount',
+                    'value': 5,
+                }
+            ]
+        }
+
+        for _ in range(2):
+            s = OutcomeTokenIssuanceSerializer(data=issuance_event)
+            self.assertTrue(s.is_valid(), s.errors)
+            instance = s.save()
+
+        # the balance is updated in place, never duplicated
+        self.assertEqual(OutcomeTokenBalance.objects.filter(owner=balance.owner).count(), 1)
+        self.assertEqual(instance.balance, 30)
+        self.assertEqual(OutcomeToken.objects.get(address=balance.outcome_token.address).total_supply,
+                         balance.outcome_token.total_supply + 10)
+
+    def test_revocation_outcome_token_without_balance(self):
+        outcome_token = OutcomeTokenFactory()
+        revocation_event = {
+            'name': 'Revocation',
+            'address': outcome_token.address,
+            'params': [
+                {
+                    'name': 'owner',
+                    'value': outcome_token.address[0:-7] + 'GIACOMO'
+                },
+                {
+                    'name': 'amount',
+                    'value': 20,
+                }
+            ]
+        }
+
+        s = OutcomeTokenRevocationSerializer(data=revocation_event)
+        self.assertTrue(s.is_valid(), s.errors)
+        with self.assertRaises(ValidationError):
+            s.save()
+        self.assertEqual(OutcomeToken.objects.get(address=outcome_token.address).total_supply,
+                         outcome_token.total_supply)
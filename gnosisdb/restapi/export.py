@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from django.core.serializers.json import DjangoJSONEncoder
+from gnosisdb.utils import add_0x_prefix
+import csv
+import json
+
+# (column, Order lookup) read with values_list, the children are reached with LEFT JOINs
+ORDER_EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('date', 'creation_date_time'),
+    ('block', 'creation_block'),
+    ('order_type', 'order_type'),
+    ('sender', 'sender'),
+    ('outcome_token_index', 'outcome_token__index'),
+    ('outcome_token_count', 'outcome_token_count'),
+    ('cost', 'buyorder__cost'),
+    ('short_sell_cost', 'shortsellorder__cost'),
+    ('profit', 'sellorder__profit'),
+    ('net_outcome_tokens_sold', 'net_outcome_tokens_sold'),
+    ('marginal_prices', 'marginal_prices'),
+)
+# buy and short sell orders both have a cost, exported in the cost column
+ORDER_EXPORT_COLUMNS = [column for column, _ in ORDER_EXPORT_FIELDS if column != 'short_sell_cost']
+
+
+def get_order_rows(queryset):
+    """
+    Returns an iterator over the export rows of the orders, read with a server side cursor
+    :param queryset: Order queryset
+    :return: iterator of dictionaries column -> value, following ORDER_EXPORT_COLUMNS
+    """
+    fields = [column for column, _ in ORDER_EXPORT_FIELDS]
+    rows = queryset.order_by('creation_date_time', 'id').values_list(
+        *[lookup for _, lookup in ORDER_EXPORT_FIELDS]).iterator()
+    for values in rows:
+        row = dict(zip(fields, values))
+        row['sender'] = add_0x_prefix(row['sender'])
+        short_sell_cost = row.pop('short_sell_cost')
+        if row['cost'] is None:
+            row['cost'] = short_sell_cost
+        yield row
+
+
+def stream_ndjson(rows):
+    """Yields one json object per row and line"""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(OrderedDict((column, row[column]) for column in ORDER_EXPORT_COLUMNS)) + '\n'
+
+
+class Echo(object):
+    """File-like object returning what is written, lets csv.writer produce the lines one by one"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yields the header and one csv line per row, arrays are written as json"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(row[column], cls=DjangoJSONEncoder) if isinstance(row[column], list) else row[column]
+            for column in ORDER_EXPORT_COLUMNS
+        ])
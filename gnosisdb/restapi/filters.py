@@ -1,6 +1,23 @@
+from collections import OrderedDict
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Max, Min, Q
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django_filters import rest_framework as filters
-from rest_framework.pagination import LimitOffsetPagination
-from relationaldb.models import CentralizedOracle, UltimateOracle, Event, Market
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import LimitOffsetPagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import binascii
+import json
+import re
+from relationaldb.models import CentralizedOracle, UltimateOracle, Oracle, Event, Market, Candle, EventDescription
 
 
 class DefaultPagination(LimitOffsetPagination):
@@ -8,11 +25,237 @@ class DefaultPagination(LimitOffsetPagination):
     default_limit = 25
 
 
+class CandlePagination(DefaultPagination):
+    """Candles are small, a chart reads hundreds of them at once"""
+    max_limit = 1000
+    default_limit = 500
+
+
+class PortfolioPagination(CursorPagination):
+    """Cursor pagination over the owner balances, read from the (owner, id) index"""
+    ordering = 'id'
+    page_size = 25
+    page_size_query_param = 'limit'
+    max_page_size = 50
+
+
+class KeysetPagination(DefaultPagination):
+    """
+    Limit offset pagination, switching to keyset pagination on (creation_date_time, id) when the cursor
+    parameter is given (empty for the first page). Keyset pages are read from the composite index
+    without counting or skipping rows, so they cost the same at any depth.
+    DRF's CursorPagination, used for the portfolio, keeps only the first ordering field in its cursor and
+    skips the rows sharing that value with an offset. Orders of the same block share their creation date,
+    and the existing clients of these endpoints rely on limit offset pages, hence this paginator.
+    """
+    cursor_query_param = 'cursor'
+    keyset_fields = ('creation_date_time', 'id',)
+
+    def encode_cursor(self, instance):
+        position = [getattr(instance, field) for field in self.keyset_fields]
+        position = json.dumps([position[0].isoformat(), position[1]])
+        return urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            date_time, pk = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            date_time = parse_datetime(date_time)
+            if date_time is None:
+                raise ValueError(cursor)
+            return date_time, int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor = request.query_params.get(self.cursor_query_param)
+        if self.cursor is None:
+            return super(KeysetPagination, self).paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        queryset = queryset.order_by(*self.keyset_fields)
+        if self.cursor:
+            date_time, pk = self.decode_cursor(self.cursor)
+            queryset = queryset.filter(
+                Q(creation_date_time__gt=date_time) | Q(creation_date_time=date_time, id__gt=pk)
+            )
+
+        # One extra row tells whether there is a next page
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_next_link(self):
+        if self.cursor is None:
+            return super(KeysetPagination, self).get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super(KeysetPagination, self).get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+RESOLUTION_REGEX = re.compile(r'^(\d+)([smhd])$')
+RESOLUTION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+EPOCH = datetime(1970, 1, 1)
+
+
+def parse_resolution(value):
+    """
+    Parses a bucket width like 30s, 5m, 1h or 1d
+    :return: width in seconds, None if value is None
+    """
+    if value is None:
+        return None
+    match = RESOLUTION_REGEX.match(value)
+    if not match or not int(match.group(1)):
+        raise ParseError('Invalid resolution, expected a number followed by s, m, h or d')
+    return int(match.group(1)) * RESOLUTION_UNITS[match.group(2)]
+
+
+def parse_date_bound(value):
+    """
+    Parses a date range bound, ISO 8601 or one of the form input formats like 2017-01-31 10:00:00
+    :return: datetime, None if value is not a valid date
+    """
+    try:
+        return parse_datetime(value) or forms.DateTimeField().clean(value)
+    except (ValueError, forms.ValidationError):
+        return None
+
+
+def parse_max_points(value):
+    if value is None:
+        return None
+    try:
+        max_points = int(value)
+    except ValueError:
+        max_points = 0
+    if max_points < 1:
+        raise ParseError('Invalid max_points, expected a positive integer')
+    return max_points
+
+
+def to_epoch(date_time):
+    if timezone.is_aware(date_time):
+        date_time = timezone.make_naive(date_time, timezone.utc)
+    return (date_time - EPOCH).total_seconds()
+
+
+def downsample_orders(queryset, resolution=None, max_points=None):
+    """
+    Returns the last order of every time bucket of the queryset, ordered by date. Buckets are resolution
+    seconds wide and aligned on the epoch, or widened and aligned on the first order so at most
+    max_points buckets span the queryset. The buckets are grouped in SQL, only their last orders are read.
+    :param queryset: Order queryset
+    :param resolution: bucket width in seconds
+    :param max_points: maximum number of buckets
+    :return: Order queryset
+    """
+    queryset = queryset.order_by()
+    bounds = queryset.aggregate(start=Min('creation_date_time'), end=Max('creation_date_time'))
+    if bounds['start'] is None:
+        return queryset.none()
+
+    offset, width = 0, resolution or 1
+    if max_points:
+        offset = to_epoch(bounds['start'])
+        width = max(width, (to_epoch(bounds['end']) - offset) / max_points)
+
+    column = '{}.{}'.format(connection.ops.quote_name(queryset.model._meta.db_table),
+                            connection.ops.quote_name('creation_date_time'))
+    bucket_sql = 'floor((extract(epoch from {}) - %s) / %s)'.format(column)
+    params = [offset, width]
+    if max_points:
+        # the last order falls exactly on the upper bound of the last bucket
+        bucket_sql = 'least({}, %s)'.format(bucket_sql)
+        params.append(max_points - 1)
+
+    # orders are ingested in block order, the highest id of a bucket is its last order
+    last_ids = queryset.annotate(bucket=RawSQL(bucket_sql, params)).values('bucket').annotate(
+        last_id=Max('id')).values('last_id')
+    return queryset.model.objects.filter(id__in=last_ids).order_by('creation_date_time', 'id')
+
+
+class MultipleValueTextInput(forms.TextInput):
+    """Text input reading every value of a repeated query parameter"""
+
+    def value_from_datadict(self, data, files, name):
+        if hasattr(data, 'getlist'):
+            return data.getlist(name)
+        return data.get(name)
+
+
+class AddressMultipleField(forms.Field):
+    """List of ethereum addresses, returned without 0x prefix and lowercase as they are stored"""
+    widget = MultipleValueTextInput
+    address_regex = re.compile(r'^(0x)?[0-9a-fA-F]{40}$')
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+
+        addresses = []
+        for address in value:
+            if not self.address_regex.match(address):
+                raise forms.ValidationError('{} is not a valid address'.format(address), code='invalid')
+            addresses.append(address[-40:].lower())
+        return addresses
+
+
+class AddressMultipleFilter(filters.Filter):
+    """
+    Filters on any of the given addresses. Unlike AllValuesMultipleFilter, the values are validated
+    by format instead of being looked up in the list of distinct values of the table
+    """
+    field_class = AddressMultipleField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('lookup_expr', 'in')
+        super(AddressMultipleFilter, self).__init__(*args, **kwargs)
+
+
+# descriptions of an event, given by its centralized oracle or the one forwarded by its ultimate oracle
+EVENT_DESCRIPTION_PATHS = (
+    'oracle__centralizedoracle__event_description',
+    'oracle__ultimateoracle__forwarded_oracle__centralizedoracle__event_description',
+)
+
+
+def search_event_descriptions(queryset, prefix, value):
+    """
+    Full-text search of the event descriptions, best matches first. Matching descriptions are found
+    with the GIN index on their search vector, the rank is read from the joined descriptions
+    :param queryset: queryset of events or of models related to events
+    :param prefix: path from the queryset model to the event, '' for events
+    :param value: search terms
+    """
+    query = SearchQuery(value, config=EventDescription.search_config)
+    descriptions = EventDescription.objects.filter(search_vector=query).values('id')
+    paths = [prefix + path for path in EVENT_DESCRIPTION_PATHS]
+
+    condition = Q()
+    for path in paths:
+        condition |= Q(**{path + '__in': descriptions})
+    rank = Coalesce(*[SearchRank(F(path + '__search_vector'), query) for path in paths])
+    return queryset.filter(condition).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
 class CentralizedOracleFilter(filters.FilterSet):
-    creator = filters.AllValuesMultipleFilter()
+    creator = AddressMultipleFilter()
     creation_date_time = filters.DateTimeFromToRangeFilter()
     is_outcome_set = filters.BooleanFilter()
-    owner = filters.AllValuesMultipleFilter()
+    owner = AddressMultipleFilter()
     title = filters.CharFilter(name='event_description__title', lookup_expr='contains')
     description = filters.CharFilter(name='event_description__description', lookup_expr='contains')
     resolution_date = filters.DateTimeFromToRangeFilter(name='event_description__resolution_date')
@@ -30,13 +273,13 @@ class CentralizedOracleFilter(filters.FilterSet):
 
 
 class UltimateOracleFilter(filters.FilterSet):
-    creator = filters.AllValuesMultipleFilter()
+    creator = AddressMultipleFilter()
     creation_date_time = filters.DateTimeFromToRangeFilter()
     is_outcome_set = filters.BooleanFilter()
-    forwarded_oracle_creator = filters.AllValuesMultipleFilter(name='forwarded_oracle__creator')
+    forwarded_oracle_creator = AddressMultipleFilter(name='forwarded_oracle__creator')
     forwarded_oracle_creation_date_time = filters.DateTimeFromToRangeFilter(name='forwarded_oracle__creation_date_time')
     forwarded_oracle_is_outcome_set = filters.BooleanFilter(name='forwarded_oracle__is_outcome_set')
-    forwarded_oracle_factory = filters.AllValuesMultipleFilter(name='forwarded_oracle__factory')
+    forwarded_oracle_factory = AddressMultipleFilter(name='forwarded_oracle__factory')
 
     ordering = filters.OrderingFilter(
         fields=(
@@ -53,13 +296,16 @@ class UltimateOracleFilter(filters.FilterSet):
 
 
 class EventFilter(filters.FilterSet):
-    creator = filters.AllValuesMultipleFilter()
+    creator = AddressMultipleFilter()
     creation_date_time = filters.DateTimeFromToRangeFilter()
     is_winning_outcome_set = filters.BooleanFilter()
-    oracle_factory = filters.AllValuesMultipleFilter(name='oracle__factory')
-    oracle_creator = filters.AllValuesMultipleFilter(name='oracle__creator')
+    event_type = filters.MultipleChoiceFilter(choices=Event.event_types)
+    oracle_type = filters.MultipleChoiceFilter(name='oracle__oracle_type', choices=Oracle.oracle_types)
+    oracle_factory = AddressMultipleFilter(name='oracle__factory')
+    oracle_creator = AddressMultipleFilter(name='oracle__creator')
     oracle_creation_date_time = filters.DateTimeFromToRangeFilter(name='oracle__creation_date_time')
     oracle_is_outcome_set = filters.BooleanFilter(name='oracle__is_outcome_set')
+    search = filters.CharFilter(method='filter_search')
 
     ordering = filters.OrderingFilter(
         fields=(
@@ -70,27 +316,51 @@ class EventFilter(filters.FilterSet):
 
     class Meta:
         model = Event
-        fields = ('creator', 'creation_date_time', 'is_winning_outcome_set', 'oracle_factory', 'oracle_creator',
-                  'oracle_creation_date_time', 'oracle_is_outcome_set')
+        fields = ('creator', 'creation_date_time', 'is_winning_outcome_set', 'event_type', 'oracle_type',
+                  'oracle_factory', 'oracle_creator', 'oracle_creation_date_time', 'oracle_is_outcome_set',
+                  'search')
+
+    def filter_search(self, queryset, name, value):
+        return search_event_descriptions(queryset, '', value)
 
 
 class MarketFilter(filters.FilterSet):
-    creator = filters.AllValuesMultipleFilter()
+    creator = AddressMultipleFilter()
     creation_date_time = filters.DateTimeFromToRangeFilter()
-    market_maker = filters.AllValuesMultipleFilter()
-    event_oracle_factory = filters.AllValuesMultipleFilter(name='event__oracle__factory')
-    event_oracle_creator = filters.AllValuesMultipleFilter(name='event__oracle__creator')
+    market_maker = AddressMultipleFilter()
+    event_type = filters.MultipleChoiceFilter(name='event__event_type', choices=Event.event_types)
+    event_oracle_type = filters.MultipleChoiceFilter(name='event__oracle__oracle_type', choices=Oracle.oracle_types)
+    event_oracle_factory = AddressMultipleFilter(name='event__oracle__factory')
+    event_oracle_creator = AddressMultipleFilter(name='event__oracle__creator')
     event_oracle_creation_date_time = filters.DateTimeFromToRangeFilter(name='event__oracle__creation_date_time')
     event_oracle_is_outcome_set = filters.BooleanFilter(name='event__oracle__is_outcome_set')
+    search = filters.CharFilter(method='filter_search')
 
     ordering = filters.OrderingFilter(
         fields=(
             ('creation_date_time', 'creation_date_order'),
-            ('event__oracle__creation_date_time', 'event_oracle_creation_date_order')
+            ('event__oracle__creation_date_time', 'event_oracle_creation_date_order'),
+            ('stats__volume', 'volume_order'),
+            ('stats__trades', 'trades_order'),
+            ('stats__traders', 'traders_order'),
+            ('stats__open_interest', 'open_interest_order'),
         )
     )
 
     class Meta:
         model = Market
-        fields = ('creator', 'creation_date_time', 'market_maker', 'event_oracle_factory', 'event_oracle_creator',
-                  'event_oracle_creation_date_time', 'event_oracle_is_outcome_set')
+        fields = ('creator', 'creation_date_time', 'market_maker', 'event_type', 'event_oracle_type',
+                  'event_oracle_factory', 'event_oracle_creator', 'event_oracle_creation_date_time',
+                  'event_oracle_is_outcome_set', 'search')
+
+    def filter_search(self, queryset, name, value):
+        return search_event_descriptions(queryset, 'event__', value)
+
+
+class CandleFilter(filters.FilterSet):
+    outcome_index = filters.NumberFilter()
+    start = filters.DateTimeFromToRangeFilter()
+
+    class Meta:
+        model = Candle
+        fields = ('outcome_index', 'start',)
@@ -2,9 +2,30 @@ from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 from relationaldb.models import (
     ScalarEventDescription, CategoricalEventDescription, OutcomeTokenBalance, OutcomeToken,
-    CentralizedOracle, UltimateOracle, Market, Order, ScalarEvent, CategoricalEvent
+    CentralizedOracle, UltimateOracle, Market, Order, ScalarEvent, CategoricalEvent, BuyOrder, SellOrder,
+    ShortSellOrder, Candle, MarketStats
 )
-from gnosisdb.utils import remove_null_values, add_0x_prefix
+from gnosisdb.utils import remove_null_values, add_0x_prefix, calc_market_marginal_prices
+
+
+def get_subclass_instance(instance, model):
+    """
+    Returns the child row of a multi-table inheritance parent, read from the select_related cache
+    when the query joined it (see restapi.views). The child table is not queried when the stored
+    type discriminator of the parent tells it is another child
+    :param instance: parent model instance
+    :param model: child model class
+    :return: model instance or None if the parent is not a model
+    """
+    if isinstance(instance, model):
+        return instance
+    instance_type = instance.get_type()
+    if instance_type is not None and instance_type != model.type_name:
+        return None
+    try:
+        return getattr(instance, model._meta.model_name)
+    except ObjectDoesNotExist:
+        return None
 
 
 class ContractSerializer(serializers.BaseSerializer):
@@ -29,18 +50,14 @@ class EventDescriptionSerializer(serializers.BaseSerializer):
             'ipfs_hash': instance.ipfs_hash
         }
 
-        try:
-            scalar_event = ScalarEventDescription.objects.get(id=instance.id)
+        scalar_event = get_subclass_instance(instance, ScalarEventDescription)
+        if scalar_event is not None:
             result['unit'] = scalar_event.unit
             result['decimals'] = scalar_event.decimals
-        except ObjectDoesNotExist:
-            pass
 
-        try:
-            categorical_event = CategoricalEventDescription.objects.get(id=instance.id)
+        categorical_event = get_subclass_instance(instance, CategoricalEventDescription)
+        if categorical_event is not None:
             result['outcomes'] = categorical_event.outcomes
-        except ObjectDoesNotExist:
-            pass
 
         return remove_null_values(result)
 
@@ -49,20 +66,18 @@ class OracleSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         result = None
-        try:
-            centralized_oracle = CentralizedOracle.objects.get(address=instance.address)
+        centralized_oracle = get_subclass_instance(instance, CentralizedOracle)
+        if centralized_oracle is not None:
             result = CentralizedOracleSerializer(centralized_oracle).to_representation(centralized_oracle)
             return remove_null_values(result)
-        except CentralizedOracle.DoesNotExist:
-            pass
 
-        try:
-            ultimate_oracle = UltimateOracle.objects.get(address=instance.address)
+        ultimate_oracle = get_subclass_instance(instance, UltimateOracle)
+        if ultimate_oracle is not None:
             result = UltimateOracleSerializer(ultimate_oracle).to_representation(ultimate_oracle)
             return remove_null_values(result)
-        except UltimateOracle.DoesNotExist:
-            response = super(OracleSerializer, self).to_representation(instance)
-            return remove_null_values(response)
+
+        response = super(OracleSerializer, self).to_representation(instance)
+        return remove_null_values(response)
 
 
 class CentralizedOracleSerializer(serializers.ModelSerializer):
@@ -159,19 +174,24 @@ class EventSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         result = None
-        try:
-            categorical_event = CategoricalEvent.objects.get(address=instance.address)
+        categorical_event = get_subclass_instance(instance, CategoricalEvent)
+        if categorical_event is not None:
             result = CategoricalEventSerializer(categorical_event).to_representation(categorical_event)
             return remove_null_values(result)
-        except CategoricalEvent.DoesNotExist:
-            pass
 
-        try:
-            scalar_event = ScalarEvent.objects.get(address=instance.address)
+        scalar_event = get_subclass_instance(instance, ScalarEvent)
+        if scalar_event is not None:
             result = ScalarEventSerializer(scalar_event).to_representation(scalar_event)
             return remove_null_values(result)
-        except ScalarEvent.DoesNotExist:
-            pass
+
+
+class MarketStatsSerializer(serializers.ModelSerializer):
+    volume = serializers.DecimalField(max_digits=80, decimal_places=0)
+    open_interest = serializers.DecimalField(max_digits=80, decimal_places=0)
+
+    class Meta:
+        model = MarketStats
+        fields = ('volume', 'trades', 'traders', 'open_interest',)
 
 
 class MarketSerializer(serializers.ModelSerializer):
@@ -182,10 +202,11 @@ class MarketSerializer(serializers.ModelSerializer):
     funding = serializers.DecimalField(max_digits=80, decimal_places=0)
     net_outcome_tokens_sold = serializers.ListField(child=serializers.DecimalField(max_digits=80, decimal_places=0, read_only=True))
     stage = serializers.IntegerField()
+    stats = serializers.SerializerMethodField()
 
     class Meta:
         model = Market
-        fields = ('contract', 'event', 'market_maker', 'fee', 'funding', 'net_outcome_tokens_sold', 'stage')
+        fields = ('contract', 'event', 'market_maker', 'fee', 'funding', 'net_outcome_tokens_sold', 'stage', 'stats',)
 
     def to_representation(self, instance):
         response = super(MarketSerializer, self).to_representation(instance)
@@ -194,6 +215,12 @@ class MarketSerializer(serializers.ModelSerializer):
     def get_market_maker(self, obj):
         return add_0x_prefix(obj)
 
+    def get_stats(self, obj):
+        try:
+            return MarketStatsSerializer(obj.stats).data
+        except ObjectDoesNotExist:
+            return None
+
 
 class OutcomeTokenSerializer(serializers.ModelSerializer):
     totalSupply = serializers.DecimalField(source="total_supply", max_digits=80, decimal_places=0)
@@ -206,10 +233,11 @@ class MarketHistorySerializer(serializers.ModelSerializer):
     date = serializers.DateTimeField(source="creation_date_time", read_only=True)
     net_outcome_tokens_sold = serializers.ListField(
         child=serializers.DecimalField(max_digits=80, decimal_places=0, read_only=True))
+    marginal_prices = serializers.ListField(child=serializers.FloatField(read_only=True), read_only=True)
 
     class Meta:
         model = Order
-        fields = ('date', 'net_outcome_tokens_sold')
+        fields = ('date', 'net_outcome_tokens_sold', 'marginal_prices',)
 
     def to_representation(self, instance):
         response = super(MarketHistorySerializer, self).to_representation(instance)
@@ -240,30 +268,25 @@ class MarketParticipantHistorySerializer(serializers.ModelSerializer):
         return add_0x_prefix(obj.sender)
 
     def get_order_type(self, obj):
-        if hasattr(obj, 'sellorder'):
-            return 'SELL'
-        elif hasattr(obj, 'shortsellorder'):
-            return 'SHORT SELL'
-        elif hasattr(obj, 'buyorder'):
-            return 'BUY'
-        else:
-            return 'UNKNOWN'
+        if obj.order_type:
+            return obj.order_type
+        # Orders stored before the discriminator
+        for model in (SellOrder, ShortSellOrder, BuyOrder):
+            if get_subclass_instance(obj, model) is not None:
+                return model.type_name
+        return 'UNKNOWN'
 
     def get_cost(self, obj):
-        order_type = self.get_order_type(obj)
-        if order_type == 'BUY':
-            return obj.buyorder.cost
-        elif order_type == 'SHORT SELL':
-            return obj.shortsellorder.cost
-        else:
-            None
+        order = get_subclass_instance(obj, BuyOrder) or get_subclass_instance(obj, ShortSellOrder)
+        if order is not None:
+            return order.cost
+        return None
 
     def get_profit(self, obj):
-        order_type = self.get_order_type(obj)
-        if order_type == 'SELL':
-            return obj.sellorder.cost
-        else:
-            None
+        order = get_subclass_instance(obj, SellOrder)
+        if order is not None:
+            return order.profit
+        return None
 
     def to_representation(self, instance):
         response = super(MarketParticipantHistorySerializer, self).to_representation(instance)
@@ -277,3 +300,35 @@ class OutcomeTokenBalanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = OutcomeTokenBalance
         fields = ('outcomeToken', 'owner', 'balance', )
+
+
+class PortfolioPositionSerializer(serializers.ModelSerializer):
+    """
+    Serializes an outcome token balance with the markets of its event and their current marginal price
+    of the outcome. The markets must be prefetched (see restapi.views.PortfolioView)
+    """
+    outcomeToken = OutcomeTokenSerializer(source="outcome_token")
+    balance = serializers.DecimalField(max_digits=80, decimal_places=0)
+    markets = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OutcomeTokenBalance
+        fields = ('outcomeToken', 'balance', 'markets',)
+
+    def get_markets(self, obj):
+        markets = []
+        for market in obj.outcome_token.event.market_oracle.all():
+            marginal_prices = calc_market_marginal_prices(market)
+            markets.append(remove_null_values({
+                'address': add_0x_prefix(market.address),
+                'marginal_price': marginal_prices[obj.outcome_token.index] if marginal_prices else None
+            }))
+        return markets
+
+
+class CandleSerializer(serializers.ModelSerializer):
+    volume = serializers.DecimalField(max_digits=80, decimal_places=0)
+
+    class Meta:
+        model = Candle
+        fields = ('start', 'outcome_index', 'open', 'high', 'low', 'close', 'volume',)
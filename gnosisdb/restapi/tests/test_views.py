@@ -5,16 +5,23 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from relationaldb.tests.factories import (
     CentralizedOracleFactory, UltimateOracleFactory,
-    MarketFactory, CategoricalEventFactory, OutcomeTokenFactory, OutcomeTokenBalanceFactory
+    MarketFactory, CategoricalEventFactory, OutcomeTokenFactory, OutcomeTokenBalanceFactory, ScalarEventFactory
 )
-from relationaldb.models import CentralizedOracle, UltimateOracle, Market, ShortSellOrder, BuyOrder
+from relationaldb.models import CentralizedOracle, UltimateOracle, Market, ShortSellOrder, BuyOrder, Candle, MarketStats
 from datetime import datetime, timedelta
-from gnosisdb.utils import add_0x_prefix
+from gnosisdb.utils import add_0x_prefix, calc_lmsr_marginal_prices
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from gnosisdb.block_cache import get_block_cache, publish_changes
+from time import mktime
 import json
 
 
 class TestViews(APITestCase):
 
+    def to_timestamp(self, datetime_instance):
+        return mktime(datetime_instance.timetuple())
+
     def test_centralized_oracle(self):
         # test empty centralized-oracles response
         empty_centralized_response = self.client.get(reverse('api:centralized-oracles'), content_type='application/json')
@@ -39,6 +46,20 @@ class TestViews(APITestCase):
         self.assertEquals(centralized_empty_search_response.status_code, status.HTTP_200_OK)
         self.assertEquals(json.loads(centralized_empty_search_response.content).get('contract').get('creator'), add_0x_prefix(centralized_oracles[0].address))
 
+    def test_centralized_oracle_pending_description(self):
+        centralized_oracle = CentralizedOracleFactory()
+        pending_oracle = CentralizedOracleFactory(event_description=None,
+                                                  pending_ipfs_hash=centralized_oracle.event_description.ipfs_hash)
+        # published once its description is resolved
+        centralized_response = self.client.get(reverse('api:centralized-oracles'), content_type='application/json')
+        results = json.loads(centralized_response.content).get('results')
+        self.assertListEqual([result.get('contract').get('address') for result in results],
+                             [add_0x_prefix(centralized_oracle.address)])
+        pending_response = self.client.get(reverse('api:centralized-oracles-by-address',
+                                                    kwargs={'addr': pending_oracle.address}),
+                                            content_type='application/json')
+        self.assertEquals(pending_response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_ultimate_oracle(self):
         # test empty ultimate-oracles response
         empty_ultimate_response = self.client.get(reverse('api:ultimate-oracles'), content_type='application/json')
@@ -84,6 +105,60 @@ class TestViews(APITestCase):
         self.assertEquals(event_filtered_response.status_code, status.HTTP_200_OK)
         self.assertEquals(json.loads(events_response.content).get('results')[0].get('contract').get('address'), add_0x_prefix(event.address))
 
+    def test_events_type_filter(self):
+        categorical_event = CategoricalEventFactory(oracle=CentralizedOracleFactory())
+        scalar_event = ScalarEventFactory()
+        self.assertEquals(categorical_event.event_type, 'CATEGORICAL')
+        self.assertEquals(scalar_event.event_type, 'SCALAR')
+        self.assertEquals(categorical_event.oracle.oracle_type, 'CENTRALIZED')
+
+        events_response = self.client.get(reverse('api:events') + '?event_type=SCALAR', content_type='application/json')
+        results = json.loads(events_response.content).get('results')
+        self.assertEquals(len(results), 1)
+        self.assertEquals(results[0].get('contract').get('address'), add_0x_prefix(scalar_event.address))
+        self.assertEquals(results[0].get('type'), 'SCALAR')
+
+        events_response = self.client.get(reverse('api:events') + '?oracle_type=CENTRALIZED', content_type='application/json')
+        results = json.loads(events_response.content).get('results')
+        self.assertEquals(len(results), 1)
+        self.assertEquals(results[0].get('contract').get('address'), add_0x_prefix(categorical_event.address))
+
+    def test_events_search(self):
+        def create_event(title, description, outcomes):
+            oracle = CentralizedOracleFactory()
+            event_description = oracle.event_description
+            event_description.title = title
+            event_description.description = description
+            event_description.outcomes = outcomes
+            event_description.save()
+            return CategoricalEventFactory(oracle=oracle)
+
+        election_event = create_event('Who will win the election?', 'Presidential race', ['Alice', 'Bob'])
+        ether_event = create_event('Ether price', 'Will the price of ether reach 1000 dollars?', ['Yes', 'No'])
+        forwarded_event = CategoricalEventFactory(
+            oracle=UltimateOracleFactory(forwarded_oracle=ether_event.oracle))
+        market = MarketFactory(event=election_event)
+
+        events_response = self.client.get(reverse('api:events') + '?search=elections', content_type='application/json')
+        results = json.loads(events_response.content).get('results')
+        self.assertListEqual([result.get('contract').get('address') for result in results],
+                             [add_0x_prefix(election_event.address)])
+
+        # outcomes are searchable, the description of a forwarded oracle too
+        events_response = self.client.get(reverse('api:events') + '?search=bob', content_type='application/json')
+        self.assertEquals(len(json.loads(events_response.content).get('results')), 1)
+        events_response = self.client.get(reverse('api:events') + '?search=ether', content_type='application/json')
+        results = json.loads(events_response.content).get('results')
+        self.assertEquals(set(result.get('contract').get('address') for result in results),
+                          set([add_0x_prefix(ether_event.address), add_0x_prefix(forwarded_event.address)]))
+
+        markets_response = self.client.get(reverse('api:markets') + '?search=presidential', content_type='application/json')
+        results = json.loads(markets_response.content).get('results')
+        self.assertListEqual([result.get('contract').get('address') for result in results],
+                             [add_0x_prefix(market.address)])
+        markets_response = self.client.get(reverse('api:markets') + '?search=ether', content_type='application/json')
+        self.assertEquals(len(json.loads(markets_response.content).get('results')), 0)
+
     def test_markets(self):
         # test empty events response
         empty_markets_response = self.client.get(reverse('api:markets'), content_type='application/json')
@@ -109,6 +184,88 @@ class TestViews(APITestCase):
         self.assertEquals(market_search_response.status_code, status.HTTP_200_OK)
         self.assertEquals(json.loads(market_search_response.content).get('contract').get('address'), add_0x_prefix(markets[0].address))
 
+    def test_markets_conditional_get(self):
+        get_block_cache().clear()
+        market = MarketFactory()
+        other_market = MarketFactory()
+        list_url = reverse('api:markets')
+        detail_url = reverse('api:markets-by-name', kwargs={'addr': market.address})
+
+        # nothing published, no validators
+        self.assertFalse(self.client.get(detail_url).has_header('ETag'))
+
+        publish_changes([market.address], {'number': 1, 'timestamp': self.to_timestamp(datetime.now())})
+        list_etag = self.client.get(list_url)['ETag']
+        detail_response = self.client.get(detail_url)
+        detail_etag = detail_response['ETag']
+        self.assertTrue(detail_response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEquals(len(queries), 0)
+
+        # changes of other contracts only invalidate the lists
+        publish_changes([other_market.address], {'number': 2, 'timestamp': self.to_timestamp(datetime.now())})
+        self.assertEquals(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code,
+                          status.HTTP_304_NOT_MODIFIED)
+        self.assertEquals(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, status.HTTP_200_OK)
+
+        publish_changes([market.address], {'number': 2, 'timestamp': self.to_timestamp(datetime.now())})
+        self.assertEquals(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, status.HTTP_200_OK)
+        get_block_cache().clear()
+
+    def test_markets_response_cache(self):
+        get_block_cache().clear()
+        market = MarketFactory()
+        other_market = MarketFactory()
+        detail_url = reverse('api:markets-by-name', kwargs={'addr': market.address})
+        publish_changes([market.address, other_market.address], {'number': 1, 'timestamp': 1})
+
+        response = self.client.get(detail_url)
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get(detail_url)
+        self.assertEquals(len(queries), 0)
+        self.assertEquals(json.loads(response.content), json.loads(cached_response.content))
+
+        # the query string is normalized
+        self.client.get(reverse('api:markets') + '?limit=5&offset=0')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api:markets') + '?offset=0&limit=5')
+        self.assertEquals(len(queries), 0)
+
+        # a block touching another market keeps the entry
+        publish_changes([other_market.address], {'number': 2, 'timestamp': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(detail_url)
+        self.assertEquals(len(queries), 0)
+
+        market.stage = 2
+        market.save()
+        publish_changes([market.address], {'number': 3, 'timestamp': 3})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(detail_url)
+        self.assertGreater(len(queries), 0)
+        self.assertEquals(json.loads(response.content).get('stage'), 2)
+        get_block_cache().clear()
+
+    def test_markets_address_filter(self):
+        markets = [MarketFactory() for x in range(0, 3)]
+
+        url = reverse('api:markets') + '?creator=' + add_0x_prefix(markets[0].creator) + '&creator=' + markets[1].creator
+        with CaptureQueriesContext(connection) as queries:
+            market_response_data = self.client.get(url, content_type='application/json')
+        results = json.loads(market_response_data.content).get('results')
+        self.assertEquals(len(results), 2)
+        self.assertEquals(set(result.get('contract').get('creator') for result in results),
+                          set(add_0x_prefix(market.creator) for market in markets[0:2]))
+        # the accepted values are not enumerated from the table
+        self.assertFalse(any('DISTINCT' in query['sql'] for query in queries))
+
+        url = reverse('api:markets') + '?creator=abcdef0'
+        market_response_data = self.client.get(url, content_type='application/json')
+        self.assertEquals(len(json.loads(market_response_data.content).get('results')), 0)
+
     def test_markets_with_event_description(self):
         # test empty events response
         empty_markets_response = self.client.get(reverse('api:markets'), content_type='application/json')
@@ -128,6 +285,48 @@ class TestViews(APITestCase):
         self.assertIsNotNone(results[0]['event']['oracle']['eventDescription'].get('ipfsHash'))
         self.assertEqual(results[0]['event']['oracle']['eventDescription']['ipfsHash'], oracle.event_description.ipfs_hash)
 
+    def test_markets_query_count(self):
+        def create_market():
+            oracle = CentralizedOracleFactory()
+            return MarketFactory(event=CategoricalEventFactory(oracle=oracle))
+
+        create_market()
+        with CaptureQueriesContext(connection) as single_market_queries:
+            self.client.get(reverse('api:markets'), content_type='application/json')
+
+        for x in range(0, 5):
+            create_market()
+        with CaptureQueriesContext(connection) as markets_queries:
+            market_response_data = self.client.get(reverse('api:markets'), content_type='application/json')
+
+        results = json.loads(market_response_data.content).get('results')
+        self.assertEquals(len(results), 6)
+        self.assertTrue(all(result['event']['oracle']['eventDescription'].get('outcomes') for result in results))
+        # the polymorphic children are joined, the number of queries doesn't depend on the page size
+        self.assertEquals(len(single_market_queries), len(markets_queries))
+
+    def test_markets_stats(self):
+        markets = [MarketFactory() for x in range(0, 3)]
+        MarketStats.objects.create(market=markets[0], volume=10, trades=2, traders=1, open_interest=5)
+        MarketStats.objects.create(market=markets[1], volume=30, trades=1, traders=1, open_interest=0)
+        MarketStats.objects.create(market=markets[2])
+
+        market_response = self.client.get(reverse('api:markets-by-name', kwargs={'addr': markets[0].address}), content_type='application/json')
+        stats = json.loads(market_response.content).get('stats')
+        self.assertEquals(stats.get('volume'), '10')
+        self.assertEquals(stats.get('trades'), 2)
+        self.assertEquals(stats.get('openInterest'), '5')
+
+        markets_response = self.client.get(reverse('api:markets') + '?ordering=-volume_order', content_type='application/json')
+        results = json.loads(markets_response.content).get('results')
+        self.assertListEqual([result.get('contract').get('address') for result in results],
+                             [add_0x_prefix(markets[index].address) for index in (1, 0, 2)])
+
+        # markets without stats are served without them
+        market = MarketFactory()
+        market_response = self.client.get(reverse('api:markets-by-name', kwargs={'addr': market.address}), content_type='application/json')
+        self.assertIsNone(json.loads(market_response.content).get('stats'))
+
     def test_decimal_field_frontier_value(self):
         market = MarketFactory()
         market.funding = 2 ** 256
@@ -170,6 +369,81 @@ class TestViews(APITestCase):
         self.assertEquals(response.status_code, status.HTTP_200_OK)
         self.assertEquals(len(json.loads(response.content).get('results')), 1)
 
+    def test_all_shares_joined(self):
+        market = MarketFactory()
+        outcome_tokens = [OutcomeTokenFactory(event=market.event, index=index) for index in (0, 1)]
+        OutcomeTokenBalanceFactory(outcome_token=outcome_tokens[0], balance=5)
+        # balances of other markets and empty balances are not shares
+        OutcomeTokenBalanceFactory(balance=50)
+        OutcomeTokenBalanceFactory(outcome_token=outcome_tokens[1], balance=0)
+        url = reverse('api:all-shares', kwargs={'market_address': market.address})
+
+        with CaptureQueriesContext(connection) as single_share_queries:
+            response = self.client.get(url, content_type='application/json')
+        self.assertEquals(len(json.loads(response.content).get('results')), 1)
+
+        for balance in (10, 1, 7):
+            OutcomeTokenBalanceFactory(outcome_token=outcome_tokens[1], balance=balance)
+        with CaptureQueriesContext(connection) as shares_queries:
+            response = self.client.get(url, content_type='application/json')
+        results = json.loads(response.content).get('results')
+        self.assertListEqual([result.get('balance') for result in results], ['10', '7', '5', '1'])
+        self.assertEquals(len(single_share_queries), len(shares_queries))
+
+    def test_portfolio(self):
+        owner = '{:040d}'.format(1)
+        url = reverse('api:portfolio', kwargs={'account_address': owner})
+
+        def create_position():
+            market = MarketFactory(funding=100, net_outcome_tokens_sold=[10, 0])
+            outcome_token = OutcomeTokenFactory(event=market.event, index=0)
+            OutcomeTokenBalanceFactory(owner=owner, outcome_token=outcome_token, balance=5)
+            return market
+
+        market = create_position()
+        # empty balances are not positions
+        OutcomeTokenBalanceFactory(owner=owner, balance=0)
+        with CaptureQueriesContext(connection) as single_position_queries:
+            response = self.client.get(url, content_type='application/json')
+        results = json.loads(response.content).get('results')
+        self.assertEquals(len(results), 1)
+        self.assertEquals(results[0].get('balance'), '5')
+        self.assertEquals(results[0].get('markets')[0].get('address'), add_0x_prefix(market.address))
+        self.assertEquals(results[0].get('markets')[0].get('marginalPrice'), calc_lmsr_marginal_prices([10, 0], 100)[0])
+
+        for x in range(0, 3):
+            create_position()
+        with CaptureQueriesContext(connection) as positions_queries:
+            response = self.client.get(url + '?limit=2', content_type='application/json')
+        response_data = json.loads(response.content)
+        self.assertEquals(len(response_data.get('results')), 2)
+        self.assertEquals(len(single_position_queries), len(positions_queries))
+
+        response_data = json.loads(self.client.get(response_data.get('next'), content_type='application/json').content)
+        self.assertEquals(len(response_data.get('results')), 2)
+        self.assertIsNone(response_data.get('next'))
+
+    def test_portfolio_conditional_get(self):
+        get_block_cache().clear()
+        owner = '{:040d}'.format(1)
+        market = MarketFactory()
+        outcome_token = OutcomeTokenFactory(event=market.event, index=0)
+        OutcomeTokenBalanceFactory(owner=owner, outcome_token=outcome_token, balance=5)
+        other_market = MarketFactory()
+        url = reverse('api:portfolio', kwargs={'account_address': owner})
+
+        publish_changes([owner], {'number': 1, 'timestamp': 1})
+        etag = self.client.get(url)['ETag']
+
+        # blocks touching neither the account nor its markets keep the portfolio fresh
+        publish_changes([other_market.address], {'number': 2, 'timestamp': 2})
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # trades of other accounts change the prices of the positions
+        publish_changes([market.address], {'number': 3, 'timestamp': 3})
+        self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        get_block_cache().clear()
+
     def test_market_history(self):
         # create markets
         outcome_token = OutcomeTokenFactory()
@@ -217,6 +491,38 @@ class TestViews(APITestCase):
         self.assertEquals(history_data.status_code, status.HTTP_200_OK)
         self.assertEquals(len(json.loads(history_data.content).get('results')), 1)
 
+    def test_market_history_keyset_pagination(self):
+        outcome_token = OutcomeTokenFactory()
+        market = MarketFactory(event=outcome_token.event)
+        creation_date_time = datetime.now()
+
+        # two orders share the same date, the id breaks the tie
+        for minutes in (0, 0, 1):
+            order = BuyOrder()
+            order.creation_date_time = creation_date_time + timedelta(minutes=minutes)
+            order.creation_block = 0
+            order.market = market
+            order.sender = '0x1'
+            order.outcome_token = outcome_token
+            order.outcome_token_count = 1
+            order.cost = 1
+            order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+            order.save()
+
+        url = reverse('api:history-by-market') + '?market=' + market.address + '&limit=2&cursor='
+        history_data = json.loads(self.client.get(url, content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 2)
+        self.assertIsNone(history_data.get('count'))
+        self.assertIsNotNone(history_data.get('next'))
+
+        history_data = json.loads(self.client.get(history_data.get('next'), content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 1)
+        self.assertIsNone(history_data.get('next'))
+
+        url = reverse('api:history-by-market') + '?market=' + market.address + '&cursor=invalid'
+        self.assertEquals(self.client.get(url, content_type='application/json').status_code,
+                          status.HTTP_404_NOT_FOUND)
+
     def test_history_unknown_market(self):
         market = MarketFactory()
         url = reverse('api:history-by-market') + '?market=' + market.address
@@ -228,6 +534,118 @@ class TestViews(APITestCase):
         history_data = self.client.get(url, content_type='application/json')
         self.assertEquals(history_data.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_market_history_downsampling(self):
+        outcome_token = OutcomeTokenFactory()
+        market = MarketFactory(event=outcome_token.event)
+        start = datetime(2017, 1, 1)
+
+        for minutes in (0, 10, 50, 120):
+            order = BuyOrder()
+            order.creation_date_time = start + timedelta(minutes=minutes)
+            order.creation_block = minutes
+            order.market = market
+            order.sender = '0x1'
+            order.outcome_token = outcome_token
+            order.outcome_token_count = 1
+            order.cost = 1
+            order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+            order.save()
+
+        url = reverse('api:history-by-market') + '?market=' + market.address
+        # one point per hour, the last order of the hour
+        history_data = json.loads(self.client.get(url + '&resolution=1h', content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 2)
+        self.assertEquals(history_data.get('results')[0].get('date'), (start + timedelta(minutes=50)).isoformat())
+        self.assertEquals(history_data.get('results')[1].get('date'), (start + timedelta(minutes=120)).isoformat())
+
+        history_data = json.loads(self.client.get(url + '&max_points=2', content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 2)
+        history_data = json.loads(self.client.get(url + '&max_points=1', content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 1)
+        self.assertEquals(history_data.get('results')[0].get('date'), (start + timedelta(minutes=120)).isoformat())
+        history_data = json.loads(self.client.get(url + '&resolution=1m', content_type='application/json').content)
+        self.assertEquals(len(history_data.get('results')), 4)
+
+        for query in ('&resolution=1w', '&resolution=0h', '&max_points=0', '&max_points=a'):
+            self.assertEquals(self.client.get(url + query, content_type='application/json').status_code,
+                              status.HTTP_400_BAD_REQUEST)
+
+    def test_market_candles(self):
+        market = MarketFactory()
+        start = datetime(2017, 1, 1)
+        for hours in (0, 1):
+            for outcome_index in (0, 1):
+                Candle.objects.create(market=market, outcome_index=outcome_index, interval='1h',
+                                      start=start + timedelta(hours=hours), open=0.5, high=0.6, low=0.4,
+                                      close=0.5, volume=10)
+        Candle.objects.create(market=market, outcome_index=0, interval='1d', start=start,
+                              open=0.5, high=0.6, low=0.4, close=0.5, volume=20)
+
+        url = reverse('api:candles-by-market', kwargs={'market_address': market.address})
+        candles_data = json.loads(self.client.get(url + '?interval=1h', content_type='application/json').content)
+        self.assertEquals(len(candles_data.get('results')), 4)
+        self.assertEquals(candles_data.get('results')[0].get('outcomeIndex'), 0)
+        self.assertEquals(candles_data.get('results')[0].get('high'), 0.6)
+
+        candles_data = json.loads(self.client.get(url + '?interval=1h&outcome_index=1', content_type='application/json').content)
+        self.assertEquals(len(candles_data.get('results')), 2)
+        query = '?interval=1h&start_0=' + (start + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M:%S')
+        candles_data = json.loads(self.client.get(url + query, content_type='application/json').content)
+        self.assertEquals(len(candles_data.get('results')), 2)
+        candles_data = json.loads(self.client.get(url + '?interval=1d', content_type='application/json').content)
+        self.assertEquals(len(candles_data.get('results')), 1)
+
+        self.assertEquals(self.client.get(url, content_type='application/json').status_code,
+                          status.HTTP_400_BAD_REQUEST)
+        url = reverse('api:candles-by-market', kwargs={'market_address': market.event.address})
+        self.assertEquals(self.client.get(url + '?interval=1h', content_type='application/json').status_code,
+                          status.HTTP_404_NOT_FOUND)
+
+    def test_market_history_export(self):
+        outcome_token = OutcomeTokenFactory()
+        market = MarketFactory(event=outcome_token.event)
+        creation_date_time = datetime.now()
+
+        for minutes in (0, 1):
+            order = BuyOrder()
+            order.creation_date_time = creation_date_time + timedelta(minutes=minutes)
+            order.creation_block = minutes
+            order.market = market
+            order.sender = '0x1'
+            order.outcome_token = outcome_token
+            order.outcome_token_count = 1
+            order.cost = 5
+            order.net_outcome_tokens_sold = market.net_outcome_tokens_sold
+            order.save()
+
+        url = reverse('api:history-export') + '?market=' + market.address
+        export_response = self.client.get(url)
+        self.assertEquals(export_response.status_code, status.HTTP_200_OK)
+        self.assertTrue(export_response.streaming)
+        rows = [json.loads(line) for line in b''.join(export_response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEquals(len(rows), 2)
+        self.assertEquals([row['block'] for row in rows], [0, 1])
+        self.assertEquals(rows[0]['order_type'], 'BUY')
+        self.assertEquals(rows[0]['cost'], '5')
+        self.assertEquals(rows[0]['outcome_token_index'], outcome_token.index)
+
+        export_response = self.client.get(url + '&format=csv')
+        self.assertEquals(export_response.status_code, status.HTTP_200_OK)
+        lines = b''.join(export_response.streaming_content).decode('utf-8').splitlines()
+        self.assertEquals(len(lines), 3)
+        self.assertTrue(lines[0].startswith('id,date,block,order_type'))
+
+        to_date = (creation_date_time + timedelta(seconds=30)).strftime('%Y-%m-%d %H:%M:%S')
+        export_response = self.client.get(url + '&to=' + to_date)
+        self.assertEquals(len(b''.join(export_response.streaming_content).splitlines()), 1)
+
+        self.assertEquals(self.client.get(url + '&format=xml').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(url + '&from=yesterday').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(url + '&to=2017-02-30').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(reverse('api:history-export')).status_code, status.HTTP_400_BAD_REQUEST)
+        url = reverse('api:history-export') + '?market=' + outcome_token.address
+        self.assertEquals(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
     def test_market_participant_history(self):
         outcome_token = OutcomeTokenFactory()
         event = outcome_token.event
@@ -272,4 +690,6 @@ class TestViews(APITestCase):
             content_type='application/json'
         )
         self.assertEquals(response.status_code, status.HTTP_200_OK)
-        self.assertEquals(len(json.loads(response.content).get('results')), 2)
\ No newline at end of file
+        self.assertEquals(len(json.loads(response.content).get('results')), 2)
+        self.assertListEqual([result.get('orderType') for result in json.loads(response.content).get('results')],
+                             ['BUY', 'SHORT SELL'])
\ No newline at end of file
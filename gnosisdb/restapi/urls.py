@@ -16,6 +16,9 @@ urlpatterns = [
     url(r'^markets/(?P<market_address>[a-fA-F0-9]+)/shares/$', views.AllMarketSharesView.as_view(), name='all-shares'),
     url(r'^markets/(?P<market_address>[a-fA-F0-9]+)/shares/(?P<owner_address>[a-fA-F0-9]+)/$', views.MarketSharesView.as_view(), name='shares-by-owner'),
     url(r'^markets/(?P<market_address>[a-fA-F0-9]+)/trades/(?P<owner_address>[a-fA-F0-9]+)/$', views.MarketParticipantHistoryView.as_view(), name='trades-by-owner'),
+    url(r'^markets/(?P<market_address>[a-fA-F0-9]+)/candles/$', views.MarketCandlesView.as_view(), name='candles-by-market'),
+    url(r'^accounts/(?P<account_address>[a-fA-F0-9]+)/portfolio/$', views.PortfolioView.as_view(), name='portfolio'),
     url(r'^factories/$', views.factories_view, name='factories'),
     url(r'^history/$', views.MarketHistoryView.as_view(), name='history-by-market'),
+    url(r'^history/export/$', views.market_history_export_view, name='history-export'),
 ]
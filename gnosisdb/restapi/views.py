@@ -1,79 +1,217 @@
 from django.conf import settings
+from django.core.cache import caches
+from django.utils.six.moves.urllib.parse import urlencode
 from django.shortcuts import get_object_or_404, get_list_or_404
 from rest_framework import generics
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.exceptions import ParseError
-from django.http import Http404
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_GET
+from gnosisdb.block_cache import get_blocks, get_block_datetime
+import hashlib
 from relationaldb.models import (
-    UltimateOracle, CentralizedOracle, Event, Market, Order, OutcomeTokenBalance
+    UltimateOracle, CentralizedOracle, Event, Market, Order, OutcomeTokenBalance, Candle
 )
 from .serializers import (
     UltimateOracleSerializer, CentralizedOracleSerializer, EventSerializer, MarketSerializer,
-    MarketHistorySerializer, OutcomeTokenBalanceSerializer, MarketParticipantHistorySerializer
+    MarketHistorySerializer, OutcomeTokenBalanceSerializer, MarketParticipantHistorySerializer, CandleSerializer,
+    PortfolioPositionSerializer
 )
 from .filters import (
-    CentralizedOracleFilter, UltimateOracleFilter, EventFilter, MarketFilter, DefaultPagination)
+    CentralizedOracleFilter, UltimateOracleFilter, EventFilter, MarketFilter, CandleFilter, DefaultPagination,
+    KeysetPagination, CandlePagination, PortfolioPagination, downsample_orders, parse_resolution, parse_max_points,
+    parse_date_bound)
+from .export import get_order_rows, stream_ndjson, stream_csv
 
 
-class CentralizedOracleListView(generics.ListAPIView):
-    queryset = CentralizedOracle.objects.all()
+def related_paths(prefix, paths):
+    return tuple(prefix + '__' + path for path in paths)
+
+
+# Joins resolving the multi-table inheritance children read by the serializers, so a page of
+# results is fetched with a single query whatever its size
+EVENT_DESCRIPTION_RELATIONS = ('scalareventdescription', 'categoricaleventdescription',)
+CENTRALIZED_ORACLE_RELATIONS = related_paths('event_description', EVENT_DESCRIPTION_RELATIONS)
+ORACLE_RELATIONS = (
+    related_paths('centralizedoracle', CENTRALIZED_ORACLE_RELATIONS) +
+    related_paths('ultimateoracle__forwarded_oracle__centralizedoracle', CENTRALIZED_ORACLE_RELATIONS) +
+    ('ultimateoracle__forwarded_oracle__ultimateoracle',)
+)
+ULTIMATE_ORACLE_RELATIONS = related_paths('forwarded_oracle', ORACLE_RELATIONS)
+EVENT_RELATIONS = related_paths('categoricalevent__oracle', ORACLE_RELATIONS) + \
+    related_paths('scalarevent__oracle', ORACLE_RELATIONS)
+MARKET_RELATIONS = ('stats',) + related_paths('event', EVENT_RELATIONS)
+ORDER_RELATIONS = ('market', 'outcome_token', 'buyorder', 'sellorder', 'shortsellorder',)
+
+
+ADDRESS_KWARGS = ('addr', 'market_address', 'owner_address', 'account_address',)
+
+
+def get_account_markets(account_address):
+    """Returns the addresses of the markets the account holds shares of"""
+    return Market.objects.filter(
+        event__outcometoken__outcometokenbalance__owner=account_address,
+        event__outcometoken__outcometokenbalance__balance__gt=0
+    ).values_list('address', flat=True).distinct()
+
+
+def get_request_blocks(request, kwargs):
+    """
+    Returns the last blocks which changed the contracts of the request, the addresses of detail views
+    and market histories or the whole database for list views. Read once per request, the ETag, the
+    Last-Modified and the response cache key share them
+    :return: list of (number, timestamp, generation) tuples, None if no block was published yet
+    """
+    # the conditional decorator sees the Django request, the views the REST framework one wrapping it
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, 'request_blocks'):
+        http_request.request_blocks = read_request_blocks(http_request, kwargs)
+    return http_request.request_blocks
+
+
+def read_request_blocks(request, kwargs):
+    addresses = [kwargs[kwarg] for kwarg in ADDRESS_KWARGS if kwarg in kwargs]
+    if 'account_address' in kwargs:
+        # the portfolio nests the marginal prices of the markets of its positions
+        addresses.extend(get_account_markets(kwargs['account_address']))
+    if request.GET.get('market'):
+        addresses.append(request.GET['market'])
+
+    last_block, address_blocks = get_blocks(addresses)
+    if last_block is None:
+        return None
+    if not addresses:
+        return [last_block]
+    # contracts not changed since the cache was started are as fresh as the last block
+    return [address_blocks[address] or last_block for address in addresses]
+
+
+def get_request_etag(request, *args, **kwargs):
+    blocks = get_request_blocks(request, kwargs)
+    if blocks is None:
+        return None
+    key = '|'.join(
+        [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] +
+        ['{}-{}'.format(block[0], block[2]) for block in blocks]
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def get_request_last_modified(request, *args, **kwargs):
+    blocks = get_request_blocks(request, kwargs)
+    if blocks is None:
+        return None
+    block_datetimes = [get_block_datetime(block) for block in blocks]
+    if None in block_datetimes:
+        return None
+    return max(block_datetimes)
+
+
+class BlockConditionalMixin(object):
+    """
+    Emits ETag and Last-Modified from the last blocks which changed the requested data, conditional
+    requests still fresh are answered with 304 from the block cache, with one cache round trip. The
+    portfolio also queries the markets of the account, as their prices are part of its data
+    """
+
+    @method_decorator(condition(etag_func=get_request_etag, last_modified_func=get_request_last_modified))
+    def dispatch(self, request, *args, **kwargs):
+        return super(BlockConditionalMixin, self).dispatch(request, *args, **kwargs)
+
+
+class ResponseCacheMixin(object):
+    """
+    Serves the GET responses from the response cache. Entries are keyed by the normalized query string
+    and the last blocks which changed the requested contracts, so ingesting a block only invalidates
+    the entries of the contracts it touched
+    """
+
+    def get_response_cache_key(self, request):
+        blocks = get_request_blocks(request, self.kwargs)
+        if blocks is None:
+            return None
+        query = urlencode(sorted((key, sorted(request.GET.getlist(key))) for key in request.GET), doseq=True)
+        key = '|'.join([request.path, query] + ['{}-{}'.format(block[0], block[2]) for block in blocks])
+        return 'response:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        cache = caches[settings.RESPONSE_CACHE]
+        key = self.get_response_cache_key(request)
+        if key is not None:
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+
+        response = super(ResponseCacheMixin, self).get(request, *args, **kwargs)
+        if key is not None and response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+# oracles whose event description is pending or not valid are published once it is resolved
+PUBLISHED_CENTRALIZED_ORACLES = CentralizedOracle.objects.filter(event_description__isnull=False)
+
+
+class CentralizedOracleListView(BlockConditionalMixin, generics.ListAPIView):
+    queryset = PUBLISHED_CENTRALIZED_ORACLES.select_related(*CENTRALIZED_ORACLE_RELATIONS)
     serializer_class = CentralizedOracleSerializer
     filter_class = CentralizedOracleFilter
     pagination_class = DefaultPagination
 
 
-class CentralizedOracleFetchView(generics.RetrieveAPIView):
-    queryset = CentralizedOracle.objects.all()
+class CentralizedOracleFetchView(BlockConditionalMixin, generics.RetrieveAPIView):
+    queryset = PUBLISHED_CENTRALIZED_ORACLES.select_related(*CENTRALIZED_ORACLE_RELATIONS)
     serializer_class = CentralizedOracleSerializer
 
     def get_object(self):
-        return get_object_or_404(CentralizedOracle, address=self.kwargs['addr'])
+        return get_object_or_404(self.get_queryset(), address=self.kwargs['addr'])
 
 
-class UltimateOracleListView(generics.ListAPIView):
-    queryset = UltimateOracle.objects.all()
+class UltimateOracleListView(BlockConditionalMixin, generics.ListAPIView):
+    queryset = UltimateOracle.objects.select_related(*ULTIMATE_ORACLE_RELATIONS)
     serializer_class = UltimateOracleSerializer
     filter_class = UltimateOracleFilter
     pagination_class = DefaultPagination
 
 
-class UltimateOracleFetchView(generics.RetrieveAPIView):
-    queryset = UltimateOracle.objects.all()
+class UltimateOracleFetchView(BlockConditionalMixin, generics.RetrieveAPIView):
+    queryset = UltimateOracle.objects.select_related(*ULTIMATE_ORACLE_RELATIONS)
     serializer_class = UltimateOracleSerializer
 
     def get_object(self):
-        return get_object_or_404(UltimateOracle, address=self.kwargs['addr'])
+        return get_object_or_404(self.get_queryset(), address=self.kwargs['addr'])
 
 
-class EventListView(generics.ListAPIView):
-    queryset = Event.objects.all()
+class EventListView(BlockConditionalMixin, ResponseCacheMixin, generics.ListAPIView):
+    queryset = Event.objects.select_related(*EVENT_RELATIONS)
     serializer_class = EventSerializer
     filter_class = EventFilter
     pagination_class = DefaultPagination
 
 
-class EventFetchView(generics.RetrieveAPIView):
-    queryset = Event.objects.all()
+class EventFetchView(BlockConditionalMixin, generics.RetrieveAPIView):
+    queryset = Event.objects.select_related(*EVENT_RELATIONS)
     serializer_class = EventSerializer
 
     def get_object(self):
-        return get_object_or_404(Event, address=self.kwargs['addr'])
+        return get_object_or_404(self.get_queryset(), address=self.kwargs['addr'])
 
 
-class MarketListView(generics.ListAPIView):
-    queryset = Market.objects.all()
+class MarketListView(BlockConditionalMixin, ResponseCacheMixin, generics.ListAPIView):
+    queryset = Market.objects.select_related(*MARKET_RELATIONS)
     serializer_class = MarketSerializer
     filter_class = MarketFilter
     pagination_class = DefaultPagination
 
 
-class MarketFetchView(generics.RetrieveAPIView):
-    queryset = Market.objects.all()
+class MarketFetchView(BlockConditionalMixin, ResponseCacheMixin, generics.RetrieveAPIView):
+    queryset = Market.objects.select_related(*MARKET_RELATIONS)
     serializer_class = MarketSerializer
 
     def get_object(self):
-        return get_object_or_404(Market, address=self.kwargs['addr'])
+        return get_object_or_404(self.get_queryset(), address=self.kwargs['addr'])
 
 
 @api_view(['GET'])
@@ -96,21 +234,44 @@ def factories_view(request):
     return Response(factories)
 
 
-class MarketSharesView(generics.ListAPIView):
+def get_market_shares(market_address):
+    """
+    Returns the non-zero outcome token balances of a market, largest first. The outcome tokens are
+    joined through the market event, balances and their outcome tokens are read in a single query.
+    The balances of each outcome token are found with balance_token_balance_idx, then sorted: no index
+    can order the balances of several outcome tokens, but a market only has a few outcomes
+    """
+    return OutcomeTokenBalance.objects.filter(
+        outcome_token__event__market_oracle=market_address,
+        balance__gt=0
+    ).select_related('outcome_token').order_by('-balance', 'id')
+
+
+class MarketSharesView(BlockConditionalMixin, generics.ListAPIView):
     serializer_class = OutcomeTokenBalanceSerializer
     # filter_class = MarketShareEntryFilter
     pagination_class = DefaultPagination
 
     def get_queryset(self):
-        market = get_object_or_404(Market, address=self.kwargs['market_address'])
-        outcome_tokens = market.event.outcometoken_set.values_list('address', flat=True)
+        return get_market_shares(self.kwargs['market_address']).filter(owner=self.kwargs['owner_address'])
+
+
+class PortfolioView(BlockConditionalMixin, generics.ListAPIView):
+    """
+    Returns the non-zero outcome token balances of an owner across all markets, with the markets of
+    each outcome and their current marginal price. Pages cost a constant number of queries.
+    """
+    serializer_class = PortfolioPositionSerializer
+    pagination_class = PortfolioPagination
+
+    def get_queryset(self):
         return OutcomeTokenBalance.objects.filter(
-            owner=self.kwargs['owner_address'],
-            outcome_token__address__in=list(outcome_tokens)
-        )
+            owner=self.kwargs['account_address'],
+            balance__gt=0
+        ).select_related('outcome_token__event').prefetch_related('outcome_token__event__market_oracle')
 
 
-class AllMarketSharesView(generics.ListAPIView):
+class AllMarketSharesView(BlockConditionalMixin, ResponseCacheMixin, generics.ListAPIView):
     """
     Returns all outcome token balances (market shares) for all users in a market
     """
@@ -118,35 +279,41 @@ class AllMarketSharesView(generics.ListAPIView):
     pagination_class = DefaultPagination
 
     def get_queryset(self):
-        return OutcomeTokenBalance.objects.filter(
-            outcome_token__address__in=list(
-                Market.objects.get(
-                    address=self.kwargs['market_address']
-                ).event.outcometoken_set.values_list('address', flat=True)
-            )
-        )
+        return get_market_shares(self.kwargs['market_address'])
 
 
-class MarketParticipantHistoryView(generics.ListAPIView):
+class MarketParticipantHistoryView(BlockConditionalMixin, generics.ListAPIView):
 
     serializer_class = MarketParticipantHistorySerializer
-    pagination_class = DefaultPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Order.objects.filter(
             market=self.kwargs['market_address'],
             sender=self.kwargs['owner_address']
-        ).order_by('creation_date_time')
+        ).select_related(*ORDER_RELATIONS).order_by('creation_date_time')
 
 
-class MarketHistoryView(generics.ListAPIView):
+class MarketHistoryView(BlockConditionalMixin, ResponseCacheMixin, generics.ListAPIView):
     """
     Returns the list of orders by providing the market address, as well as the 'From' and 'To'
     parameters referring the order creation date.
+    The 'resolution' (e.g. 1h) and 'max_points' parameters return one point per time bucket instead,
+    the last order of the bucket, without pagination.
     """
     queryset = Order.objects.all()
     serializer_class = MarketHistorySerializer
-    pagination_class = DefaultPagination
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        resolution = parse_resolution(request.query_params.get('resolution'))
+        max_points = parse_max_points(request.query_params.get('max_points'))
+        if resolution is None and max_points is None:
+            return super(MarketHistoryView, self).list(request, *args, **kwargs)
+
+        orders = downsample_orders(self.filter_queryset(self.get_queryset()), resolution, max_points)
+        serializer = self.get_serializer(orders, many=True)
+        return Response({'results': serializer.data})
 
     def get_queryset(self):
         if 'market' in self.request.query_params and 'from' in self.request.query_params \
@@ -157,9 +324,66 @@ class MarketHistoryView(generics.ListAPIView):
             return Order.objects.filter(market=self.request.query_params['market'], creation_date_time__gte=self.request.query_params['from']).order_by('creation_date_time')
         elif 'market' in self.request.query_params:
             balances = Order.objects.filter(market=self.request.query_params['market']).order_by('creation_date_time')
-            if balances.count():
+            if balances.exists():
                 return balances
             else:
                 raise Http404('Unknown Market')
         else:
             raise ParseError()
+
+
+class MarketCandlesView(BlockConditionalMixin, ResponseCacheMixin, generics.ListAPIView):
+    """
+    Returns the open, high, low and close marginal prices and volume of the market outcomes over the
+    'interval' parameter (1m, 1h or 1d), filtered by 'outcome_index' and 'start_0'/'start_1' range.
+    """
+    serializer_class = CandleSerializer
+    filter_class = CandleFilter
+    pagination_class = CandlePagination
+
+    def get_queryset(self):
+        intervals = [interval for interval, _ in Candle.intervals]
+        interval = self.request.query_params.get('interval')
+        if interval not in intervals:
+            raise ParseError('Invalid interval, expected one of: ' + ', '.join(intervals))
+        if not Market.objects.filter(address=self.kwargs['market_address']).exists():
+            raise Http404('Unknown Market')
+        return Candle.objects.filter(
+            market=self.kwargs['market_address'],
+            interval=interval
+        ).order_by('start', 'outcome_index')
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', stream_ndjson),
+    'csv': ('text/csv', stream_csv),
+}
+
+
+@require_GET
+def market_history_export_view(request):
+    """
+    Streams every order of a market, optionally between the 'from' and 'to' creation dates, as
+    newline delimited json or csv ('format' parameter). Rows are read with a server side cursor and
+    written as they come, the whole history is never held in memory.
+    """
+    if 'market' not in request.GET:
+        return HttpResponseBadRequest('Missing market parameter')
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unsupported format, use one of: ' + ', '.join(sorted(EXPORT_FORMATS)))
+
+    bounds = {}
+    for param, lookup in (('from', 'creation_date_time__gte'), ('to', 'creation_date_time__lte')):
+        if param in request.GET:
+            bounds[lookup] = parse_date_bound(request.GET[param])
+            if bounds[lookup] is None:
+                return HttpResponseBadRequest('Invalid {} date'.format(param))
+
+    market = get_object_or_404(Market, address=request.GET['market'])
+    orders = Order.objects.filter(market=market, **bounds)
+
+    content_type, stream = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(get_order_rows(orders)), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(market.address, export_format)
+    return response
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 import sys
 import environ
+from datetime import timedelta
 from gnosisdb.chainevents.abis import abi_file_path, load_json_file
 
 TIME_ZONE = 'UTC'
@@ -166,8 +167,17 @@ BROKER_CONNECTION_TIMEOUT = 10
 # Celery configuration
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = 'djcelery.backends.cache:CacheBackend'
-# configure queues, currently we have only one
+# configure queues, IPFS fetches run on their own queue so they never block chain ingestion
 CELERY_DEFAULT_QUEUE = 'default'
+CELERY_ROUTES = {
+    'relationaldb.tasks.resolve_event_description': {'queue': 'ipfs'},
+}
+CELERYBEAT_SCHEDULE = {
+    'resolve-pending-event-descriptions': {
+        'task': 'relationaldb.tasks.resolve_pending_event_descriptions',
+        'schedule': timedelta(minutes=10),
+    },
+}
 
 # Sensible settings for celery
 CELERY_ALWAYS_EAGER = False
@@ -189,9 +199,55 @@ CELERYD_PREFETCH_MULTIPLIER = 1
 CELERYD_MAX_TASKS_PER_CHILD = 1000
 CELERY_LOCK_EXPIRE = 60
 
+# CACHES
+# The block cache is written by the workers and read by the web processes, which run in separate containers.
+# It defaults to a table of the shared database (python manage.py createcachetable), BLOCK_CACHE_URL can point
+# it to memcached or redis instead, e.g. memcache://memcached:11211 or rediscache://redis:6379/1
+env = environ.Env()
+BLOCK_CACHE_CONFIG = env.cache('BLOCK_CACHE_URL', default='dbcache://gnosisdb_block_cache')
+if BLOCK_CACHE_CONFIG['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache':
+    BLOCK_CACHE_CONFIG['OPTIONS'] = {'MAX_ENTRIES': 100000}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'blocks': BLOCK_CACHE_CONFIG,
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+# Cache storing the last block which changed each contract, used for the HTTP conditional requests
+BLOCK_CACHE = 'blocks'
+# Cache of the API responses, its entries are invalidated through the block cache so it can be local
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_TIMEOUT = 600  # seconds
+
 # IPFS
 IPFS_HOST = 'http://ipfs'  # 'ipfs'
 IPFS_PORT = 5001
+# Content addressed cache of the fetched IPFS objects, None keeps it in memory only
+IPFS_CACHE_DIR = str(ROOT_DIR('var/ipfs'))
+IPFS_CACHE_SIZE = 1000  # objects kept in memory
+IPFS_NEGATIVE_CACHE_TTL = 60  # seconds a missing hash is remembered
+IPFS_FETCH_WORKERS = 8  # concurrent requests of the bulk fetches
+IPFS_PREFETCH_TIMEOUT = 2  # seconds the ingestion waits for event descriptions, the rest is deferred
+# Store centralized oracles with a pending event description and fetch it on the ipfs queue
+IPFS_DEFERRED_DESCRIPTIONS = True
+# soft time limit of the IPFS tasks, only enforced by the prefork pool the ipfs worker runs with
+IPFS_TIMEOUT = 30  # seconds
+IPFS_MAX_RETRIES = 5
+IPFS_RETRY_DELAY = 10  # seconds
+IPFS_PENDING_SWEEP_AGE = 3600  # seconds before a still pending event description is queued again
+
+# Block ingestion daemon (manage.py ingest_blocks)
+INGEST_FETCH_WORKERS = 4  # blocks fetched concurrently from the node
+INGEST_QUEUE_SIZE = 32  # blocks buffered between the stages before fetching waits
+INGEST_POLL_INTERVAL = 1  # seconds between chain head checks
+INGEST_CONFIRMATIONS = 0  # blocks kept between the chain head and the last ingested block
 
 # LMSR Market Maker Address
 LMSR_MARKET_MAKER = '2f2be9db638cb31d4143cbc1525b0e104f7ed597'
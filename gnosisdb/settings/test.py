@@ -8,6 +8,25 @@ ETHEREUM_NODE_PORT = 8545
 ETHEREUM_NODE_SSL = 0
 
 IPFS_HOST = 'https://ipfs.infura.io'
+IPFS_CACHE_DIR = None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'blocks': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blocks',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+}
+
+# Run the tasks in process. on_commit callbacks never fire inside django.test.TestCase,
+# tests relying on deferred event descriptions call the tasks themselves
+CELERY_ALWAYS_EAGER = True
 
 
 if 'TRAVIS' in os.environ:
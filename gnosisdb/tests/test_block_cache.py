@@ -0,0 +1,61 @@
+from django.test import TestCase
+from relationaldb.tests.factories import (
+    CentralizedOracleFactory, UltimateOracleFactory, CategoricalEventFactory, MarketFactory, OutcomeTokenFactory
+)
+from gnosisdb.block_cache import (
+    get_block_cache, get_touched_addresses, get_dependent_addresses, publish_changes, get_last_block,
+    get_address_block, get_blocks
+)
+
+
+class TestBlockCache(TestCase):
+
+    def setUp(self):
+        get_block_cache().clear()
+
+    def tearDown(self):
+        get_block_cache().clear()
+
+    def test_touched_addresses(self):
+        decoded_event = {
+            'address': 'A' * 40,
+            'params': [
+                {'name': 'creator', 'value': 'b' * 40},
+                {'name': 'ipfsHash', 'value': 'QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG'},
+                {'name': 'amount', 'value': 10}
+            ]
+        }
+        self.assertEqual(get_touched_addresses(decoded_event), {'a' * 40, 'b' * 40})
+
+    def test_dependent_addresses(self):
+        oracle = CentralizedOracleFactory()
+        event = CategoricalEventFactory(oracle=oracle)
+        market = MarketFactory(event=event)
+        outcome_token = OutcomeTokenFactory(event=event)
+
+        self.assertEqual(get_dependent_addresses([oracle.address]), {event.address, market.address})
+        self.assertEqual(get_dependent_addresses([outcome_token.address]), {market.address})
+        self.assertEqual(get_dependent_addresses([]), set())
+
+    def test_dependent_addresses_closure(self):
+        forwarded_oracle = CentralizedOracleFactory()
+        ultimate_oracle = UltimateOracleFactory(forwarded_oracle=forwarded_oracle)
+        event = CategoricalEventFactory(oracle=ultimate_oracle)
+        market = MarketFactory(event=event)
+
+        self.assertEqual(get_dependent_addresses([forwarded_oracle.address]),
+                         {ultimate_oracle.address, event.address, market.address})
+
+    def test_publish_changes(self):
+        self.assertIsNone(get_last_block())
+        market = MarketFactory()
+        first_generation = publish_changes([market.event.address], {'number': 1, 'timestamp': 1})
+        second_generation = publish_changes(['c' * 40], {'number': 1, 'timestamp': 1})
+
+        self.assertGreater(second_generation, first_generation)
+        self.assertEqual(get_last_block(), (1, 1, second_generation))
+        # the market nests its event
+        self.assertEqual(get_address_block(market.address), (1, 1, first_generation))
+        self.assertIsNone(get_address_block('d' * 40))
+        self.assertEqual(get_blocks([market.address, 'd' * 40]),
+                         ((1, 1, second_generation), {market.address: (1, 1, first_generation), 'd' * 40: None}))
@@ -1,6 +1,10 @@
 from unittest import TestCase
 from relationaldb.tests.factories import OutcomeTokenFactory, MarketFactory, CategoricalEventFactory
-from gnosisdb.utils import calc_lmsr_marginal_price
+from gnosisdb.utils import (
+    calc_lmsr_marginal_price, calc_lmsr_marginal_prices, calc_lmsr_marginal_prices_history,
+    _calc_lmsr_marginal_price_mp, _calc_lmsr_marginal_prices_mp
+)
+from mpmath import mp
 
 
 class TestUtils(TestCase):
@@ -16,4 +20,42 @@ class TestUtils(TestCase):
         net_outcome_tokens_sold = [0, 1] # market.net_outcome_tokens_sold
         result = calc_lmsr_marginal_price(10**18, 1, net_outcome_tokens_sold, market.funding)
         self.assertIsNotNone(result)
-        self.assertTrue(result > 0)
\ No newline at end of file
+        self.assertTrue(result > 0)
+
+    def test_calc_lmsr_marginal_price_matches_mpmath(self):
+        dps = mp.dps
+        for token_count, token_index, net_outcome_tokens_sold, funding in [
+            (10**18, 1, [0, 1], 10**18),
+            (10**18, 0, [3 * 10**18, -10**18, 0], 2 * 10**18),
+            (-10**17, 0, [3 * 10**18, -10**18, 0], 2 * 10**18)
+        ]:
+            result = calc_lmsr_marginal_price(token_count, token_index, net_outcome_tokens_sold, funding)
+            expected = _calc_lmsr_marginal_price_mp(token_count, token_index, net_outcome_tokens_sold, funding)
+            self.assertAlmostEqual(result / expected, 1, places=12)
+        # global precision is left untouched
+        self.assertEqual(dps, mp.dps)
+
+    def test_calc_lmsr_marginal_prices(self):
+        self.assertEqual([0.5, 0.5], calc_lmsr_marginal_prices([0, 0], 10**18))
+
+        net_outcome_tokens_sold = [5 * 10**18, -2 * 10**18, 10**17]
+        prices = calc_lmsr_marginal_prices(net_outcome_tokens_sold, 10**18)
+        expected = _calc_lmsr_marginal_prices_mp(net_outcome_tokens_sold, 10**18)
+        self.assertAlmostEqual(1, sum(prices), places=12)
+        for price, expected_price in zip(prices, expected):
+            self.assertAlmostEqual(price, expected_price, places=12)
+
+        # ill-conditioned states fall back to mpmath
+        self.assertEqual([0.0, 1.0], calc_lmsr_marginal_prices([0, 10**400], 10**18))
+        self.assertEqual([1.0, 0.0], calc_lmsr_marginal_prices([10**30, 0], 10**18))
+
+        with self.assertRaises(ValueError):
+            calc_lmsr_marginal_prices([0], 10**18)
+
+    def test_calc_lmsr_marginal_prices_history(self):
+        history = [[0, 0], [10**18, 0], [10**18, 2 * 10**18], [10**30, 0]]
+        prices_history = calc_lmsr_marginal_prices_history(history, 10**18)
+        self.assertEqual(len(history), len(prices_history))
+        for net_outcome_tokens_sold, prices in zip(history, prices_history):
+            self.assertEqual(calc_lmsr_marginal_prices(net_outcome_tokens_sold, 10**18), prices)
+        self.assertEqual([], calc_lmsr_marginal_prices_history([], 10**18))
@@ -1,4 +1,5 @@
 from mpmath import mp, mpf
+import numpy as np
 
 
 def singleton(clazz):
@@ -43,13 +44,118 @@ def add_0x_prefix(value):
     return '0x' + value if value[:2] not in (b'0x', '0x') else value
 
 
-def calc_lmsr_marginal_price(token_count, token_index, net_outcome_tokens_sold, funding):
-    mp.dps = 100
-    mp.pretty=True
-    b = mpf(funding) / mp.log(len(net_outcome_tokens_sold))
-    result = b * mp.log(
-            sum(mp.exp(share_count / b + token_count / b) for share_count in net_outcome_tokens_sold) -
-            sum(mp.exp(share_count / b) for index, share_count in enumerate(net_outcome_tokens_sold) if index != token_index)
-        ) - net_outcome_tokens_sold[token_index]
+# Exponents beyond this bound lose too many digits in float64, prices are computed with mpmath
+LMSR_MAX_FLOAT_EXPONENT = 1e6
+LMSR_MP_PRECISION = 100
+
+
+def _lmsr_liquidity(funding, outcome_count):
+    """Returns the LMSR liquidity parameter b as a float, None if it is not representable"""
+    try:
+        b = float(funding) / np.log(outcome_count)
+    except (OverflowError, ZeroDivisionError):
+        return None
+    return b if np.isfinite(b) and b > 0 else None
+
 
+def _calc_lmsr_marginal_prices_mp(net_outcome_tokens_sold, funding):
+    """Marginal prices of one market state computed with mpmath, for the ill-conditioned inputs"""
+    with mp.workdps(LMSR_MP_PRECISION):
+        b = mpf(funding) / mp.log(len(net_outcome_tokens_sold))
+        exponents = [mpf(share_count) / b for share_count in net_outcome_tokens_sold]
+        max_exponent = max(exponents)
+        exps = [mp.exp(exponent - max_exponent) for exponent in exponents]
+        total = mp.fsum(exps)
+        return [float(exp / total) for exp in exps]
+
+
+def calc_lmsr_marginal_prices_history(net_outcome_tokens_sold_history, funding):
+    """
+    Returns the marginal price of every outcome for each state of a market, in one vectorized pass.
+    Prices are the softmax of net_outcome_tokens_sold / b computed with log-sum-exp in float64,
+    states which are ill-conditioned in float64 are computed with mpmath
+    :param net_outcome_tokens_sold_history: list of net_outcome_tokens_sold lists of the same length
+    :param funding: market funding
+    :return: list of marginal price lists
+    """
+    if not len(net_outcome_tokens_sold_history):
+        return []
+
+    outcome_count = len(net_outcome_tokens_sold_history[0])
+    if outcome_count < 2:
+        raise ValueError('A market needs at least two outcomes')
+
+    b = _lmsr_liquidity(funding, outcome_count)
+    try:
+        shares = np.array(net_outcome_tokens_sold_history, dtype=np.float64)
+    except OverflowError:
+        shares = None
+
+    if b is None or shares is None:
+        return [_calc_lmsr_marginal_prices_mp(net_outcome_tokens_sold, funding)
+                for net_outcome_tokens_sold in net_outcome_tokens_sold_history]
+
+    exponents = shares / b
+    max_exponents = exponents.max(axis=1, keepdims=True)
+    exps = np.exp(exponents - max_exponents)
+    prices = exps / exps.sum(axis=1, keepdims=True)
+
+    ill_conditioned = ~np.isfinite(prices).all(axis=1) | (np.abs(exponents).max(axis=1) > LMSR_MAX_FLOAT_EXPONENT)
+    result = prices.tolist()
+    for index in np.flatnonzero(ill_conditioned):
+        result[index] = _calc_lmsr_marginal_prices_mp(net_outcome_tokens_sold_history[index], funding)
     return result
+
+
+def calc_lmsr_marginal_prices(net_outcome_tokens_sold, funding):
+    """
+    Returns the marginal price of every outcome of a market
+    :param net_outcome_tokens_sold: list of the net outcome tokens sold per outcome
+    :param funding: market funding
+    :return: list of marginal prices, summing up to 1
+    """
+    return calc_lmsr_marginal_prices_history([net_outcome_tokens_sold], funding)[0]
+
+
+def calc_market_marginal_prices(market):
+    """
+    Returns the marginal price of every outcome of the market in its current state
+    :return: list of prices, None for markets which are not funded yet
+    """
+    if not market.funding or len(market.net_outcome_tokens_sold) < 2:
+        return None
+    return calc_lmsr_marginal_prices(market.net_outcome_tokens_sold, market.funding)
+
+
+def _calc_lmsr_marginal_price_mp(token_count, token_index, net_outcome_tokens_sold, funding):
+    with mp.workdps(LMSR_MP_PRECISION):
+        b = mpf(funding) / mp.log(len(net_outcome_tokens_sold))
+        result = b * mp.log(
+                sum(mp.exp(share_count / b + token_count / b) for share_count in net_outcome_tokens_sold) -
+                sum(mp.exp(share_count / b) for index, share_count in enumerate(net_outcome_tokens_sold) if index != token_index)
+            ) - net_outcome_tokens_sold[token_index]
+        return float(result)
+
+
+def calc_lmsr_marginal_price(token_count, token_index, net_outcome_tokens_sold, funding):
+    """
+    Returns b * log(sum_j exp((q_j + token_count) / b) - sum_j!=i exp(q_j / b)) - q_i for outcome i = token_index,
+    computed as b * (m - x_i + log(S * expm1(token_count / b) + exp(x_i - m))) with x = q / b, m = max(x)
+    and S = sum_j exp(x_j - m), so no exponential overflows
+    """
+    b = _lmsr_liquidity(funding, len(net_outcome_tokens_sold))
+    try:
+        exponents = np.array(net_outcome_tokens_sold, dtype=np.float64) / b if b else None
+        token_exponent = float(token_count) / b if b else None
+    except OverflowError:
+        exponents = None
+
+    if exponents is not None and np.abs(exponents).max() <= LMSR_MAX_FLOAT_EXPONENT:
+        max_exponent = exponents.max()
+        with np.errstate(over='ignore', invalid='ignore'):
+            argument = (np.exp(exponents - max_exponent).sum() * np.expm1(token_exponent) +
+                        np.exp(exponents[token_index] - max_exponent))
+            if np.isfinite(argument) and argument > 0:
+                return float(b * (max_exponent - exponents[token_index] + np.log(argument)))
+
+    return _calc_lmsr_marginal_price_mp(token_count, token_index, net_outcome_tokens_sold, funding)
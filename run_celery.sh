@@ -19,6 +19,8 @@ cd $PWD/gnosisdb
 
 echo "==> run worker <=="
 celery -A gnosisdb.apps worker -Q default -n default@%h --loglevel debug --workdir="$PWD" -c 1 &
+echo "==> run ipfs worker <=="
+celery -A gnosisdb.apps worker -Q ipfs -n ipfs@%h --loglevel debug --workdir="$PWD" -P prefork -c 4 &
 sleep 10
 echo "==> run beat <=="
 celery -A gnosisdb.apps beat -S djcelery.schedulers.DatabaseScheduler --loglevel debug --workdir="$PWD" --pidfile="$HOME/var/run/celery/celerybeat.pid"
@@ -1,5 +1,6 @@
 echo "==> Migrating Django models ... "
 python gnosisdb/manage.py migrate --noinput
+python gnosisdb/manage.py createcachetable
 echo "==> Collecting statics ... "
 python gnosisdb/manage.py collectstatic
 echo "==> Running Gunicorn ... "